@@ -1,4 +1,11 @@
-from meupdf.app import main
+import sys
 
 if __name__ == "__main__":
+    from meupdf.cli import COMMANDS
+    if sys.argv[1:2] and sys.argv[1] in COMMANDS + ('-h', '--help'):
+        # Headless batch mode: the GUI stack is never imported
+        from meupdf.cli import main as cli_main
+        sys.exit(cli_main())
+
+    from meupdf.app import main
     main().main_loop()
@@ -1,13 +1,44 @@
 """
 Free Open Source PDF viewer and editor
 """
-import threading, sys, socket, zipfile, os
+import threading, sys, os, time
+from http.server import ThreadingHTTPServer
 from pathlib import Path
 
+from meupdf.metrics import metrics
+
+class StartupTimer(object):
+    """Prints how long each startup phase took when MEUPDF_STARTUP_TIMING is set."""
+    enabled:bool = bool(os.environ.get('MEUPDF_STARTUP_TIMING'))
+
+    def __init__(self):
+        self.start = self.last = time.perf_counter()
+        self.phases:list[tuple[str, float]] = []
+
+    def mark(self, phase:str):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        metrics.record(f'app.startup.{phase.replace(" ", "_")}', self.last, now - self.last)
+        self.last = now
+
+    def report(self):
+        if not self.enabled:
+            return
+        lines = [f'  {phase:<24}{seconds * 1000:>9.1f} ms' for phase, seconds in self.phases]
+        lines.append(f'  {"total":<24}{(self.last - self.start) * 1000:>9.1f} ms')
+        print('Startup timing:', *lines, sep='\n', file=sys.__stderr__ or sys.stderr)
+
+startup_timer = StartupTimer()
+
 import toga
 
-from meupdf.interface.viewserver import start_httpd
+from meupdf.interface.viewserver import ViewServer, create_httpd, needs_local_copy
 from meupdf.interface.main_content import MainWindow
+from meupdf.interface.thumbnails import thumbnail_cache, thumbnail_renderer
+from meupdf.documents.mapping import file_mappings
+from meupdf.documents.search import SearchIndex, search_indexer
+
+startup_timer.mark('imports')
 
 # toga.Widget.DEBUG_LAYOUT_ENABLED = True
 
@@ -16,55 +47,76 @@ class MeuPDF(toga.App):
     server_dir:Path
     files_uri:Path = Path('files')
     host:str = 'localhost'
-    port:int = 8000
+    port:int = 60000 # Preferred port, so that the web view cache is kept across sessions
+    httpd:ThreadingHTTPServer|None = None
     server_thread:threading.Thread
     binded_to_port:bool = False
 
-    def find_port(self, bottom=60000, top=61000):
-        for port in range(bottom, top):
+    def bind_server(self):
+        """
+        Creates the view server, bound to the preferred port or, if it is not available, to any
+        free port. Requests are queued by the bound socket until the server thread serves them.
+        """
+        for port in (self.port, 0):
             try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                    s.bind((self.host, port))
-                    self.port = port
-                    self.__class__.port = port
-                    print(f'Binded to port {port}')
-                    return port
+                self.httpd = create_httpd(self.server_dir, self.host, port)
+                break
             except OSError:
                 pass
-        raise OSError(f'No available port from {bottom} to {top-1}')
-    
+        else:
+            self.binded_to_port = False
+            return
+        self.port = self.__class__.port = ViewServer.port = self.httpd.server_address[1]
+        ViewServer.host = self.host
+        self.binded_to_port = True
+        print(f'Binded to port {self.port}')
+
     def start_server(self):
-        start_httpd(self.server_dir, self.host, self.port)
+        if self.httpd is not None:
+            self.httpd.serve_forever()
 
     def startup(self):
         # Prepare for non-console running
         try:
             sys.stderr.write('Welcome to Meu PDF!')
         except AttributeError:
-            import os
             sink = open(os.devnull, 'w')
             sys.stderr = sink
             sys.stdout = sink
 
-        # Start view server
+        # Bind view server
         self.server_dir = self.paths.cache / 'viewserver'
         print(f'Server dir at {self.server_dir}')
         (self.server_dir / self.files_uri).mkdir(parents=True, exist_ok=True)
-        server_files = zipfile.ZipFile(self.paths.app / 'resources/viewserver/pdfjs-5.4.149-dist.zip')
-        server_files.extractall(self.server_dir)
-        try:
-            self.port = self.find_port()
-            self.binded_to_port = True
-        except OSError:
-            self.binded_to_port = False
-        self.server_thread = threading.Thread(target=self.start_server)
-        self.server_thread.start()
+        ViewServer.set_assets(self.paths.app / 'resources/viewserver/pdfjs-5.4.149-dist.zip')
+        # Documents and the view server share read-only mappings of the files. Not on Windows, where
+        # mapped files cannot be replaced, nor for media that may disappear while mapped
+        if os.name == 'posix':
+            file_mappings.enabled = True
+            file_mappings.excluded = needs_local_copy
+        self.bind_server()
+        startup_timer.mark('server binding')
+
+        # Thumbnails are kept across sessions
+        thumbnail_cache.directory = self.paths.cache / 'thumbnails'
+
+        # Opened documents are indexed for search in the background
+        search_indexer.index = SearchIndex(self.paths.data / 'search.sqlite')
 
         # Interface contents
         self.main_window = MainWindow(self, title=self.formal_name) # pyright: ignore[reportIncompatibleMethodOverride]
         self.main_window.show()
+        startup_timer.mark('main window')
+
+        # Start view server
+        self.server_thread = threading.Thread(target=self.start_server, daemon=True)
+        self.server_thread.start()
+        startup_timer.mark('server thread')
 
     def on_running(self, **kwargs):
+        startup_timer.mark('event loop')
+        startup_timer.report()
+
         class FakeResult(object):
             def __init__(self, arg):
                 self.arg = arg
@@ -80,7 +132,12 @@ class MeuPDF(toga.App):
                 print(f'Given file path: {arg}')
 
     def on_exit(self, **kwargs):
-        # Delete server cache
+        thumbnail_renderer.shutdown()
+        search_indexer.shutdown()
+        if search_indexer.index is not None:
+            search_indexer.index.close()
+
+        # Delete local copies of files on network or removable media
         files = (self.server_dir / self.files_uri).glob('**', recurse_symlinks=False)
         for f in files:
             try:
@@ -0,0 +1,204 @@
+"""Headless command line interface
+
+Runs merge, extract, split and render jobs without importing the GUI stack, so it can be used
+from cron or CI on machines without a display:
+
+    python -m meupdf merge -o merged.pdf a.pdf b.pdf c.pdf
+    python -m meupdf merge -o small.pdf --image-dpi 150 --subset-fonts --measure a.pdf b.pdf
+    python -m meupdf extract -o selected.pdf document.pdf "1-5, 8"
+    python -m meupdf split -o parts/ --every 10 document.pdf
+    python -m meupdf split -o parts/ --max-size 10MB --workers 4 document.pdf
+    python -m meupdf render -o images/ --pages "1-3" --zoom 2 document.pdf
+    python -m meupdf batch --jobs 8 jobs.txt
+
+A batch file holds one job per line, written as the arguments of the commands above. Jobs run in
+parallel across processes. Each finished job prints a JSON line with its timing, followed by a
+summary line.
+
+Written files are optimized without loss (unused and duplicate objects dropped, streams compressed)
+unless --no-optimize is given; the record of the job reports the time spent and, with --measure, the
+size saved by each stage.
+"""
+import argparse, json, os, shlex, sys, time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+COMMANDS = ('merge', 'extract', 'split', 'render', 'batch')
+
+def optimization(args):
+    """Returns the optimization options of a command."""
+    from meupdf.documents import optimize
+    if args.no_optimize:
+        return None
+    return optimize.OptimizeOptions(
+        image_dpi=args.image_dpi,
+        image_quality=args.image_quality,
+        subset_fonts=args.subset_fonts,
+        measure=args.measure,
+    )
+
+def merge(args) -> dict:
+    from meupdf.documents.merge import MergeEngine
+    engine = MergeEngine(args.inputs, optimization=optimization(args))
+    pages = engine.run(args.output)
+    return {'output': [str(args.output)], 'pages': pages, 'optimization': [engine.report.as_dict()] if engine.report else []}
+
+def extract(args) -> dict:
+    from meupdf.documents.pdf import PDFDocument
+    document = PDFDocument(args.input)
+    try:
+        new_doc = document.extract_pages(args.output, ranges=args.pages, optimization=optimization(args))
+        pages = new_doc.page_count
+        new_doc.close()
+    finally:
+        document.close()
+    report = document.optimization_report
+    return {'output': [str(args.output)], 'pages': pages, 'optimization': [report.as_dict()] if report else []}
+
+def split(args) -> dict:
+    from meupdf.documents import split
+    from meupdf.documents.pdf import PDFDocument
+    document = PDFDocument(args.input)
+    try:
+        if args.every:
+            parts = split.plan_every(document.page_count, args.every)
+        elif args.bookmarks:
+            parts = split.plan_bookmarks(document)
+        else:
+            parts = split.plan_size(document, split.parse_size(args.max_size))
+        pages = document.page_count
+    finally:
+        document.close()
+    engine = split.SplitEngine(args.input, parts, workers=args.workers, optimization=optimization(args))
+    outputs = engine.run(args.output)
+    return {'output': [str(path) for path in outputs], 'pages': pages, 'optimization': [report.as_dict() for report in engine.reports]}
+
+def render(args) -> dict:
+    from meupdf.documents import pagesets
+    from meupdf.documents.pdf import PDFDocument
+    document = PDFDocument(args.input)
+    args.output.mkdir(parents=True, exist_ok=True)
+    outputs = []
+    try:
+        ranges = pagesets.parse(args.pages, document.page_count) if args.pages else [(0, document.page_count - 1)]
+        for first, last in ranges:
+            for number in range(first, last + 1):
+                page = document.pages[number]
+                if args.max_edge:
+                    data = page.to_thumbnail(args.max_edge, output=args.format)
+                else:
+                    data = page.to_image(zoom=args.zoom).tobytes(output=args.format)
+                path = args.output / f'{document.file_path.stem}-{number + 1:04d}.{args.format}'
+                path.write_bytes(data)
+                outputs.append(str(path))
+    finally:
+        document.close()
+    return {'output': outputs, 'pages': len(outputs)}
+
+def add_optimization_arguments(command:argparse.ArgumentParser):
+    group = command.add_argument_group('optimization')
+    group.add_argument('--no-optimize', action='store_true', help='write files as they are')
+    group.add_argument('--image-dpi', type=int, help='downsample images above this resolution (lossy)')
+    group.add_argument('--image-quality', type=int, default=75, help='JPEG quality of downsampled images (default: 75)')
+    group.add_argument('--subset-fonts', action='store_true', help='keep only the glyphs in use of embedded fonts')
+    group.add_argument('--measure', action='store_true', help='report the size saved by each stage (slower)')
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='meupdf', description='Meu PDF batch processing')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('merge', help='merge PDF files in the given order')
+    command.add_argument('-o', '--output', type=Path, required=True, help='merged file')
+    command.add_argument('inputs', type=Path, nargs='+', help='files to merge')
+    add_optimization_arguments(command)
+    command.set_defaults(run=merge)
+
+    command = commands.add_parser('extract', help='extract pages into a new file')
+    command.add_argument('-o', '--output', type=Path, required=True, help='new file')
+    command.add_argument('input', type=Path, help='source file')
+    command.add_argument('pages', help='pages to extract in order, such as "1-5, 8, 10-" or "odd"')
+    add_optimization_arguments(command)
+    command.set_defaults(run=extract)
+
+    command = commands.add_parser('split', help='split a file into parts')
+    command.add_argument('-o', '--output', type=Path, required=True, help='directory of the parts')
+    plan = command.add_mutually_exclusive_group(required=True)
+    plan.add_argument('--every', type=int, help='pages per part')
+    plan.add_argument('--bookmarks', action='store_true', help='a part per top-level bookmark')
+    plan.add_argument('--max-size', help='maximum part size, such as "10MB"')
+    command.add_argument('-w', '--workers', type=int, default=1, help='parallel processes writing the parts (default: 1)')
+    command.add_argument('input', type=Path, help='file to split')
+    add_optimization_arguments(command)
+    command.set_defaults(run=split)
+
+    command = commands.add_parser('render', help='render pages as images')
+    command.add_argument('-o', '--output', type=Path, required=True, help='directory of the images')
+    command.add_argument('--pages', help='pages to render, such as "1-5, 8, 10-" or "odd" (default: all)')
+    command.add_argument('--zoom', type=float, default=1.0, help='zoom factor (default: 1)')
+    command.add_argument('--max-edge', type=int, help='render thumbnails with this longest edge instead')
+    command.add_argument('--format', default='png', choices=('png', 'jpeg', 'ppm'), help='image format')
+    command.add_argument('input', type=Path, help='source file')
+    command.set_defaults(run=render)
+
+    command = commands.add_parser('batch', help='run the jobs listed in files, one per line ("-" reads stdin)')
+    command.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help='parallel jobs (default: CPU count)')
+    command.add_argument('files', nargs='+', help='job files')
+    return parser
+
+def run_job(number:int, argv:list[str]) -> dict:
+    """Runs a job, returning its record. Errors are reported in the record."""
+    record:dict = {'job': number, 'command': None, 'argv': argv}
+    start = time.perf_counter()
+    try:
+        args = create_parser().parse_args(argv)
+        record['command'] = args.command
+        if args.command == 'batch':
+            raise ValueError('Batch jobs cannot be nested')
+        record.update(args.run(args))
+        record['status'] = 'ok'
+    except SystemExit:
+        record.update(status='error', error='invalid arguments')
+    except Exception as e:
+        record.update(status='error', error=f'{e.__class__.__name__}: {e}')
+    record['seconds'] = round(time.perf_counter() - start, 6)
+    return record
+
+def read_jobs(files:list[str]) -> list[list[str]]:
+    jobs = []
+    for name in files:
+        lines = sys.stdin.readlines() if name == '-' else Path(name).read_text(encoding='utf-8').splitlines()
+        for line in lines:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                jobs.append(shlex.split(line))
+    return jobs
+
+def main(argv:list[str]|None=None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    args = create_parser().parse_args(argv)
+    if args.command == 'batch':
+        jobs = read_jobs(args.files)
+        workers = max(1, min(args.jobs, len(jobs)))
+    else:
+        jobs, workers = [argv], 1
+
+    start = time.perf_counter()
+    failed = 0
+    if workers == 1:
+        for record in (run_job(n, job) for n, job in enumerate(jobs)):
+            failed += record['status'] != 'ok'
+            print(json.dumps(record), flush=True)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(run_job, n, job) for n, job in enumerate(jobs)]
+            for future in as_completed(futures):
+                record = future.result()
+                failed += record['status'] != 'ok'
+                print(json.dumps(record), flush=True)
+    print(json.dumps({
+        'jobs': len(jobs),
+        'failed': failed,
+        'workers': workers,
+        'seconds': round(time.perf_counter() - start, 6),
+    }), flush=True)
+    return 1 if failed else 0
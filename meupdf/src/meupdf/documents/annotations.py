@@ -0,0 +1,133 @@
+"""Annotation changes exported by pdf.js
+
+The viewer exports its annotation storage (``annotationStorage.serializable``) as a JSON object
+whose keys are either form field references ("12R") or editor ids ("pdfjs_internal_editor_3").
+Form values are written to the existing widgets; highlight, ink and free text editors become new
+annotations; editors marked as deleted remove existing annotations. Coordinates are in PDF user
+space (origin at the bottom left of the unrotated page), colors are 0-255 RGB lists.
+
+Anything else (stamps, edits of existing annotations...) raises UnsupportedChanges, so the caller
+can fall back to saving the whole document.
+"""
+import re, sys
+
+try:
+    import pymupdf
+except ImportError:
+    pass # Annotation changes are not available without pymupdf
+
+from meupdf.documents.generic import UnsupportedChanges
+
+FREETEXT, HIGHLIGHT, INK = 3, 9, 15 # pdf.js AnnotationEditorType values
+FORM_KEY = re.compile(r'(\d+)R')
+
+FORM, EDITOR, DELETION, REMOVAL = 'form', 'editor', 'deletion', 'removal'
+
+def classify(key:str, value:dict|None) -> str:
+    """
+    Returns the kind of a storage entry: FORM, EDITOR, DELETION or REMOVAL (an editor removed
+    from the storage since it was last saved, exported as None).
+
+    Raises UnsupportedChanges for entries that cannot be applied.
+    """
+    if value is None:
+        return REMOVAL
+    if not isinstance(value, dict):
+        raise UnsupportedChanges(f'Unexpected value for "{key}"')
+    if FORM_KEY.fullmatch(key):
+        if 'value' not in value:
+            raise UnsupportedChanges(f'Unsupported change of form field {key}')
+        return FORM
+    if value.get('deleted'):
+        if not FORM_KEY.fullmatch(str(value.get('id'))) or 'pageIndex' not in value:
+            raise UnsupportedChanges(f'Cannot delete annotation "{value.get('id')}"')
+        return DELETION
+    if value.get('id'):
+        raise UnsupportedChanges(f'Changes of existing annotation {value['id']} not supported')
+    kind = value.get('annotationType')
+    if kind == HIGHLIGHT and value.get('quadPoints'):
+        return EDITOR
+    if kind == INK and value.get('paths'):
+        return EDITOR
+    if kind == FREETEXT and 'rect' in value and value.get('value'):
+        return EDITOR
+    raise UnsupportedChanges(f'Unsupported annotation type {kind}')
+
+def _color(value:dict) -> tuple[float, ...]|None:
+    color = value.get('color')
+    return tuple(c / 255 for c in color) if color else None
+
+def _points(page, coordinates:list[float]) -> list:
+    """Converts flat PDF user space coordinates into pymupdf points."""
+    matrix = page.transformation_matrix
+    return [pymupdf.Point(x, y) * matrix for x, y in zip(coordinates[::2], coordinates[1::2])] # pyright: ignore[reportPossiblyUnboundVariable]
+
+def add_editor(page, value:dict) -> int:
+    """
+    Adds the annotation described by a pdf.js editor to a pymupdf page.
+
+    :return: xref of the new annotation
+    :rtype: int
+    """
+    kind = value['annotationType']
+    if kind == HIGHLIGHT:
+        points = _points(page, value['quadPoints'])
+        quads = [pymupdf.Quad(*points[n:n + 4]) for n in range(0, len(points) - 3, 4)] # pyright: ignore[reportPossiblyUnboundVariable]
+        annot = page.add_highlight_annot(quads=quads)
+    elif kind == INK:
+        paths = value['paths']
+        if isinstance(paths, dict): # pdf.js >= 5: {'lines': [...], 'points': [...]}
+            paths = paths['points']
+        else: # Older versions: [{'bezier': [...], 'points': [...]}, ...]
+            paths = [path['points'] for path in paths]
+        annot = page.add_ink_annot([[tuple(p) for p in _points(page, path)] for path in paths])
+        annot.set_border(width=value.get('thickness', 1))
+    else:
+        corners = _points(page, value['rect'])
+        annot = page.add_freetext_annot(
+            pymupdf.Rect(corners[0], corners[1]).normalize(), # pyright: ignore[reportPossiblyUnboundVariable]
+            value['value'],
+            fontsize=value.get('fontSize', 10),
+            text_color=_color(value) or (0, 0, 0),
+            rotate=value.get('rotation', 0),
+        )
+    if kind != FREETEXT:
+        if _color(value):
+            annot.set_colors(stroke=_color(value))
+        if 'opacity' in value:
+            annot.set_opacity(value['opacity'])
+    annot.update()
+    return annot.xref
+
+def set_form_value(document, xref:int, value):
+    """Writes a pdf.js form value to the widget with the given xref."""
+    widget = None
+    for page in _widget_pages(document, xref):
+        widget = page.load_widget(xref)
+        if widget is not None:
+            break
+    if widget is None:
+        raise UnsupportedChanges(f'Form field {xref}R not found')
+    if widget.field_type in (pymupdf.PDF_WIDGET_TYPE_CHECKBOX, pymupdf.PDF_WIDGET_TYPE_RADIOBUTTON): # pyright: ignore[reportPossiblyUnboundVariable]
+        widget.field_value = bool(value) and value != 'Off'
+    elif widget.field_type in (pymupdf.PDF_WIDGET_TYPE_COMBOBOX, pymupdf.PDF_WIDGET_TYPE_LISTBOX): # pyright: ignore[reportPossiblyUnboundVariable]
+        widget.field_value = value[0] if isinstance(value, list) and len(value) == 1 else value
+    elif widget.field_type == pymupdf.PDF_WIDGET_TYPE_TEXT: # pyright: ignore[reportPossiblyUnboundVariable]
+        widget.field_value = str(value)
+    else:
+        raise UnsupportedChanges(f'Unsupported form field type: {widget.field_type_string}')
+    widget.update()
+
+def _widget_pages(document, xref:int):
+    """Yields the page that holds the widget (from its /P entry) or, if unknown, every page."""
+    kind, reference = document.xref_get_key(xref, 'P')
+    if kind == 'xref':
+        page_xref = int(reference.split()[0])
+        for number in range(document.page_count):
+            if document.page_xref(number) == page_xref:
+                yield document[number]
+                return
+    for page in document:
+        if xref in (w.xref for w in page.widgets()):
+            yield page
+            return
@@ -1,6 +1,11 @@
+import hashlib, os
+from collections.abc import Sequence
 from enum import StrEnum
 from pathlib import Path
 
+FINGERPRINT_SAMPLES = 16 # Blocks read across the file, besides its beginning and end
+FINGERPRINT_BLOCK = 64 * 1024
+
 # class DocumentFormats(StrEnum):
 #     PDF = 'PDF'
 
@@ -21,24 +26,87 @@ class DocumentFormats(object):
 
 document_formats = DocumentFormats()
 
+class UnsupportedChanges(ValueError):
+    """Changes that cannot be applied incrementally: the whole document must be saved instead."""
+
+def file_fingerprint(file_path:Path|str, identifier:bytes=b'') -> str:
+    """
+    Returns a fingerprint of a file built from its size, modification time, an identifier stored
+    in it (such as the PDF ID array) and a hash of blocks sampled across its contents, so that it
+    costs a few reads however large the file is.
+
+    :param file_path: file path
+    :type file_path: Path | str
+    :param identifier: identifier stored in the file, if any
+    :type identifier: bytes
+    :return: hexadecimal fingerprint
+    :rtype: str
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        digest.update(f'{stat.st_size}:{stat.st_mtime_ns}:'.encode())
+        digest.update(identifier)
+        if stat.st_size <= FINGERPRINT_BLOCK * (FINGERPRINT_SAMPLES + 2):
+            digest.update(f.read())
+        else:
+            step = (stat.st_size - FINGERPRINT_BLOCK) // (FINGERPRINT_SAMPLES + 1)
+            for n in range(FINGERPRINT_SAMPLES + 2):
+                f.seek(n * step)
+                digest.update(f.read(FINGERPRINT_BLOCK))
+    return digest.hexdigest()
+
 class GenericDocument(object):
     format:DocumentFormats
     format_info:dict
     file_path:Path
-    pages:list
+    pages:'PageSequence'
     page_count:int
 
     def __init__(self, format, *args, **kwargs):
         self.format = format
         self.format_info = document_formats[format]
-        # if 'file_path' in kwargs:
-        #     self.hashed_path = str(hash(str(kwargs['file_path'])))
+        self._fingerprint:tuple[tuple[int, int], str]|None = None # File stat, fingerprint
+        self._file_state:tuple[int, int]|None = None # File stat when it was last read or written
+
+    def fingerprint(self) -> str:
+        """
+        Returns a fingerprint of the document file that is stable across sessions and changes
+        whenever the file does. It is computed again only if the file size or modification time
+        changed since the last call.
 
-    def hashed_path(self, suffix='') -> str:
+        Raises ValueError if the document has not been read from the file system.
+        """
         try:
-            return str(hash(str(self.file_path))) + suffix
-        except NameError:
+            stat = os.stat(self.file_path)
+        except AttributeError:
             raise ValueError(f'This {self.format_info[FormatInfos.FULL_NAME]} instance doesn\'t have a "file_path" value')
+        key = stat.st_size, stat.st_mtime_ns
+        if self._fingerprint is None or self._fingerprint[0] != key:
+            self._fingerprint = key, file_fingerprint(self.file_path, self._identifier())
+        return self._fingerprint[1]
+
+    def _identifier(self) -> bytes:
+        """Returns an identifier stored in the document by the format, if there is one."""
+        return b''
+
+    def _remember_file_state(self):
+        """Records the file state after the document read or wrote it."""
+        try:
+            stat = os.stat(self.file_path)
+            self._file_state = stat.st_size, stat.st_mtime_ns
+        except (AttributeError, OSError):
+            self._file_state = None
+
+    def is_stale(self) -> bool:
+        """Returns whether the file changed on disk since the document read or wrote it."""
+        if self._file_state is None:
+            return False
+        try:
+            stat = os.stat(self.file_path)
+        except OSError:
+            return False # Moved or deleted: the open document is all that is left
+        return (stat.st_size, stat.st_mtime_ns) != self._file_state
 
     def close(self):
         pass # Fail silently, since it must be closed anyway when the object is destroyed
@@ -46,10 +114,17 @@ class GenericDocument(object):
     def merge(self, other):
         raise NotImplementedError(f'Merging not implemented for {self.format} documents.')
 
+    def apply_changes(self, changes:dict) -> int:
+        raise UnsupportedChanges(f'Incremental changes not implemented for {self.format} documents.')
+
+    def reload(self):
+        raise NotImplementedError(f'Reloading not implemented for {self.format} documents.')
+
 class GenericPage(object):
+    # Pages only hold size data: the backend page is loaded again whenever it is needed
+    __slots__ = ('_document', 'number', 'width', 'height')
     _document:GenericDocument
-    _page = None
-    number:int = 0
+    number:int
     width:float
     height:float
 
@@ -59,6 +134,35 @@ class GenericPage(object):
     def to_image(self, zoom:int=1, rotation:int=0):
         raise NotImplementedError(f'Conversion to image not implemented for pages of {self._document.format} documents.')
 
+    def to_thumbnail(self, max_edge:int, rotation:int=0) -> bytes:
+        raise NotImplementedError(f'Thumbnails not implemented for pages of {self._document.format} documents.')
+
+class PageSequence(Sequence):
+    """
+    Lazy sequence of document pages. Page objects are created when indexed and are not kept by
+    the sequence, so a document with thousands of pages can be opened without loading them.
+    """
+    __slots__ = ('_document', '_page_class')
+
+    def __init__(self, document:GenericDocument, page_class:type[GenericPage]):
+        self._document, self._page_class = document, page_class
+
+    def __len__(self) -> int:
+        return self._document.page_count
+
+    def __getitem__(self, index): # pyright: ignore[reportIncompatibleMethodOverride]
+        if isinstance(index, slice):
+            return [self._page_class(self._document, n) for n in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f'Page {index} out of range (document has {len(self)} pages)')
+        return self._page_class(self._document, index)
+
+    def __iter__(self):
+        for n in range(len(self)):
+            yield self._page_class(self._document, n)
+
 def get_document_class(file_path:Path|str):
     formats:dict = DocumentFormats()
     file_path = Path(file_path) # ensures it's really a Path object
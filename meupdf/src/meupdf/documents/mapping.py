@@ -0,0 +1,115 @@
+"""Shared read-only memory mappings of document files
+
+A document opened with mmap reads its file through a read-only mapping instead of its own file
+reads, and the view server sends byte ranges of the same mapping to pdf.js: the OS page cache holds
+the only copy of the file, however many times it is read.
+
+Mappings are shared by path and reference counted. A file replaced on disk (Meu PDF always writes
+to a temporary file and renames it) keeps its former mapping valid until released, while new
+acquirers map the new file. Files must not be truncated in place while mapped.
+"""
+import mmap, os, threading
+from collections.abc import Callable, Iterator
+from pathlib import Path
+
+class FileMapping(object):
+    path:Path
+    size:int
+    mtime_ns:int
+
+    def __init__(self, path:Path):
+        self.path = path
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self.size, self.mtime_ns = stat.st_size, stat.st_mtime_ns
+            # Empty files cannot be mapped
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        self._views:list[memoryview] = []
+
+    def view(self) -> memoryview:
+        """Returns a read-only view of the whole file. It is released with the mapping."""
+        view = memoryview(self._mmap if self._mmap is not None else b'')
+        self._views.append(view)
+        return view
+
+    def chunks(self, offset:int=0, count:int|None=None, chunk_size:int=1024 * 1024) -> Iterator[memoryview]:
+        """
+        Yields views of count bytes from offset (up to the end if count is None), at most chunk_size
+        bytes each. Each view is released when the next one is requested, so the generator must be
+        exhausted or closed before the mapping is.
+        """
+        if self._mmap is None:
+            return
+        end = self.size if count is None else min(self.size, offset + count)
+        with memoryview(self._mmap) as view:
+            for start in range(offset, end, chunk_size):
+                with view[start:min(end, start + chunk_size)] as chunk:
+                    yield chunk
+
+    def matches(self, stat:os.stat_result) -> bool:
+        """Returns whether the mapping still reflects the file."""
+        return (stat.st_size, stat.st_mtime_ns) == (self.size, self.mtime_ns)
+
+    def close(self):
+        for view in self._views:
+            view.release()
+        self._views.clear()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+class MappingRegistry(object):
+    enabled:bool = False # Whether documents are opened through mappings by default
+    excluded:Callable[[Path], bool]|None = None # Tells whether a file must not be mapped, such as on network shares
+
+    def __init__(self):
+        self._current:dict[Path, FileMapping] = {} # Mapping of the file as it is now
+        self._references:dict[int, int] = {} # id(mapping): references
+        self._lock = threading.Lock()
+
+    def acquire(self, file_path:Path|str) -> FileMapping:
+        """
+        Returns a mapping of the current file, mapping it if needed. Must be matched by release().
+        Raises OSError if the file cannot be mapped and ValueError if it is excluded.
+        """
+        path = Path(file_path).resolve()
+        if self.excluded is not None and self.excluded(path):
+            raise ValueError(f'{path} must not be mapped')
+        stat = os.stat(path)
+        with self._lock:
+            mapping = self._current.get(path)
+            if mapping is None or not mapping.matches(stat):
+                mapping = self._current[path] = FileMapping(path)
+                self._references[id(mapping)] = 0
+            self._references[id(mapping)] += 1
+            return mapping
+
+    def share(self, file_path:Path|str) -> FileMapping|None:
+        """Acquires the mapping of a file if it is already mapped and still current, else returns None."""
+        path = Path(file_path).resolve()
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        with self._lock:
+            mapping = self._current.get(path)
+            if mapping is None or not mapping.matches(stat):
+                return None
+            self._references[id(mapping)] += 1
+            return mapping
+
+    def release(self, mapping:FileMapping):
+        with self._lock:
+            self._references[id(mapping)] -= 1
+            if self._references[id(mapping)] > 0:
+                return
+            del self._references[id(mapping)]
+            if self._current.get(mapping.path) is mapping:
+                del self._current[mapping.path]
+        mapping.close()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._references)
+
+file_mappings = MappingRegistry()
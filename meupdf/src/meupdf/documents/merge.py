@@ -0,0 +1,172 @@
+"""Streaming merge of many PDF files
+
+Input files are opened one at a time and closed as soon as their pages are copied. The output is
+flushed to disk every few inputs with incremental saves and reopened, so memory and file handles
+stay bounded however many files are merged. The outline is built once, at the end, and the output
+goes through the optimization pipeline (see meupdf.documents.optimize) as it is finally written.
+
+pymupdf is not thread-safe: applications that keep using it meanwhile, such as the GUI, merge in a
+spawned process with run_in_process().
+"""
+import multiprocessing, os, pickle, queue, sys
+from collections.abc import Callable, Sequence
+from pathlib import Path
+
+try:
+    import pymupdf
+except ImportError:
+    pass # Merging is not available without pymupdf
+
+from meupdf.documents import optimize
+from meupdf.documents.pdf import PDFDocument
+from meupdf.metrics import metrics
+
+class MergeEngine(object):
+    """
+    Merges PDF files. At most one input is open at any time, however many files are merged:
+    batch_size only sets how many inputs are copied between flushes of the output to disk.
+    """
+    paths:list[Path]
+    batch_size:int
+    progress:Callable[[int, int], None]|None
+    optimization:optimize.OptimizeOptions|None
+    report:optimize.OptimizeReport|None = None
+
+    def __init__(self, paths:Sequence[Path|str], batch_size:int=32, progress:Callable[[int, int], None]|None=None,
+                 optimization:optimize.OptimizeOptions|None=optimize.LOSSLESS):
+        """
+        Inits a merge engine.
+
+        :param paths: files to merge, in order
+        :type paths: Sequence[Path | str]
+        :param batch_size: number of inputs copied before the output is flushed to disk
+        :type batch_size: int
+        :param progress: function called with (merged inputs, total inputs) after each input
+        :type progress: Callable[[int, int], None] | None
+        :param optimization: optimization of the merged file. Its report is kept in report.
+        :type optimization: OptimizeOptions | None
+        """
+        if not paths:
+            raise ValueError('No files to merge')
+        self.paths = [Path(p) for p in paths]
+        self.batch_size = max(1, batch_size)
+        self.progress = progress
+        self.optimization = optimization
+
+    @metrics.instrument('merge.run')
+    def run(self, new_path:Path|str) -> int:
+        """
+        Merges the files into new_path. The output is written next to it and only replaces it
+        once the merge is complete.
+
+        :param new_path: destination file
+        :type new_path: Path | str
+        :return: page count of the merged document
+        :rtype: int
+        """
+        if 'pymupdf' not in sys.modules:
+            raise NotImplementedError('PDF merge not implemented without pymupdf yet')
+
+        new_path = Path(new_path)
+        temp_path = new_path.with_name(f'.{new_path.name}.{os.getpid()}.part')
+        output = pymupdf.open() # pyright: ignore[reportPossiblyUnboundVariable]
+        flushed = False
+        toc = []
+        page_count = 0
+        try:
+            for n, path in enumerate(self.paths, start=1):
+                document = PDFDocument(path)
+                try:
+                    for entry in document._document.get_toc(False):
+                        if entry[2] > 0: # Entries without a destination page are kept as they are
+                            entry[2] += page_count
+                        toc.append(entry)
+                    output.insert_pdf(document._document)
+                    page_count += document.page_count
+                finally:
+                    document.close()
+                if n % self.batch_size == 0 and n < len(self.paths):
+                    output = self._flush(output, temp_path, flushed)
+                    flushed = True
+                if self.progress:
+                    self.progress(n, len(self.paths))
+            if toc:
+                output.set_toc(toc)
+            if self.optimization is not None: # Written straight to new_path, which it replaces when complete
+                self.report = optimize.optimize(output, new_path, self.optimization)
+                output.close()
+                temp_path.unlink(missing_ok=True)
+            else:
+                if flushed:
+                    output.saveIncr()
+                else:
+                    output.save(temp_path)
+                output.close()
+                os.replace(temp_path, new_path)
+        except BaseException:
+            if not output.is_closed:
+                output.close()
+            temp_path.unlink(missing_ok=True)
+            raise
+        return page_count
+
+    def run_in_process(self, new_path:Path|str) -> int:
+        """
+        Runs the merge in a spawned process, calling progress from this one, and keeps its
+        optimization report. Blocks until the merge is done, so it is meant for worker threads.
+
+        :param new_path: destination file
+        :type new_path: Path | str
+        :return: page count of the merged document
+        :rtype: int
+        """
+        context = multiprocessing.get_context('spawn')
+        messages = context.Queue()
+        # Spawned, since forking a process running the GUI toolkit and the view server is unsafe
+        process = context.Process(target=_merge_worker, daemon=True, args=(
+            self.paths, new_path, self.batch_size, self.optimization, messages, self.progress is not None))
+        process.start()
+        try:
+            while True:
+                try:
+                    kind, value, extra = messages.get(timeout=1)
+                except queue.Empty:
+                    if not process.is_alive():
+                        raise RuntimeError(f'Merge process exited with code {process.exitcode}')
+                    continue
+                if kind == 'progress':
+                    self.progress(value, extra) # pyright: ignore[reportOptionalCall]
+                elif kind == 'error':
+                    raise value
+                else:
+                    self.report = extra
+                    return value
+        finally:
+            process.join()
+
+    def _flush(self, output, temp_path:Path, flushed:bool):
+        """Writes pending pages to disk and reopens the output, releasing the copied objects."""
+        if flushed:
+            output.saveIncr()
+        else:
+            output.save(temp_path)
+        output.close()
+        return pymupdf.open(temp_path) # pyright: ignore[reportPossiblyUnboundVariable]
+
+def _merge_worker(paths:list[Path], new_path:Path|str, batch_size:int, optimization:optimize.OptimizeOptions|None,
+                  messages, progress:bool):
+    """Runs a merge in a spawned process, sending progress and the outcome through messages."""
+    def report(done, total):
+        messages.put(('progress', done, total))
+
+    engine = MergeEngine(paths, batch_size, report if progress else None, optimization)
+    try:
+        page_count = engine.run(new_path)
+    except Exception as e:
+        try:
+            pickle.dumps(e)
+        except Exception:
+            e = RuntimeError(str(e)) # Sent as text if it cannot be pickled
+        messages.put(('error', e, None))
+    else:
+        messages.put(('done', page_count, engine.report))
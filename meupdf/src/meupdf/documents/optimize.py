@@ -0,0 +1,166 @@
+"""Output optimization pipeline
+
+Files written by Meu PDF (saved, merged, extracted and split documents) can be optimized on the
+way out. The pipeline runs its stages in order:
+
+- images: downsamples images above a resolution and recompresses them (lossy, off by default);
+- fonts: subsets embedded fonts to the glyphs in use (off by default);
+- garbage: drops objects nothing refers to;
+- deduplicate: merges identical objects and streams;
+- deflate: compresses streams stored uncompressed.
+
+The last three happen while the file is written. Each stage is timed; with OptimizeOptions.measure
+the document is also serialized after each of them, so the report tells how much each stage saved
+(at the cost of writing the document once per stage). Without it, the last three stages are reported
+as a single "save" stage.
+"""
+import os, sys, time
+from pathlib import Path
+from typing import NamedTuple
+
+try:
+    import pymupdf
+except ImportError:
+    pass # Optimization is not available without pymupdf
+
+from meupdf.metrics import metrics
+
+class OptimizeOptions(NamedTuple):
+    garbage:bool = True
+    deduplicate:bool = True
+    deflate:bool = True
+    image_dpi:int|None = None # Images above this resolution are downsampled to it
+    image_quality:int = 75 # JPEG quality of the downsampled images
+    subset_fonts:bool = False
+    measure:bool = False # Whether the size after each stage is measured
+
+    def garbage_level(self) -> int:
+        """Returns the pymupdf garbage collection level of the options."""
+        if self.deduplicate:
+            return 4 # Also compares stream contents
+        return 1 if self.garbage else 0
+
+LOSSLESS = OptimizeOptions()
+PLAIN = OptimizeOptions(garbage=False, deduplicate=False, deflate=False) # Writes the document as it is
+
+class StageReport(NamedTuple):
+    stage:str
+    seconds:float
+    size:int|None # Bytes after the stage, if measured
+
+class OptimizeReport(object):
+    input_size:int|None
+    output_size:int|None
+    stages:list[StageReport]
+
+    def __init__(self, input_size:int|None=None):
+        self.input_size = input_size
+        self.output_size = None
+        self.stages = []
+
+    @property
+    def saved(self) -> int|None:
+        """Bytes saved by the whole pipeline, if the input size is known."""
+        if self.input_size is None or self.output_size is None:
+            return None
+        return self.input_size - self.output_size
+
+    @property
+    def seconds(self) -> float:
+        return sum(stage.seconds for stage in self.stages)
+
+    def as_dict(self) -> dict:
+        """Returns the report as a JSON serializable dictionary."""
+        sizes = [self.input_size] + [stage.size for stage in self.stages]
+        return {
+            'input_size': self.input_size,
+            'output_size': self.output_size,
+            'saved': self.saved,
+            'stages': [
+                {
+                    'stage': stage.stage,
+                    'seconds': round(stage.seconds, 6),
+                    'size': stage.size,
+                    'saved': None if stage.size is None or before is None else before - stage.size,
+                } for stage, before in zip(self.stages, sizes)
+            ],
+        }
+
+    def __repr__(self):
+        return f'OptimizeReport({self.as_dict()})'
+
+@metrics.instrument('optimize')
+def optimize(doc, path:Path|str, options:OptimizeOptions=LOSSLESS, input_size:int|None=None) -> OptimizeReport:
+    """
+    Runs the pipeline on a pymupdf document and writes it to path. The document is modified by the
+    image and font stages. The file is written next to path and only replaces it once complete, so
+    path may be the file the document was opened from.
+
+    :param doc: document to optimize
+    :type doc: pymupdf.Document
+    :param path: destination file
+    :type path: Path | str
+    :param options: stages to run
+    :type options: OptimizeOptions
+    :param input_size: size of the unoptimized document. If unknown, measured when options.measure is set.
+    :type input_size: int | None
+    :return: time spent and, if known, size saved by each stage
+    :rtype: OptimizeReport
+    """
+    if 'pymupdf' not in sys.modules:
+        raise NotImplementedError('PDF optimization not implemented without pymupdf yet')
+    path = Path(path)
+    if input_size is None and options.measure:
+        input_size = len(doc.tobytes())
+    report = OptimizeReport(input_size)
+
+    def run(stage, function, *args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        report.stages.append(StageReport(stage, seconds, len(doc.tobytes()) if options.measure else None))
+        return result
+
+    if options.image_dpi:
+        threshold = options.image_dpi + max(1, options.image_dpi // 10) # Leaves images barely above alone
+        run('images', doc.rewrite_images, dpi_threshold=threshold, dpi_target=options.image_dpi, quality=options.image_quality)
+    if options.subset_fonts:
+        run('fonts', doc.subset_fonts)
+
+    temp_path = path.with_name(f'.{path.name}.{os.getpid()}.optimized')
+    try:
+        if options.measure: # The last serialization is the output
+            data = b''
+            levels = []
+            if options.garbage:
+                levels.append(('garbage', 1, False))
+            if options.deduplicate:
+                levels.append(('deduplicate', 4, False))
+            if options.deflate:
+                levels.append(('deflate', options.garbage_level(), True))
+            for stage, garbage, deflate in levels:
+                start = time.perf_counter()
+                data = doc.tobytes(garbage=garbage, deflate=deflate)
+                report.stages.append(StageReport(stage, time.perf_counter() - start, len(data)))
+            temp_path.write_bytes(data or doc.tobytes())
+        else:
+            start = time.perf_counter()
+            doc.save(temp_path, garbage=options.garbage_level(), deflate=options.deflate)
+            report.stages.append(StageReport('save', time.perf_counter() - start, None))
+        os.replace(temp_path, path)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+    report.output_size = path.stat().st_size
+    return report
+
+def optimize_file(source:Path|str, destination:Path|str|None=None, options:OptimizeOptions=LOSSLESS) -> OptimizeReport:
+    """Optimizes a PDF file into destination (by default, the file itself)."""
+    if 'pymupdf' not in sys.modules:
+        raise NotImplementedError('PDF optimization not implemented without pymupdf yet')
+    source = Path(source)
+    doc = pymupdf.open(source) # pyright: ignore[reportPossiblyUnboundVariable]
+    try:
+        return optimize(doc, destination or source, options, source.stat().st_size)
+    finally:
+        doc.close()
@@ -0,0 +1,139 @@
+"""Page ranges used to extract pages
+
+Ranges are (first, last) tuples of base 0 page numbers, last included, as used by
+PDFDocument.extract_pages. Expressions are written by users with base 1 page numbers, as comma
+separated items: pages ("8"), ranges ("1-5"), open ranges ("10-" up to the last page, "-3" from
+the first one) and the "odd" and "even" keywords.
+
+parse() keeps the items in the order they are written, for extraction in that order, while
+PageSet normalizes them into sorted, disjoint intervals, so that selections of thousands of pages
+are counted and tested in one pass.
+"""
+from bisect import bisect_right
+from collections.abc import Iterable, Iterator
+
+KEYWORDS = {'odd': 0, 'even': 1} # Keyword: first page (base 0)
+
+def coalesce(ranges:Iterable[tuple[int, int|None]]) -> list[tuple[int, int]]:
+    """
+    Joins ranges that continue the previous one, keeping their order, so that touching
+    ranges can be copied at once.
+
+    :param ranges: (first, last) tuples. A None last page means a single page range.
+    :type ranges: Iterable[tuple[int, int | None]]
+    :return: coalesced ranges
+    :rtype: list[tuple[int, int]]
+    """
+    result:list[tuple[int, int]] = []
+    for first, last in ranges:
+        last = first if last is None else last
+        if first > last:
+            raise ValueError(f'Range starts after its end: {first + 1}-{last + 1}')
+        if result and result[-1][1] + 1 == first:
+            result[-1] = result[-1][0], last
+        else:
+            result.append((first, last))
+    return result
+
+def parse_items(expression:str, page_count:int) -> list[tuple[int, int]]:
+    """
+    Parses a page range expression into ranges, in the order they are written and without
+    joining them. Every item is validated against page_count.
+
+    Raises ValueError if the expression is not valid, selects no pages or refers to pages out of
+    the document.
+
+    :param expression: comma separated page numbers, ranges or keywords (base 1)
+    :type expression: str
+    :param page_count: number of pages of the document
+    :type page_count: int
+    :return: (first, last) base 0 ranges
+    :rtype: list[tuple[int, int]]
+    """
+    ranges:list[tuple[int, int]] = []
+    for item in expression.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        keyword = item.lower()
+        if keyword in KEYWORDS:
+            ranges.extend((page, page) for page in range(KEYWORDS[keyword], page_count, 2))
+            continue
+        first, dash, last = (part.strip() for part in item.partition('-'))
+        try:
+            first_page = int(first) if first or not dash else 1
+            last_page = int(last) if last else page_count if dash else first_page
+        except ValueError:
+            raise ValueError(f'Invalid page range: "{item}"')
+        if not first and not last:
+            raise ValueError(f'Invalid page range: "{item}"')
+        for page in (first_page, last_page):
+            if not 1 <= page <= page_count:
+                raise ValueError(f'Page {page} is out of the document (1-{page_count})')
+        if first_page > last_page:
+            raise ValueError(f'Range starts after its end: {item}')
+        ranges.append((first_page - 1, last_page - 1))
+    if not ranges:
+        raise ValueError('No pages selected')
+    return ranges
+
+def parse(expression:str, page_count:int) -> list[tuple[int, int]]:
+    """
+    Parses a page range expression such as "1-5, 8, 10-" into coalesced ranges, in the order they
+    are written (see parse_items()).
+
+    Raises ValueError if the expression is not valid or refers to pages out of the document.
+
+    :param expression: comma separated page numbers, ranges or keywords (base 1)
+    :type expression: str
+    :param page_count: number of pages of the document
+    :type page_count: int
+    :return: coalesced (first, last) base 0 ranges
+    :rtype: list[tuple[int, int]]
+    """
+    return coalesce(parse_items(expression, page_count))
+
+class PageSet(object):
+    """Set of pages stored as sorted, disjoint and non-touching (first, last) base 0 ranges."""
+    ranges:list[tuple[int, int]]
+
+    def __init__(self, ranges:Iterable[tuple[int, int]]=()):
+        self.ranges = []
+        for first, last in sorted(ranges):
+            if first > last:
+                raise ValueError(f'Range starts after its end: {first + 1}-{last + 1}')
+            if self.ranges and first <= self.ranges[-1][1] + 1:
+                if last > self.ranges[-1][1]:
+                    self.ranges[-1] = self.ranges[-1][0], last
+            else:
+                self.ranges.append((first, last))
+        self._starts = [first for first, _ in self.ranges]
+
+    @classmethod
+    def parse(cls, expression:str, page_count:int) -> 'PageSet':
+        """
+        Returns the pages selected by an expression such as "1-5, 8, 10-, odd, -3".
+
+        Raises ValueError if the expression is not valid or refers to pages out of the document.
+        """
+        return cls(parse_items(expression, page_count))
+
+    def __len__(self) -> int:
+        """Returns the number of pages."""
+        return sum(last - first + 1 for first, last in self.ranges)
+
+    def __contains__(self, page:int) -> bool:
+        index = bisect_right(self._starts, page) - 1
+        return index >= 0 and page <= self.ranges[index][1]
+
+    def __iter__(self) -> Iterator[int]:
+        """Yields the pages in order."""
+        for first, last in self.ranges:
+            yield from range(first, last + 1)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, PageSet) and self.ranges == other.ranges
+
+    def __repr__(self) -> str:
+        return f'PageSet({self.ranges!r})'
+
@@ -1,4 +1,7 @@
-import sys
+import json, multiprocessing, os, sys
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 try:
@@ -6,21 +9,34 @@ try:
 except ImportError:
     import pypdf
 
-from meupdf.documents.generic import GenericPage, GenericDocument, DocumentFormats, FormatInfos, document_formats
+from meupdf.documents import annotations, optimize, pagesets
+from meupdf.documents.mapping import FileMapping, file_mappings
+from meupdf.documents.generic import GenericPage, GenericDocument, PageSequence, DocumentFormats, FormatInfos, UnsupportedChanges, document_formats
+from meupdf.metrics import metrics
 
 DOCUMENT_FORMAT = 'PDF'
+TEXT_KINDS = ('text', 'words', 'blocks')
 
 class PDFPage(GenericPage):
+    __slots__ = ()
+
     def __init__(self, document, number):
         super().__init__(document, number)
+        page = self._load()
         if 'pymupdf' in sys.modules:
-            self._page = document._document[number] # pyright: ignore[reportAttributeAccessIssue]
-            self.width = self._page.rect[2] - self._page.rect[0], # pyright: ignore[reportAttributeAccessIssue]
-            self.height = self._page.rect[3] - self._page.rect[1], # pyright: ignore[reportAttributeAccessIssue]
+            self.width = page.rect[2] - page.rect[0] # pyright: ignore[reportAttributeAccessIssue]
+            self.height = page.rect[3] - page.rect[1] # pyright: ignore[reportAttributeAccessIssue]
         else:
-            self._page = document._document.get_page(number) # pyright: ignore[reportAttributeAccessIssue]
-            self.width, self.height = self._page.trimbox.width, self._page.trimbox.right
-    
+            self.width, self.height = page.trimbox.width, page.trimbox.height # pyright: ignore[reportAttributeAccessIssue]
+
+    def _load(self):
+        """Loads the backend page. It is not kept, so it is released as soon as the caller is done."""
+        if 'pymupdf' in sys.modules:
+            return self._document._document[self.number] # pyright: ignore[reportAttributeAccessIssue]
+        else:
+            return self._document._document.get_page(self.number) # pyright: ignore[reportAttributeAccessIssue]
+
+    @metrics.instrument('pdf.render')
     def to_image(self, width:int|None=None, height:int|None=None, zoom:float=1.0, rotation:int=0): # pyright: ignore[reportIncompatibleMethodOverride]
         """Returns page image according to the given parameters in the following dimension
         priority order:
@@ -29,19 +45,103 @@ class PDFPage(GenericPage):
         """
         if 'pymupdf' in sys.modules:
             if width:
-                zoom = width / (self._page.rect[2] - self._page.rect[0])
+                zoom = width / self.width
             elif height:
-                zoom = height / (self._page.rect[3] - self._page.rect[1])
+                zoom = height / self.height
             matrix = pymupdf.Matrix(zoom, zoom).prerotate(rotation) # pyright: ignore[reportPossiblyUnboundVariable]
-            return self._page.get_pixmap(matrix=matrix)
+            return self._load().get_pixmap(matrix=matrix)
         else:
             raise NotImplementedError('PDF page images not implemented without pymupdf yet')
 
+    @metrics.instrument('pdf.thumbnail')
+    def to_thumbnail(self, max_edge:int, rotation:int=0, output:str='jpeg', quality:int=80, # pyright: ignore[reportIncompatibleMethodOverride]
+                     annots:bool=False, alpha:bool=False, embedded:bool=False) -> bytes:
+        """
+        Returns an encoded thumbnail whose longest edge has max_edge pixels. Unlike to_image(), the
+        page is rendered straight to the target size and, by default, without annotations and alpha
+        channel and encoded as JPEG, which is much cheaper than a PNG pass.
+
+        :param max_edge: length of the longest thumbnail edge, in pixels
+        :type max_edge: int
+        :param rotation: rotation in degrees (rotation > 0 rotates right)
+        :type rotation: int
+        :param output: image format ('jpeg', 'png', 'ppm'...)
+        :type output: str
+        :param quality: JPEG quality
+        :type quality: int
+        :param annots: whether annotations are rendered
+        :type annots: bool
+        :param alpha: whether the image keeps an alpha channel (not available for JPEG)
+        :type alpha: bool
+        :param embedded: use the thumbnail embedded in the page, if any, instead of rendering it
+        :type embedded: bool
+        :return: encoded image
+        :rtype: bytes
+        """
+        if 'pymupdf' in sys.modules:
+            jpeg = output.lower() in ('jpeg', 'jpg')
+            page = self._load()
+            pix = None
+            if embedded and not rotation % 360:
+                pix = self._embedded_thumbnail(page, max_edge)
+            if pix is None:
+                zoom = max_edge / max(self.width, self.height)
+                matrix = pymupdf.Matrix(zoom, zoom).prerotate(rotation) # pyright: ignore[reportPossiblyUnboundVariable]
+                pix = page.get_pixmap(matrix=matrix, alpha=alpha and not jpeg, annots=annots)
+            if jpeg:
+                return pix.tobytes(output='jpeg', jpg_quality=quality)
+            return pix.tobytes(output=output)
+        else:
+            raise NotImplementedError('PDF thumbnails not implemented without pymupdf yet')
+
+    def text(self, kind:str='text', sort:bool=False):
+        """
+        Returns the page text.
+
+        :param kind: 'text' for plain text, 'words' for (x0, y0, x1, y1, word, block, line, word
+        number) tuples or 'blocks' for (x0, y0, x1, y1, text, block, block type) tuples
+        :type kind: str
+        :param sort: whether text is sorted in reading order (top-left to bottom-right) instead
+        of content stream order
+        :type sort: bool
+        """
+        if kind not in TEXT_KINDS:
+            raise ValueError(f'Unknown text kind: {kind} (expected one of {", ".join(TEXT_KINDS)})')
+        if 'pymupdf' in sys.modules:
+            return self._load().get_text(kind, sort=sort)
+        elif kind == 'text':
+            return self._load().extract_text() # pyright: ignore[reportAttributeAccessIssue]
+        else:
+            raise NotImplementedError(f'PDF {kind} extraction not implemented without pymupdf yet')
+
+    def _embedded_thumbnail(self, page, max_edge:int):
+        """Returns the page's /Thumb image (RGB or gray, at most max_edge wide or high) or None."""
+        kind, value = self._document._document.xref_get_key(page.xref, 'Thumb') # pyright: ignore[reportAttributeAccessIssue]
+        if kind != 'xref':
+            return None
+        try:
+            pix = pymupdf.Pixmap(self._document._document, int(value.split()[0])) # pyright: ignore[reportPossiblyUnboundVariable, reportAttributeAccessIssue]
+        except (RuntimeError, ValueError):
+            return None
+        if pix.alpha:
+            pix = pymupdf.Pixmap(pix, 0) # pyright: ignore[reportPossiblyUnboundVariable]
+        if pix.n > 3:
+            pix = pymupdf.Pixmap(pymupdf.csRGB, pix) # pyright: ignore[reportPossiblyUnboundVariable]
+        factor = 0
+        while max(pix.width, pix.height) >> (factor + 1) >= max_edge:
+            factor += 1
+        if factor:
+            pix.shrink(factor)
+        return pix
+
 class PDFDocument(GenericDocument):
-    pages:list[PDFPage]
+    pages:PageSequence
     format:str = DOCUMENT_FORMAT # pyright: ignore[reportIncompatibleVariableOverride]
+    optimization_report:optimize.OptimizeReport|None = None # Of the last file written
+    _mapping:FileMapping|None = None
 
-    def __init__(self, file_path:str|Path='', document=None):
+    @metrics.instrument('pdf.open')
+    def __init__(self, file_path:str|Path='', document=None, mmap:bool|None=None):
         """
         Inits a PDFDocument. If file_path is provided, the document is read from the file system.
         Else, a document of the proper type (from pymupdf or pypdf) must be provided.
@@ -49,6 +149,10 @@ class PDFDocument(GenericDocument):
         :param file_path: Path to a PDF file. If ommited, a document must be provided.
         :type file_path: str | Path
         :param document: pymupdf or pypdf document. Only used if file path is not provided.
+        :param mmap: whether the file is read through a read-only memory mapping shared with the
+        view server (see meupdf.documents.mapping). Defaults to file_mappings.enabled. Only used
+        with pymupdf.
+        :type mmap: bool | None
         """
         super().__init__(format=PDFDocument.format)
     
@@ -59,20 +163,61 @@ class PDFDocument(GenericDocument):
             self.file_path = Path(file_path)
         if 'pymupdf' in sys.modules:
             if file_path:
-                self._document:pymupdf.Document = pymupdf.open(file_path) # pyright: ignore[reportPossiblyUnboundVariable]
+                self._document:pymupdf.Document = self._open(file_mappings.enabled if mmap is None else mmap)
             else:
                 self._document:pymupdf.Document = document # pyright: ignore[reportPossiblyUnboundVariable, reportAttributeAccessIssue]
             self.page_count = self._document.page_count
-            self.pages = []
-            for p in range(self.page_count):
-                self.pages.append(PDFPage(self, p))
         else:
             self._document = pypdf.PdfReader(file_path) # pyright: ignore[reportAttributeAccessIssue, reportPossiblyUnboundVariable]
             self.page_count = self._document.get_num_pages() # pyright: ignore[reportAttributeAccessIssue]
-            self.pages = []
-            for p in range(self.page_count):
-                self.pages.append(PDFPage(self, p))
+        self.pages = PageSequence(self, PDFPage)
+        self._id = self._read_id() # Kept, so the fingerprint is available after the document is closed
+        self._remember_file_state()
+        self._applied:dict[str, tuple[str, tuple[int, int]|None]] = {} # Applied changes: JSON value, (page, xref) of the annotation
+
+    def _open(self, mmap:bool):
+        """Opens the file with pymupdf, through a memory mapping if mmap is set and the file can be mapped."""
+        if mmap:
+            try:
+                mapping = file_mappings.acquire(self.file_path)
+            except (OSError, ValueError):
+                pass # Excluded files or file systems without mmap support: read as usual
+            else:
+                try:
+                    document = pymupdf.open(stream=mapping.view(), filetype='pdf') # pyright: ignore[reportPossiblyUnboundVariable]
+                except BaseException:
+                    file_mappings.release(mapping)
+                    raise
+                self._mapping = mapping
+                return document
+        return pymupdf.open(self.file_path) # pyright: ignore[reportPossiblyUnboundVariable]
+
+    def _close_document(self):
+        """Closes the pymupdf document and releases its mapping, if any."""
+        self._document.close() # pyright: ignore[reportAttributeAccessIssue]
+        if self._mapping is not None:
+            self._document.stream = None # pyright: ignore[reportAttributeAccessIssue]
+            file_mappings.release(self._mapping)
+            self._mapping = None
 
+    @property
+    def mapped(self) -> bool:
+        """Whether the document reads its file through a memory mapping."""
+        return self._mapping is not None
+
+    def _identifier(self) -> bytes:
+        return self._id
+
+    def _read_id(self) -> bytes:
+        """Returns the ID array of the trailer, if there is one."""
+        if 'pymupdf' in sys.modules:
+            kind, value = self._document.xref_get_key(-1, 'ID') # pyright: ignore[reportAttributeAccessIssue]
+            return value.encode() if kind == 'array' else b''
+        else:
+            value = self._document.trailer.get('/ID') # pyright: ignore[reportAttributeAccessIssue]
+            return repr(value).encode() if value else b''
+
+    @metrics.instrument('pdf.merge')
     def merge(self, other):
         if 'pymupdf' in sys.modules:
             toc = self._document.get_toc(False) # type: ignore
@@ -86,45 +231,238 @@ class PDFDocument(GenericDocument):
         else:
             raise NotImplementedError('PDF merge not implemented without pymupdf yet')
 
-    def extract_pages(self, new_path:str|None=None, first:int=0, last:int|None=None, target_doc=None):
+    @metrics.instrument('pdf.extract')
+    def extract_pages(self, new_path:str|None=None, first:int=0, last:int|None=None, target_doc=None,
+                      ranges:Iterable[tuple[int, int|None]]|str|None=None, optimization:optimize.OptimizeOptions|None=None):
         """
         Extracts pages from a PDF document, either saving a new file or inserting pages into an existing
         document. The document is always saved after inserting the extracted pages.
+
+        Several ranges can be extracted at once: touching ranges are coalesced and the document is
+        saved only once.
         
         Raises TypeError if both new_path and target_doc are not provided.
         
         :param new_path: path of the new PDF document. It is saved after inserting the extract pages.
         :type new_path: str | None
-        :param first: first page to extract (base 0)
+        :param first: first page to extract (base 0). Ignored if ranges are provided.
         :type first: int
         :param last: last page to extract (base 0). Equals first if not provided.
         :type last: int | None
         :param target_doc: target document, if already exists. Must be either pymupdf.Document or
         or pypdf.PdfWriter (only if pymupdf module is not found)
+        :param ranges: list of (first, last) base 0 ranges or a page range expression such as
+        "1-5, 8" (base 1), extracted in the given order
+        :type ranges: Iterable[tuple[int, int | None]] | str | None
+        :param optimization: optimization of the new file. Its report is kept in optimization_report.
+        :type optimization: OptimizeOptions | None
         """
         if not new_path and target_doc is None:
             raise TypeError('Either a file path or a target document must be assigned for page extraction')
+
+        if ranges is None:
+            ranges = [(first, last)]
+        if isinstance(ranges, str):
+            ranges = pagesets.parse(ranges, self.page_count)
+        else:
+            ranges = pagesets.coalesce(ranges)
         
         if 'pymupdf' in sys.modules:
             if target_doc:
                 doc = target_doc
             else:
                 doc = pymupdf.Document() # type: ignore
-            doc.insert_pdf(self._document, from_page=first, to_page=last or first)
-            if new_path is not None:
+            for first, last in ranges:
+                doc.insert_pdf(self._document, from_page=first, to_page=last)
+            if new_path is not None and optimization is not None:
+                self.optimization_report = optimize.optimize(doc, new_path, optimization)
+            elif new_path is not None:
                 doc.save(Path(new_path))
             return doc
         else:
             raise NotImplementedError('Page extraction without pymupdf not implemented yet')
 
-    def save(self, new_path:Path|str|None=None):
+    @metrics.instrument('pdf.apply_changes')
+    def apply_changes(self, changes:dict) -> int:
+        """
+        Applies annotation and form changes exported by pdf.js (see meupdf.documents.annotations)
+        and appends them to the file with an incremental save, so saving costs as much as the
+        changes, not as the whole document. Changes already applied are skipped, and editors whose
+        value changed replace the annotation they had created.
+
+        Raises UnsupportedChanges, before modifying the document, if any change cannot be applied.
+
+        :param changes: pdf.js storage entries by key. None removes an editor applied before.
+        :type changes: dict
+        :return: number of changes applied
+        :rtype: int
+        """
+        if 'pymupdf' not in sys.modules:
+            raise UnsupportedChanges('Incremental changes not implemented without pymupdf yet')
+        if self.is_stale(): # The update would be appended to another file
+            raise UnsupportedChanges('The file changed on disk')
+
+        pending = []
+        for key, value in changes.items():
+            kind = annotations.classify(key, value)
+            serialized = json.dumps(value, sort_keys=True)
+            if key in self._applied and self._applied[key][0] == serialized:
+                continue
+            if kind == annotations.REMOVAL:
+                if key not in self._applied:
+                    continue
+                if self._applied[key][1] is None:
+                    raise UnsupportedChanges(f'Cannot remove "{key}"')
+            elif kind == annotations.EDITOR and not 0 <= value['pageIndex'] < self.page_count:
+                raise UnsupportedChanges(f'Page {value['pageIndex']} out of range')
+            pending.append((key, value, kind, serialized))
+        if not pending:
+            return 0
+
+        mapped = self.mapped
+        if mapped: # Documents read from memory cannot be saved to their file incrementally
+            self._close_document()
+            self._document = pymupdf.open(self.file_path) # pyright: ignore[reportPossiblyUnboundVariable]
+        try:
+            if not self._document.can_save_incrementally(): # pyright: ignore[reportAttributeAccessIssue]
+                raise UnsupportedChanges('The document cannot be saved incrementally')
+            doc = self._document
+            for key, value, kind, serialized in pending:
+                annotation = None
+                if key in self._applied and self._applied[key][1] is not None: # Replaced or removed editor
+                    number, xref = self._applied.pop(key)[1] # pyright: ignore[reportOptionalIterable]
+                    page = doc[number]
+                    page.delete_annot(page.load_annot(xref))
+                if kind == annotations.FORM:
+                    annotations.set_form_value(doc, int(key[:-1]), value['value'])
+                elif kind == annotations.EDITOR:
+                    annotation = value['pageIndex'], annotations.add_editor(doc[value['pageIndex']], value) # pyright: ignore[reportArgumentType]
+                elif kind == annotations.DELETION:
+                    page = doc[value['pageIndex']] # pyright: ignore[reportArgumentType]
+                    annot = page.load_annot(int(value['id'][:-1]))
+                    if annot is not None:
+                        page.delete_annot(annot)
+                if kind == annotations.REMOVAL:
+                    continue
+                self._applied[key] = serialized, annotation
+            doc.saveIncr() # pyright: ignore[reportAttributeAccessIssue]
+            self._remember_file_state()
+        finally:
+            if mapped: # Mapped again, so the view server keeps sharing the file
+                self._document.close()
+                self._document = self._open(True)
+        return len(pending)
+
+    @metrics.instrument('pdf.reload')
+    def reload(self):
+        """Reopens the document from its file, after the file has been replaced."""
+        if 'pymupdf' in sys.modules:
+            mmap = self.mapped
+            self._close_document()
+            self._document = self._open(mmap)
+            self.page_count = self._document.page_count
+        else:
+            self._document = pypdf.PdfReader(self.file_path) # pyright: ignore[reportAttributeAccessIssue, reportPossiblyUnboundVariable]
+            self.page_count = self._document.get_num_pages() # pyright: ignore[reportAttributeAccessIssue]
+        self._id = self._read_id()
+        self._remember_file_state()
+        self._applied.clear()
+
+    @metrics.instrument('pdf.save')
+    def save(self, new_path:Path|str|None=None, optimization:optimize.OptimizeOptions|None=None) -> optimize.OptimizeReport|None:
+        """
+        Saves the document to new_path or, by default, to its file.
+
+        :param optimization: optimization of the saved file
+        :type optimization: OptimizeOptions | None
+        :return: optimization report
+        :rtype: OptimizeReport | None
+        """
+        in_place = not new_path or Path(new_path).resolve() == self.file_path.resolve()
         if new_path:
             self.file_path = Path(new_path)
         if 'pymupdf' in sys.modules:
-            self._document.save(self.file_path) # type: ignore
+            if optimization is not None:
+                self.optimization_report = optimize.optimize(self._document, self.file_path, optimization) # pyright: ignore[reportArgumentType]
+                self.reload() # The file was rewritten, with objects renumbered
+                return self.optimization_report
+            elif self.mapped and in_place: # Writing in place would change the mapped file under it
+                optimize.optimize(self._document, self.file_path, optimize.PLAIN) # pyright: ignore[reportArgumentType]
+                self.reload()
+            else:
+                self._document.save(self.file_path) # type: ignore
+                self._remember_file_state()
+            return None
     
+    def iter_text(self, kind:str='text', first:int=0, last:int|None=None, sort:bool=False) -> Iterator[tuple[int, object]]:
+        """
+        Yields (page number, text) for pages first to last (included, base 0), one page at a time:
+        each page is released before the next one is loaded, so memory use does not grow with the
+        document. See PDFPage.text() for kind and sort.
+        """
+        last = self.page_count - 1 if last is None else last
+        for number in range(first, last + 1):
+            yield number, PDFPage(self, number).text(kind, sort)
+
+    def iter_text_parallel(self, kind:str='text', first:int=0, last:int|None=None, sort:bool=False,
+                           workers:int|None=None, chunk_size:int=64) -> Iterator[tuple[int, object]]:
+        """
+        Same as iter_text(), with pages extracted by worker processes that open the file on their
+        own. Results are still yielded in page order, and only a few chunks per worker are kept in
+        flight, so memory stays bounded. Worth it for documents with thousands of pages.
+
+        :param workers: number of worker processes. Defaults to the CPU count.
+        :type workers: int | None
+        :param chunk_size: pages extracted by a worker at a time
+        :type chunk_size: int
+        """
+        try:
+            file_path = str(self.file_path)
+        except AttributeError:
+            raise ValueError('Only documents read from the file system can be extracted in parallel')
+        last = self.page_count - 1 if last is None else last
+        workers = max(1, min(workers or os.cpu_count() or 1, (last - first) // chunk_size + 1))
+        if workers == 1:
+            yield from self.iter_text(kind, first, last, sort)
+            return
+        chunks = iter(range(first, last + 1, chunk_size))
+        # Spawned, since forking a process running the GUI toolkit and the view server is unsafe
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            pending = deque()
+            def submit():
+                start = next(chunks, None)
+                if start is not None:
+                    end = min(start + chunk_size, last + 1) - 1
+                    pending.append((start, executor.submit(extract_text, file_path, kind, start, end, sort)))
+            try:
+                for _ in range(workers * 2):
+                    submit()
+                while pending:
+                    start, future = pending.popleft()
+                    texts = future.result()
+                    submit()
+                    yield from enumerate(texts, start)
+            finally: # Also when the caller stops iterating early
+                for _, future in pending:
+                    future.cancel()
+
     def close(self):
-        self._document.close()
+        if 'pymupdf' in sys.modules:
+            self._close_document()
+        else:
+            self._document.close() # pyright: ignore[reportAttributeAccessIssue]
+
+_worker_document:tuple[tuple[str, int], PDFDocument]|None = None # Kept open between chunks
+
+def extract_text(file_path:str, kind:str, first:int, last:int, sort:bool=False) -> list:
+    """Returns the text of pages first to last (included) of a file, in a worker process."""
+    global _worker_document
+    key = file_path, os.stat(file_path).st_mtime_ns
+    if _worker_document is None or _worker_document[0] != key:
+        if _worker_document is not None:
+            _worker_document[1].close()
+        _worker_document = key, PDFDocument(file_path)
+    return [text for _, text in _worker_document[1].iter_text(kind, first, last, sort)]
 
 document_formats[DOCUMENT_FORMAT] = {
         FormatInfos.FULL_NAME: _('Portable Document File'),
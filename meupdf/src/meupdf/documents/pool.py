@@ -0,0 +1,74 @@
+"""Shared document handles
+
+Tabs, windows and file rows showing the same file share one open document instead of parsing the
+file again each. Documents are reference counted: acquire() returns the open document of a file,
+opening it on first use, and release() closes it when its last holder lets it go. A document whose
+file changed on disk since it was read or written is reloaded by the next acquire().
+"""
+import threading
+from pathlib import Path
+
+import meupdf.documents.pdf # Registers the PDF format
+from meupdf.documents.generic import GenericDocument, get_document_class
+from meupdf.metrics import metrics
+
+class DocumentPool(object):
+    def __init__(self):
+        self._documents:dict[Path, GenericDocument] = {}
+        self._keys:dict[int, Path] = {} # id(document): key
+        self._references:dict[Path, int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(file_path:Path|str) -> Path:
+        """Returns the pool key of a file. Documents are kept by path, so they can be saved back."""
+        return Path(file_path).resolve()
+
+    def acquire(self, file_path:Path|str) -> GenericDocument:
+        """
+        Returns the open document of a file, opening it if needed. Every call must be matched by
+        a call to release().
+
+        :param file_path: document file
+        :type file_path: Path | str
+        :return: shared document
+        :rtype: GenericDocument
+        """
+        key = self.key(file_path)
+        with self._lock:
+            document = self._documents.get(key)
+            if document is None:
+                document = get_document_class(key)(file_path)
+                self._documents[key] = document
+                self._keys[id(document)] = key
+                self._references[key] = 0
+            elif document.is_stale():
+                document.reload()
+            else:
+                metrics.increment('pool.hits')
+            self._references[key] += 1
+            return document
+
+    def release(self, document:GenericDocument):
+        """Releases a document returned by acquire(), closing it if it is not used anymore."""
+        with self._lock:
+            key = self._keys.get(id(document))
+            if key is None or self._documents.get(key) is not document:
+                document.close() # Not shared
+                return
+            self._references[key] -= 1
+            if self._references[key] > 0:
+                return
+            del self._documents[key], self._references[key], self._keys[id(document)]
+        document.close()
+
+    def references(self, file_path:Path|str) -> int:
+        """Returns the number of holders of the document of a file."""
+        with self._lock:
+            return self._references.get(self.key(file_path), 0)
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+document_pool = DocumentPool()
+metrics.gauge('pool.documents', lambda: len(document_pool))
@@ -0,0 +1,255 @@
+"""Full-text search index
+
+Page text is extracted by a pool of worker processes and stored in a SQLite FTS5 index (usually
+under ``app.paths.data``), keyed by document fingerprint and page number. Documents are indexed in
+the background, a batch of pages at a time, and only indexed again when their contents change.
+Queries are answered by SQLite and return document/page hits with a snippet of the matching text.
+"""
+import multiprocessing, os, queue, sqlite3, threading, time
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import NamedTuple
+
+BATCH_SIZE = 32 # Pages extracted by a worker at a time
+
+class SearchHit(NamedTuple):
+    path:Path
+    fingerprint:str
+    page:int # Base 0
+    snippet:str
+    score:float # Lower is better
+
+def quote(query:str) -> str:
+    """
+    Converts user input into an FTS5 query matching all of its words. Words ending with "*" are
+    searched as prefixes.
+    """
+    terms = []
+    for word in query.split():
+        prefix = word.endswith('*')
+        word = word.rstrip('*')
+        if word:
+            terms.append('"' + word.replace('"', '""') + '"' + ('*' if prefix else ''))
+    return ' '.join(terms)
+
+class SearchIndex(object):
+    path:Path|str
+
+    def __init__(self, path:Path|str=':memory:'):
+        """
+        Inits a search index.
+
+        :param path: SQLite database file. By default, the index is kept in memory.
+        :type path: Path | str
+        """
+        self.path = path
+        if path != ':memory:':
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS documents ('
+                'fingerprint TEXT PRIMARY KEY, path TEXT, page_count INTEGER, indexed_pages INTEGER, updated REAL)'
+            )
+            self._connection.execute(
+                'CREATE VIRTUAL TABLE IF NOT EXISTS pages USING fts5('
+                "text, fingerprint UNINDEXED, page UNINDEXED, tokenize='unicode61 remove_diacritics 2')"
+            )
+
+    def is_indexed(self, fingerprint:str) -> bool:
+        """Returns whether every page of the document has been indexed."""
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT page_count, indexed_pages FROM documents WHERE fingerprint = ?', (fingerprint,)
+            ).fetchone()
+        return row is not None and row[0] == row[1]
+
+    def indexed_pages(self, fingerprint:str) -> int:
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT indexed_pages FROM documents WHERE fingerprint = ?', (fingerprint,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def begin(self, path:Path|str, fingerprint:str, page_count:int):
+        """Registers a document to be indexed, dropping former versions of the same file."""
+        path = str(Path(path).resolve())
+        with self._lock, self._connection:
+            stale = [row[0] for row in self._connection.execute(
+                'SELECT fingerprint FROM documents WHERE path = ? AND fingerprint != ?', (path, fingerprint)
+            )]
+            for old in stale:
+                self._connection.execute('DELETE FROM pages WHERE fingerprint = ?', (old,))
+                self._connection.execute('DELETE FROM documents WHERE fingerprint = ?', (old,))
+            self._connection.execute(
+                'INSERT INTO documents VALUES (?, ?, ?, 0, ?) ON CONFLICT(fingerprint) DO UPDATE SET path = excluded.path',
+                (fingerprint, path, page_count, time.time()),
+            )
+
+    def add_pages(self, fingerprint:str, first:int, texts:list[str]):
+        """Stores the text of consecutive pages, starting at page first."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                'DELETE FROM pages WHERE fingerprint = ? AND page >= ? AND page < ?', (fingerprint, first, first + len(texts))
+            )
+            self._connection.executemany(
+                'INSERT INTO pages (text, fingerprint, page) VALUES (?, ?, ?)',
+                ((text, fingerprint, first + n) for n, text in enumerate(texts)),
+            )
+            self._connection.execute(
+                'UPDATE documents SET indexed_pages = MAX(indexed_pages, ?), updated = ? WHERE fingerprint = ?',
+                (first + len(texts), time.time(), fingerprint),
+            )
+
+    def remove(self, fingerprint:str):
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM pages WHERE fingerprint = ?', (fingerprint,))
+            self._connection.execute('DELETE FROM documents WHERE fingerprint = ?', (fingerprint,))
+
+    def search(self, query:str, limit:int=50, raw:bool=False) -> list[SearchHit]:
+        """
+        Searches the indexed pages, best matches first.
+
+        :param query: words to search. Words ending with "*" are searched as prefixes.
+        :type query: str
+        :param limit: maximum number of hits
+        :type limit: int
+        :param raw: whether query is passed to SQLite as an FTS5 query, with its operators
+        :type raw: bool
+        :return: hits
+        :rtype: list[SearchHit]
+        """
+        query = query if raw else quote(query)
+        if not query:
+            return []
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT documents.path, pages.fingerprint, pages.page, snippet(pages, 0, '[', ']', '…', 12), bm25(pages) "
+                'FROM pages JOIN documents ON documents.fingerprint = pages.fingerprint '
+                'WHERE pages MATCH ? ORDER BY bm25(pages) LIMIT ?',
+                (query, limit),
+            ).fetchall()
+        return [SearchHit(Path(path), fingerprint, int(page), snippet, score) for path, fingerprint, page, snippet, score in rows]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+_worker_documents:OrderedDict = OrderedDict() # Documents kept open by each worker process
+
+def _open(file_path:str):
+    import meupdf.documents.pdf # Registers the PDF format in the worker process
+    from meupdf.documents.generic import get_document_class
+
+    key = file_path, os.stat(file_path).st_mtime_ns
+    if key in _worker_documents:
+        _worker_documents.move_to_end(key)
+    else:
+        _worker_documents[key] = get_document_class(file_path)(file_path)
+        while len(_worker_documents) > 4:
+            _worker_documents.popitem(last=False)[1].close()
+    return _worker_documents[key]
+
+def document_info(file_path:str) -> tuple[str, int]:
+    """Returns the fingerprint and page count of a document, in a worker process."""
+    document = _open(file_path)
+    return document.fingerprint(), document.page_count
+
+def extract_text(file_path:str, first:int, last:int) -> list[str]:
+    """Returns the text of pages first to last (included), in a worker process."""
+    return [text for _, text in _open(file_path).iter_text('text', first, last, sort=True)]
+
+class SearchIndexer(object):
+    index:SearchIndex|None
+    max_workers:int
+    progress:Callable[[Path, int, int], None]|None
+    _executor:ProcessPoolExecutor|None = None
+    _thread:threading.Thread|None = None
+
+    def __init__(self, index:SearchIndex|None=None, max_workers:int|None=None,
+                 progress:Callable[[Path, int, int], None]|None=None):
+        """
+        Inits a background indexer.
+
+        :param index: index filled by the indexer. If ommited, documents are queued until an index
+        is assigned.
+        :type index: SearchIndex | None
+        :param max_workers: number of worker processes. Defaults to half the CPUs, up to 4.
+        :type max_workers: int | None
+        :param progress: function called from the indexer thread with (path, indexed pages, page
+        count) after each batch of pages
+        :type progress: Callable[[Path, int, int], None] | None
+        """
+        self.index = index
+        self.max_workers = max_workers or max(1, min(4, (os.cpu_count() or 2) // 2))
+        self.progress = progress
+        self._queue:queue.Queue[Path|None] = queue.Queue()
+        self._pending:set[Path] = set()
+        self._lock = threading.Lock()
+        self._idle = threading.Event()
+        self._idle.set()
+
+    def submit(self, file_path:Path|str):
+        """Queues a document to be indexed, unless it is already queued."""
+        path = Path(file_path).resolve()
+        with self._lock:
+            if path in self._pending:
+                return
+            self._pending.add(path)
+            self._idle.clear()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name='search indexer')
+                self._thread.start()
+        self._queue.put(path)
+
+    def wait(self, timeout:float|None=None) -> bool:
+        """Waits until every queued document has been indexed. Returns False on timeout."""
+        return self._idle.wait(timeout)
+
+    def shutdown(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            if path is None:
+                return
+            try:
+                if self.index is not None:
+                    self._index(path)
+            except Exception as e:
+                print(f'Could not index "{path}": {e}')
+            finally:
+                with self._lock:
+                    self._pending.discard(path)
+                    if not self._pending:
+                        self._idle.set()
+
+    def _index(self, path:Path):
+        if self._executor is None:
+            # Spawned, since forking a process running the GUI toolkit and the view server is unsafe
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+        fingerprint, page_count = self._executor.submit(document_info, str(path)).result()
+        if self.index.is_indexed(fingerprint): # pyright: ignore[reportOptionalMemberAccess]
+            return
+        self.index.begin(path, fingerprint, page_count) # pyright: ignore[reportOptionalMemberAccess]
+        first = self.index.indexed_pages(fingerprint) # pyright: ignore[reportOptionalMemberAccess]
+        batches = [(n, min(n + BATCH_SIZE, page_count) - 1) for n in range(first, page_count, BATCH_SIZE)]
+        futures = [self._executor.submit(extract_text, str(path), start, end) for start, end in batches]
+        for (start, end), future in zip(batches, futures): # In order, so an interrupted run can resume
+            self.index.add_pages(fingerprint, start, future.result()) # pyright: ignore[reportOptionalMemberAccess]
+            if self.progress:
+                self.progress(path, end + 1, page_count)
+
+search_indexer = SearchIndexer() # The app assigns its index
@@ -0,0 +1,231 @@
+"""Document split planning and parallel part writing
+
+A split plan is a list of parts, each a range of pages with a title. Plans can be made every N
+pages, at the top-level bookmarks or from a size budget. Size budgets are met by estimating the
+size of the objects each page needs (contents, images, fonts and forms, shared objects counted
+once per part) from the lengths recorded in the file, without trial saves.
+
+SplitEngine writes the parts in parallel: each worker process opens the source file on its own, and
+each part goes through the optimization pipeline (see meupdf.documents.optimize).
+"""
+import multiprocessing, os, re, sys
+from collections.abc import Callable, Sequence
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import NamedTuple
+
+try:
+    import pymupdf
+except ImportError:
+    pass # Splitting is not available without pymupdf
+
+from meupdf.documents import optimize
+from meupdf.documents.pdf import PDFDocument
+from meupdf.metrics import metrics
+
+PART_OVERHEAD = 2048 # Estimated bytes of the header, page tree, xref table and trailer of a part
+PAGE_OVERHEAD = 256 # Estimated bytes of a page object
+
+class SplitPart(NamedTuple):
+    first:int # Base 0
+    last:int # Included
+    title:str
+
+def plan_every(page_count:int, every:int) -> list[SplitPart]:
+    """Plans parts of every pages each (the last one may be shorter)."""
+    if every < 1:
+        raise ValueError('Parts must have at least one page')
+    return [SplitPart(first, min(first + every, page_count) - 1, f'{first + 1}-{min(first + every, page_count)}')
+            for first in range(0, page_count, every)]
+
+def plan_bookmarks(document:PDFDocument) -> list[SplitPart]:
+    """
+    Plans a part for each top-level bookmark, up to the next one. Pages before the first
+    bookmark make a part of their own. Raises ValueError if the document has no bookmarks.
+    """
+    if 'pymupdf' not in sys.modules:
+        raise NotImplementedError('PDF split not implemented without pymupdf yet')
+    starts:list[tuple[int, str]] = []
+    for level, title, page in document._document.get_toc(True): # pyright: ignore[reportAttributeAccessIssue]
+        if level == 1 and page > 0 and (not starts or page - 1 > starts[-1][0]):
+            starts.append((page - 1, title.strip()))
+    if not starts:
+        raise ValueError('The document has no bookmarks to split at')
+    if starts[0][0] > 0:
+        starts.insert(0, (0, ''))
+    ends = [first - 1 for first, _ in starts[1:]] + [document.page_count - 1]
+    return [SplitPart(first, last, title) for (first, title), last in zip(starts, ends)]
+
+def _length(doc, xref:int) -> int:
+    """Returns the size of an object: its dictionary and its stream, as stored in the file."""
+    size = len(doc.xref_object(xref, compressed=True))
+    kind, value = doc.xref_get_key(xref, 'Length')
+    if kind == 'int':
+        size += int(value)
+    elif kind == 'xref':
+        size += int(doc.xref_object(int(value.split()[0]), compressed=True) or 0)
+    return size
+
+def _font_files(doc, xref:int) -> list[int]:
+    """Returns the xrefs of the files embedded for a font, including its descendant fonts."""
+    fonts = [xref]
+    kind, value = doc.xref_get_key(xref, 'DescendantFonts')
+    if kind == 'array':
+        fonts += [int(n) for n in re.findall(r'(\d+) 0 R', value)]
+    elif kind == 'xref':
+        fonts += [int(n) for n in re.findall(r'(\d+) 0 R', doc.xref_object(int(value.split()[0])))]
+    files = []
+    for font in fonts:
+        kind, value = doc.xref_get_key(font, 'FontDescriptor')
+        if kind != 'xref':
+            continue
+        descriptor = int(value.split()[0])
+        files.append(descriptor)
+        for key in ('FontFile', 'FontFile2', 'FontFile3'):
+            kind, value = doc.xref_get_key(descriptor, key)
+            if kind == 'xref':
+                files.append(int(value.split()[0]))
+    return files
+
+def page_objects(document:PDFDocument, number:int) -> dict[int, int]:
+    """Returns the sizes of the objects a page needs, by xref."""
+    doc = document._document
+    page = doc[number] # pyright: ignore[reportIndexIssue]
+    xrefs = set(page.get_contents())
+    for image in page.get_images(full=True):
+        xrefs.update(x for x in image[:2] if x > 0) # Image and soft mask
+    for font in page.get_fonts(full=True):
+        if font[0] > 0:
+            xrefs.add(font[0])
+            xrefs.update(_font_files(doc, font[0]))
+    for xobject in page.get_xobjects():
+        if xobject[0] > 0:
+            xrefs.add(xobject[0])
+    for annot in page.annot_xrefs():
+        xrefs.add(annot[0])
+    return {xref: _length(doc, xref) for xref in xrefs}
+
+def plan_size(document:PDFDocument, max_size:int) -> list[SplitPart]:
+    """
+    Plans parts whose estimated size does not exceed max_size bytes. Pages are added to a part
+    while the part fits: objects shared by its pages, such as fonts, are counted once. A page
+    that does not fit even alone makes a part of its own.
+    """
+    if 'pymupdf' not in sys.modules:
+        raise NotImplementedError('PDF split not implemented without pymupdf yet')
+    if max_size <= PART_OVERHEAD:
+        raise ValueError(f'Parts cannot be smaller than {PART_OVERHEAD} bytes')
+    parts:list[SplitPart] = []
+    first, size, objects = 0, PART_OVERHEAD, set()
+    for number in range(document.page_count):
+        needed = page_objects(document, number)
+        added = PAGE_OVERHEAD + sum(length for xref, length in needed.items() if xref not in objects)
+        if number > first and size + added > max_size:
+            parts.append(SplitPart(first, number - 1, f'{first + 1}-{number}'))
+            first, size, objects = number, PART_OVERHEAD, set()
+            added = PAGE_OVERHEAD + sum(needed.values())
+        size += added
+        objects.update(needed)
+    if document.page_count:
+        parts.append(SplitPart(first, document.page_count - 1, f'{first + 1}-{document.page_count}'))
+    return parts
+
+def parse_size(text:str) -> int:
+    """Parses a size such as "10MB", "500 kB" or "1048576" into bytes."""
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([kmg]i?)?b?\s*', text, re.IGNORECASE)
+    if not match:
+        raise ValueError(f'Invalid size: {text}')
+    unit = (match[2] or '').lower()
+    base = 1024 if unit.endswith('i') else 1000
+    return int(float(match[1]) * base ** ' kmg'.index(unit[:1] or ' '))
+
+def part_name(stem:str, part:SplitPart, number:int, count:int) -> str:
+    """Returns the file name of a part. Characters not allowed in file names are dropped."""
+    title = re.sub(r'[\\/:*?"<>|\x00-\x1f]', '', part.title).strip()[:80]
+    if re.fullmatch(r'\d+-\d+', part.title):
+        return f'{stem} {title}.pdf'
+    return f'{stem} {number + 1:0{len(str(count))}d}{" " + title if title else ""}.pdf'
+
+def write_part(file_path:str, first:int, last:int, path:str,
+               optimization:optimize.OptimizeOptions=optimize.LOSSLESS) -> optimize.OptimizeReport:
+    """Writes the pages first to last of a file to path, in a worker process. Returns its optimization report."""
+    source = pymupdf.open(file_path) # pyright: ignore[reportPossiblyUnboundVariable]
+    output = pymupdf.open() # pyright: ignore[reportPossiblyUnboundVariable]
+    try:
+        output.insert_pdf(source, from_page=first, to_page=last)
+        toc = [[level, title, page - first] for level, title, page in source.get_toc(True) if first < page <= last + 1]
+        if toc:
+            toc[0][0] = 1
+            for n in range(1, len(toc)): # Levels cannot grow by more than one
+                toc[n][0] = min(toc[n][0], toc[n - 1][0] + 1)
+            output.set_toc(toc)
+        return optimize.optimize(output, path, optimization)
+    finally:
+        output.close()
+        source.close()
+
+class SplitEngine(object):
+    file_path:Path
+    parts:list[SplitPart]
+    workers:int
+    progress:Callable[[int, int], None]|None
+    optimization:optimize.OptimizeOptions
+    reports:list[optimize.OptimizeReport]
+
+    def __init__(self, file_path:Path|str, parts:Sequence[SplitPart], workers:int|None=None,
+                 progress:Callable[[int, int], None]|None=None, optimization:optimize.OptimizeOptions|None=optimize.LOSSLESS):
+        """
+        Inits a split engine.
+
+        :param file_path: file to split
+        :type file_path: Path | str
+        :param parts: parts to write, as planned by the plan_* functions
+        :type parts: Sequence[SplitPart]
+        :param workers: number of worker processes. Defaults to the CPU count.
+        :type workers: int | None
+        :param progress: function called with (written parts, total parts) after each part
+        :type progress: Callable[[int, int], None] | None
+        :param optimization: optimization of the parts. Their reports are kept in reports, in order.
+        :type optimization: OptimizeOptions | None
+        """
+        if not parts:
+            raise ValueError('No parts to write')
+        self.file_path = Path(file_path)
+        self.parts = list(parts)
+        self.workers = max(1, min(workers or os.cpu_count() or 1, len(self.parts)))
+        self.progress = progress
+        self.optimization = optimization or optimize.PLAIN
+        self.reports = []
+
+    @metrics.instrument('split.run')
+    def run(self, directory:Path|str) -> list[Path]:
+        """
+        Writes the parts into directory.
+
+        :param directory: destination directory, created if needed
+        :type directory: Path | str
+        :return: paths of the parts, in order
+        :rtype: list[Path]
+        """
+        if 'pymupdf' not in sys.modules:
+            raise NotImplementedError('PDF split not implemented without pymupdf yet')
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        paths = [directory / part_name(self.file_path.stem, part, n, len(self.parts)) for n, part in enumerate(self.parts)]
+        jobs = [(str(self.file_path), part.first, part.last, str(path), self.optimization) for part, path in zip(self.parts, paths)]
+        if self.workers == 1:
+            self.reports = []
+            for n, job in enumerate(jobs, start=1):
+                self.reports.append(write_part(*job))
+                if self.progress:
+                    self.progress(n, len(jobs))
+            return paths
+        # Spawned, since forking a process running the GUI toolkit and the view server is unsafe
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = [executor.submit(write_part, *job) for job in jobs]
+            for n, future in enumerate(as_completed(futures), start=1):
+                future.result()
+                if self.progress:
+                    self.progress(n, len(jobs))
+        self.reports = [future.result() for future in futures]
+        return paths
@@ -112,6 +112,7 @@ class FileMenuItems:
 # 10 Extract current page*
 # 20 Extract pages*
 # 30 Merge*
+# 40 Split
 class CreateMenuItems:
     EXTRACT_PAGE = lambda app, window: toga.Command(
         window.extract_current_page,
@@ -143,6 +144,16 @@ class CreateMenuItems:
         group = RootMenus.CREATE,
         enabled = True,
     )
+    SPLIT = lambda app, window: toga.Command(
+        window.open_split_window,
+        text = _('Split'),
+        #icon
+        tooltip = _('Split current document into parts'),
+        order = 40,
+        group = RootMenus.CREATE,
+        enabled = False,
+        id = 'split',
+    )
 
     @classmethod
     def create_commands(cls, app, window, menu, toolbar):
@@ -152,7 +163,7 @@ class CreateMenuItems:
             CreateMenuItems.MERGE,
         ]:
             toolbar.add(item(app, window))
-        for item in []:
+        for item in [CreateMenuItems.SPLIT]:
             menu.add(item(app, window))
 
 def create_commands(app, window, menu, toolbar):
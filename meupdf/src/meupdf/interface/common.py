@@ -1,45 +1,92 @@
+import asyncio
 from pathlib import Path
 
 import toga
 from toga.style import pack
 
-from meupdf.documents.generic import GenericDocument, document_formats, FormatInfos, get_document_class
+from meupdf.documents.generic import GenericDocument, document_formats, FormatInfos
+from meupdf.documents.pool import document_pool
 from meupdf.interface.styles import flex_margin, THUMBNAIL
+from meupdf.interface.thumbnails import thumbnail_renderer, PLACEHOLDER
 
 class PageImage(toga.ImageView):
+    """Page thumbnail. A placeholder is shown while the thumbnail is rendered in background."""
+    document:GenericDocument
+    page:int
+    size:int
+    rotation:int
+    _request:asyncio.Future|None = None
+
+    def __init__(self, document:GenericDocument, page:int=0, size:int=THUMBNAIL, rotation:int=0, *args, **kwargs):
+        """
+        Inits a page thumbnail.
+
+        :param size: longest edge of the rendered thumbnail, in pixels. See edge_for_height().
+        :type size: int
+        """
+        super().__init__(image=toga.Image(src=PLACEHOLDER), *args, **kwargs)
+        self.document, self.size, self.rotation = document, size, rotation
+        self.show_page(page)
+
+    def show_page(self, page:int):
+        """Shows another page, cancelling the previous request if it is still pending."""
+        if self._request is not None and not self._request.done():
+            self._request.cancel()
+            self.image = toga.Image(src=PLACEHOLDER)
+        self.page = page
+        self._request = thumbnail_renderer.request(self.document, page, self.size, self.rotation)
+        self._request.add_done_callback(self._show_thumbnail)
 
-    def __init__(self, document:GenericDocument, page:int=0, *args, **kwargs):
-        pix = document.pages[page].to_image()
-        img_data = pix.tobytes(output='png')
-        image = toga.Image(src=img_data)
-        super().__init__(image=image, *args, **kwargs)
+    def _show_thumbnail(self, request:asyncio.Future):
+        if request is not self._request or request.cancelled() or request.exception():
+            return # Stale request or failed rendering: keeps what is shown
+        self.image = toga.Image(src=request.result())
+
+    @staticmethod
+    def edge_for_height(height:int, width_points:float, height_points:float) -> int:
+        """
+        Returns the thumbnail size (longest edge) that renders a page of the given dimensions
+        height pixels high, so that a view styled with that height does not scale it up.
+        """
+        return max(height, round(height * width_points / height_points))
 
 class FileRow(toga.Box):
     # Miniature | file name | up | down
-    document:GenericDocument
+    document:GenericDocument # Released: only its path, format, fingerprint and page count are used
     path:Path
-    miniature:toga.ImageView
+    page_count:int
+    miniature:PageImage
     up_button:toga.Button
     down_button:toga.Button
     parent_container:toga.Box # parent might not have been set
 
     def __init__(self, file_path:str, parent:toga.Box, *args, **kwargs):
         self.path = Path(file_path)
-        self.document = get_document_class(file_path)(file_path)
+        # Shared with a tab showing the same file, if any. Thumbnails are rendered from the file
+        # and merging opens it again, so it is not kept
+        self.document = document_pool.acquire(file_path)
+        self.page_count = self.document.page_count
+        self.document.fingerprint()
+        try:
+            first_page = self.document.pages[0]
+            thumbnail_size = PageImage.edge_for_height(THUMBNAIL, first_page.width, first_page.height)
+        except (AttributeError, IndexError, ZeroDivisionError):
+            thumbnail_size = THUMBNAIL
+        document_pool.release(self.document)
         self.parent_container = parent
 
         super().__init__(*args, **kwargs)
 
         # First page miniature
         try:
-            self.miniature = PageImage(self.document, page=0, style=pack.Pack(height=THUMBNAIL))
+            self.miniature = PageImage(self.document, page=0, size=thumbnail_size, style=pack.Pack(height=THUMBNAIL))
             self.add(self.miniature)
         except NotImplementedError:
             pass
 
         # File info
         label = toga.Label(text=str(self.document.file_path.stem) + \
-                f' ({document_formats[self.document.format][FormatInfos.SHORT_NAME]})\n' + _\
+                f' ({document_formats[self.document.format][FormatInfos.SHORT_NAME]}, {self.page_count} {_("pages")})\n' + _\
                 ('At ') + str(self.document.file_path.parent), style=flex_margin)
         self.add(label)
 
@@ -1,20 +1,25 @@
 import asyncio, functools
 from pathlib import Path
+from typing import TYPE_CHECKING
 
 import toga
 
 from toga.style import pack
 
 from meupdf.interface.commands import create_commands, FileMenuItems
-from meupdf.interface.tab import DocumentTab
-from meupdf.interface.extract_pages import ExtractPagesWindow
-from meupdf.interface.merge import MergeWindow
+from meupdf.interface.tab_budget import tab_budget
 from meupdf.interface.viewserver import ViewServer
-from meupdf.documents import pdf
+
+# Documents, tabs and windows (and pymupdf below them) are imported on first use, so that the main
+# window is shown as soon as possible
+if TYPE_CHECKING:
+    from meupdf.interface.tab import DocumentTab
 
 class MainWindow(toga.MainWindow):
     main_box:toga.Box
     tab_area:toga.OptionContainer
+    tab_budget_interval:float = 60 # Seconds between checks for idle tabs
+    _tab_watch:asyncio.Task|None = None
 
     def __init__(self, app, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -38,12 +43,13 @@ class MainWindow(toga.MainWindow):
             return result
     
     def extract_current_page(self, widget, **kwargs):
+        from meupdf.documents import optimize, pdf
         current_tab = self.tab_area.current_tab
         
         def do_save(task, page):
             file_name = task.result()
             if file_name:
-                current_tab.document.extract_pages(file_name, page-1)
+                current_tab.document.extract_pages(file_name, page-1, optimization=optimize.LOSSLESS)
 
         def ask_save(task):
             page = int(task.result())
@@ -59,27 +65,33 @@ class MainWindow(toga.MainWindow):
         task.add_done_callback(functools.partial(ask_save))
     
     def open_dialog(self, widget, **kwargs):
+        from meupdf.documents import pdf
         dialog = toga.OpenFileDialog(_('Open PDF file'), file_types=[pdf.DOCUMENT_FORMAT.lower()])
         
         task = asyncio.create_task(self.dialog(dialog))
         task.add_done_callback(self.open_dialog_closed)
 
     def open_dialog_closed(self, task):
+        from meupdf.interface.tab import DocumentTab
         file = task.result()
         if file:
             for tab in self.tab_area.content:
                 if tab.index != 0:
-                    if tab.document.file_path == file:
+                    if Path(tab.file_path) == Path(file):
                         self.tab_area.current_tab = tab
                         return
             new_tab = DocumentTab(file, self.app.server_dir, self.app.files_uri, self.app.host, self.app.port) # type: ignore
             self.tab_area.content.append(new_tab)
             self.tab_area.current_tab = new_tab
+            if self._tab_watch is None:
+                self._tab_watch = asyncio.create_task(self.watch_idle_tabs())
         if not self.app.binded_to_port: # type: ignore
             dialog = toga.ErrorDialog(_('Network error!'), _('It was not possible to bind to a network port. Document contents will not be displayed.'))
             task = asyncio.create_task(self.dialog(dialog))
     
     def open_extract_pages_window(self, widget, **kwargs):
+        from meupdf.interface.extract_pages import ExtractPagesWindow
+
         def open_window(task, tab):
             page = None
             try:
@@ -94,34 +106,84 @@ class MainWindow(toga.MainWindow):
         task.add_done_callback(functools.partial(open_window, tab=current_tab))
 
     def open_merge_window(self, widget, **kwargs):
+        from meupdf.interface.merge import MergeWindow
         merge_window = MergeWindow()
         merge_window.show()
         merge_window.open_dialog(widget, first_selection=True)
 
-    async def save(self, callback, tab:DocumentTab, path:str|Path|None=''):
-        path = path or tab.document.file_path
-        key = ViewServer.create_expectation(path, int(tab.document.hashed_path()), tab.view.url, callback)
-        script =   'var save = async function() {'
-        script +=  '  var xhr = new XMLHttpRequest();'
-        script += f'  xhr.open("POST", "http://{self.app.host}:{self.app.port}");' # pyright: ignore[reportAttributeAccessIssue]
-        script +=  '  xhr.setRequestHeader("Content-Type", "application/pdf");'
-        script += f'  xhr.setRequestHeader("path", "{str(tab.file_path).replace('\\', '\\\\')}");'
-        script += f'  xhr.setRequestHeader("hash", "{tab.document.hashed_path()}");'
-        script += f'  xhr.setRequestHeader("key", "{key}");'
-        script +=  '  var doc = await PDFViewerApplication.pdfDocument.saveDocument();'
-        script +=  '  xhr.send(doc);'
+    def open_split_window(self, widget, **kwargs):
+        from meupdf.interface.split import SplitWindow
+        split_window = SplitWindow(self.tab_area.current_tab.document, title=_('Split'))
+        split_window.show()
+
+    async def save(self, callback, tab:'DocumentTab', path:str|Path|None=''):
+        """
+        Saves the document shown by tab. When it is saved over its own file, only the annotation
+        changes made since the last save are sent and appended to the file. The whole document is
+        sent by pdf.js when that is not possible (Save As, unsupported changes, or changes of
+        annotations written by a previous whole document save).
+        """
+        path = Path(path or tab.document.file_path)
+        loop = asyncio.get_event_loop()
+        fingerprint = tab.document.fingerprint()
+        key = ViewServer.create_expectation(path, fingerprint, tab.view.url, functools.partial(callback, reload=True))
+        script =   'var post = function(key, type, body) {'
+        script +=  '  return new Promise(function(resolve) {'
+        script +=  '    var xhr = new XMLHttpRequest();'
+        script += f'    xhr.open("POST", "http://{self.app.host}:{self.app.port}");' # pyright: ignore[reportAttributeAccessIssue]
+        script +=  '    xhr.setRequestHeader("Content-Type", type);'
+        script += f'    xhr.setRequestHeader("path", "{str(tab.file_path).replace('\\', '\\\\')}");'
+        script += f'    xhr.setRequestHeader("fingerprint", "{fingerprint}");'
+        script +=  '    xhr.setRequestHeader("key", key);'
+        script +=  '    xhr.onloadend = function() { resolve(xhr.status); };'
+        script +=  '    xhr.send(body);'
+        script +=  '  });'
+        script +=  '};'
+        script +=  'var save = async function() {'
+        script +=  '  var app = PDFViewerApplication;'
+        script +=  '  var saved = app.meupdfSaved = app.meupdfSaved || {sent: new Map(), full: new Set()};'
+        script +=  '  var current = new Map();'
+        script +=  '  var map = app.pdfDocument.annotationStorage.serializable.map;'
+        script +=  '  if (map) for (var [id, value] of map) {'
+        script +=  '    current.set(id, JSON.stringify(value, function(k, v) { return ArrayBuffer.isView(v) ? Array.from(v) : v; }));'
+        script +=  '  }'
+        if path == tab.document.file_path:
+            changes_key = ViewServer.create_expectation(path, fingerprint, tab.view.url, callback,
+                                                        functools.partial(self._apply_changes, loop=loop, tab=tab))
+            script +=  '  var changes = {}, full = false;'
+            script +=  '  for (var [id, json] of current) if (saved.sent.get(id) !== json) {'
+            script +=  '    full = full || saved.full.has(id); changes[id] = JSON.parse(json);'
+            script +=  '  }'
+            script +=  '  for (var id of saved.sent.keys()) if (!current.has(id)) {'
+            script +=  '    full = full || saved.full.has(id); changes[id] = null;'
+            script +=  '  }'
+            script += f'  if (!full && await post("{changes_key}", "application/json", JSON.stringify(changes)) == 200) {{'
+            script +=  '    for (var id in changes) changes[id] === null ? saved.sent.delete(id) : saved.sent.set(id, current.get(id));'
+            script +=  '    return;'
+            script +=  '  }'
+        script += f'  if (await post("{key}", "application/pdf", await app.pdfDocument.saveDocument()) == 200) {{'
+        script +=  '    saved.sent = current; saved.full = new Set(current.keys());'
+        script +=  '  }'
         script +=  '};'
         script +=  'save();'
         return await tab.view.evaluate_javascript(script)
 
-    def _save_callback(self, path:Path, e:Exception|None, loop, tab:DocumentTab):
+    def _apply_changes(self, changes:dict, loop, tab:'DocumentTab') -> int:
+        # Called by the view server thread: the document is only touched by the event loop
+        async def apply():
+            return tab.document.apply_changes(changes)
+        return asyncio.run_coroutine_threadsafe(apply(), loop).result()
+
+    def _save_callback(self, path:Path, e:Exception|None, loop, tab:'DocumentTab', reload:bool=False):
         if e:
             dialog = toga.ErrorDialog(_('Error saving file'), f'{_("File")} "{path.name}" {_("could not be saved:")}\n{e}')
             asyncio.run_coroutine_threadsafe(self.dialog(dialog), loop)
             return
-        if path != tab.document.file_path:
-            tab.text = path.name
-            tab.document.file_path = path
+        if Path(path) != tab.document.file_path:
+            tab.text = Path(path).name
+            loop.call_soon_threadsafe(tab.open_document, path)
+        elif reload: # The file was replaced
+            loop.call_soon_threadsafe(tab.document.reload)
 
     async def save_tab(self, widget, **kwargs):
         if self.tab_area.current_tab.index == 0: # Welcome page
@@ -138,10 +200,11 @@ class MainWindow(toga.MainWindow):
             ) # pyright: ignore[reportArgumentType]
 
     def save_as(self, widget, **kwargs):
+        from meupdf.documents import pdf
         if self.tab_area.current_tab.index == 0: # Welcome page
             return
         
-        tab:DocumentTab = self.tab_area.current_tab
+        tab:'DocumentTab' = self.tab_area.current_tab
 
         def do_save(task):
             new_path = task.result()
@@ -191,6 +254,7 @@ class MainWindow(toga.MainWindow):
             'extract_pages',
             'save_file',
             'save_as',
+            'split',
         ]
         for command in command_list:
             self.app.commands[command].enabled = \
@@ -201,3 +265,17 @@ class MainWindow(toga.MainWindow):
             self.title = f'Meu PDF: {self.tab_area.current_tab.text}'
         else:
             self.title = f'Meu PDF'
+
+        # Reload the selected tab if it was evicted, and evict others over the memory budget
+        if self.tab_area.content.index(self.tab_area.current_tab) != 0:
+            self.tab_area.current_tab.restore()
+        self.enforce_tab_budget()
+
+    def enforce_tab_budget(self):
+        for tab in tab_budget.victims(current=self.tab_area.current_tab):
+            asyncio.create_task(tab.evict())
+
+    async def watch_idle_tabs(self):
+        while True:
+            await asyncio.sleep(self.tab_budget_interval)
+            self.enforce_tab_budget()
@@ -1,5 +1,5 @@
 from typing import Literal
-import toga, asyncio
+import toga, asyncio, functools
 
 from pathlib import Path
 import toga.constants
@@ -7,6 +7,7 @@ from toga.style import pack
 
 from meupdf.interface.common import FileRow, PageImage
 from meupdf.documents import pdf
+from meupdf.documents.merge import MergeEngine
 from meupdf.interface.styles import flex_column_center_margin, flex_column_right, right_align, margin
 
 class MergeWindow(toga.Window):
@@ -17,6 +18,7 @@ class MergeWindow(toga.Window):
     rows:toga.Box
     cancel_button:toga.Button
     merge_button:toga.Button
+    progress_bar:toga.ProgressBar
 
     def __init__(self, *args, **kwargs):
         super().__init__(on_close=self.prepare_to_close, *args, **kwargs)
@@ -25,12 +27,13 @@ class MergeWindow(toga.Window):
         self.add_button = toga.Button(_('Add document'), enabled=False, on_press=self.open_dialog)
         self.cancel_button = toga.Button(_('Cancel'), enabled=False, on_press=self.do_close)
         self.merge_button = toga.Button(text=_('Merge'), enabled=False, on_press=self.show_save_file_dialog)
+        self.progress_bar = toga.ProgressBar(style=pack.Pack(flex=1, margin=5))
         top_button_row = toga.Box(style=right_align)
         bottom_button_row = toga.Box(style=right_align)
         self.document_organizer = toga.Box(style=flex_column_center_margin)#pack.Pack(flex=1, direction=pack.COLUMN, margin=5)) # type: ignore
         self.scroll = toga.ScrollContainer(vertical=True, horizontal=True, content=self.document_organizer, style=pack.Pack(flex=1))
         top_button_row.add(self.add_button)
-        bottom_button_row.add(self.cancel_button, self.merge_button)
+        bottom_button_row.add(self.progress_bar, self.cancel_button, self.merge_button)
         self.content.add(top_button_row, self.scroll, bottom_button_row) # type: ignore
 
     def open_dialog(self, widget, first_selection=False):
@@ -72,14 +75,32 @@ class MergeWindow(toga.Window):
             self.merge(file)
 
     def prepare_to_close(self, window, **kwargs) -> Literal[True]:
-        for row in self.document_organizer.children:
-            row.document.close()
-        return True
+        return True # Rows do not keep their documents open
     
     def merge(self, file:str):
-        for r in range(1, len(self.document_organizer.children)):
-            self.document_organizer.children[0].document.merge(self.document_organizer.children[r].document)
-        self.document_organizer.children[0].document.save(file)
+        loop = asyncio.get_event_loop()
+        paths = [row.path for row in self.document_organizer.children]
+
+        def progress(done, total):
+            loop.call_soon_threadsafe(setattr, self.progress_bar, 'value', done)
+
+        for button in (self.add_button, self.cancel_button, self.merge_button):
+            button.enabled = False
+        self.progress_bar.max = len(paths)
+        self.progress_bar.value = 0
+        engine = MergeEngine(paths, progress=progress)
+        task = loop.run_in_executor(None, engine.run_in_process, file) # pymupdf is not thread-safe
+        task.add_done_callback(functools.partial(self.merge_done, file=file))
+
+    def merge_done(self, task, file:str):
+        try:
+            task.result()
+        except Exception as e:
+            dialog = toga.ErrorDialog(_('Error merging files'), f'{_("File")} "{Path(file).name}" {_("could not be saved:")}\n{e}')
+            asyncio.create_task(self.dialog(dialog))
+            for button in (self.add_button, self.cancel_button, self.merge_button):
+                button.enabled = True
+            return
         self.do_close()
 
     def do_close(self, *args, **kwargs):
@@ -0,0 +1,155 @@
+import asyncio, functools
+from pathlib import Path
+from typing import Literal
+
+import toga
+from toga.style import pack
+
+from meupdf.documents import split
+from meupdf.documents.pdf import PDFDocument
+from meupdf.documents.pool import document_pool
+from meupdf.interface.styles import flex_column_right, flex_margin, right_align, row_margin_center, MARGIN
+
+def plan(file_path:Path, mode:str, value:str) -> list[split.SplitPart]:
+    """Plans parts by bookmarks or by size in a worker thread, with a document of its own."""
+    document = PDFDocument(file_path)
+    try:
+        if mode == 'bookmarks':
+            return split.plan_bookmarks(document)
+        return split.plan_size(document, split.parse_size(value))
+    finally:
+        document.close()
+
+class SplitWindow(toga.Window):
+    document:PDFDocument
+    modes:dict[str, str]
+    mode:toga.Selection
+    value:toga.TextInput
+    summary:toga.Label
+    progress_bar:toga.ProgressBar
+    cancel_button:toga.Button
+    split_button:toga.Button
+    parts:list[split.SplitPart]
+    plan_delay:float = 0.3 # Seconds without typing before the parts are planned
+    _plan_handle:asyncio.TimerHandle|None = None
+    _plan_generation:int = 0
+
+    def __init__(self, document, *args, **kwargs):
+        super().__init__(on_close=self.prepare_to_close, *args, **kwargs)
+
+        self.document = document_pool.acquire(document.file_path) # pyright: ignore[reportAttributeAccessIssue]
+        self._released = False
+        self.parts = []
+        self.modes = {
+            _('Every N pages'): 'every',
+            _('At each top-level bookmark'): 'bookmarks',
+            _('Maximum part size (e.g. 10MB)'): 'size',
+        }
+        self.mode = toga.Selection(items=list(self.modes), on_change=self.update_plan, style=flex_margin)
+        self.value = toga.TextInput(value='10', on_change=self.update_plan, style=flex_margin)
+        self.summary = toga.Label('', style=flex_margin)
+        self.progress_bar = toga.ProgressBar(style=pack.Pack(flex=1, margin=MARGIN))
+        self.cancel_button = toga.Button(_('Cancel'), on_press=self.do_close)
+        self.split_button = toga.Button(_('Split'), on_press=self.show_folder_dialog)
+
+        mode_row = toga.Box(style=row_margin_center)
+        mode_row.add(toga.Label(_('Split')), self.mode, self.value)
+        button_row = toga.Box(style=right_align)
+        button_row.add(self.progress_bar, self.cancel_button, self.split_button)
+        self.content = toga.Box(style=flex_column_right)
+        self.content.add(mode_row, self.summary, button_row)
+        self.update_plan(None)
+
+    def update_plan(self, widget, **kwargs):
+        """Plans the parts for the current options, once typing pauses, and shows how many there are."""
+        mode = self.modes.get(str(self.mode.value), 'every')
+        self.value.enabled = mode != 'bookmarks'
+        self.split_button.enabled = False
+        self.cancel_plan()
+        delay = self.plan_delay if widget is self.value else 0
+        self._plan_handle = asyncio.get_event_loop().call_later(delay, self.start_plan, mode, self.value.value, self._plan_generation)
+
+    def cancel_plan(self):
+        """Cancels the pending plan and discards the one being computed, if any."""
+        self._plan_generation += 1
+        if self._plan_handle is not None:
+            self._plan_handle.cancel()
+            self._plan_handle = None
+
+    def start_plan(self, mode:str, value:str, generation:int):
+        self._plan_handle = None
+        if mode == 'every':
+            try:
+                self.show_plan(split.plan_every(self.document.page_count, int(value)), mode)
+            except ValueError as e:
+                self.show_plan(e, mode)
+            return
+        # Walking the pages of large documents takes a while: planned without blocking the window
+        self.summary.text = _('Planning…')
+        task = asyncio.get_event_loop().run_in_executor(None, plan, self.document.file_path, mode, value)
+        task.add_done_callback(functools.partial(self.plan_done, mode=mode, generation=generation))
+
+    def plan_done(self, task, mode:str, generation:int):
+        if generation != self._plan_generation: # The options changed meanwhile
+            return
+        try:
+            self.show_plan(task.result(), mode)
+        except ValueError as e:
+            self.show_plan(e, mode)
+
+    def show_plan(self, parts:list[split.SplitPart]|ValueError, mode:str):
+        if isinstance(parts, ValueError):
+            self.parts = []
+            self.summary.text = str(parts) if mode == 'bookmarks' else _('Invalid value')
+        else:
+            self.parts = parts
+            self.summary.text = f'{len(self.parts)} {_("parts")}'
+        self.split_button.enabled = bool(self.parts)
+
+    def show_folder_dialog(self, widget, **kwargs):
+        dialog = toga.SelectFolderDialog(_('Choose destination folder'))
+        task = asyncio.create_task(self.dialog(dialog))
+        task.add_done_callback(self.folder_dialog_closed)
+
+    def folder_dialog_closed(self, task):
+        directory = task.result()
+        if directory:
+            self.split(directory)
+
+    def split(self, directory:Path):
+        loop = asyncio.get_event_loop()
+
+        def progress(done, total):
+            loop.call_soon_threadsafe(setattr, self.progress_bar, 'value', done)
+
+        self.cancel_plan()
+        for widget in (self.mode, self.value, self.cancel_button, self.split_button):
+            widget.enabled = False
+        self.progress_bar.max = len(self.parts)
+        self.progress_bar.value = 0
+        engine = split.SplitEngine(self.document.file_path, self.parts, progress=progress)
+        task = loop.run_in_executor(None, engine.run, directory)
+        task.add_done_callback(functools.partial(self.split_done, directory=directory))
+
+    def split_done(self, task, directory:Path):
+        try:
+            task.result()
+        except Exception as e:
+            dialog = toga.ErrorDialog(_('Error splitting file'), f'{_("Parts could not be saved at")} "{directory}":\n{e}')
+            asyncio.create_task(self.dialog(dialog))
+            for widget in (self.mode, self.value, self.cancel_button, self.split_button):
+                widget.enabled = True
+            return
+        self.do_close()
+
+    def prepare_to_close(self, window, **kwargs) -> Literal[True]:
+        # The document is shared with its tab: only this window's reference is released
+        self.cancel_plan()
+        if not self._released:
+            document_pool.release(self.document)
+            self._released = True
+        return True
+
+    def do_close(self, *args, **kwargs):
+        self.prepare_to_close(self)
+        self.close()
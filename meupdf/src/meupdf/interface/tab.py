@@ -1,36 +1,130 @@
-import shutil, asyncio
+import asyncio, json
 from pathlib import Path
 
 import toga
 from toga.style import pack
 
 from meupdf.documents.pdf import PDFDocument
+from meupdf.documents.pool import document_pool
+from meupdf.documents.search import search_indexer
+from meupdf.interface.tab_budget import tab_budget, view_fragment
+from meupdf.interface.viewserver import ViewServer
+from meupdf.metrics import metrics
 
 class DocumentTab(toga.OptionItem):
     file_path:Path
-    document:PDFDocument
     view:toga.WebView
     server_dir:Path
     files_uri:Path
+    url:str # URL path of the document in the view server
     host:str
     port:int
+    evicted:bool # Whether the document was released and the view unloaded to save memory
+    state:dict|None # Page and zoom of the view when it was evicted
+    ready_script = '''
+        var injectedCSS = "#downloadButton {display: none;}";
+        var css = document.createElement("style");
+        css.textContent = injectedCSS;
+        document.body.append(css);
+    '''
+    # Changes are unsaved when the annotation storage differs from what the last save sent
+    # (app.meupdfSaved, see MainWindow.save): the storage itself is not emptied by saves
+    state_script = '''(function () {
+        var app = window.PDFViewerApplication;
+        if (!app || !app.pdfDocument) return null;
+        var sent = app.meupdfSaved ? app.meupdfSaved.sent : new Map();
+        var map = app.pdfDocument.annotationStorage.serializable.map || new Map();
+        var modified = map.size != sent.size;
+        for (var [id, value] of map) {
+            if (modified) break;
+            modified = sent.get(id) !== JSON.stringify(value, function(k, v) { return ArrayBuffer.isView(v) ? Array.from(v) : v; });
+        }
+        return JSON.stringify({
+            page: app.page,
+            zoom: app.pdfViewer.currentScaleValue,
+            modified: modified,
+        });
+    })()'''
 
     def __init__(self, file_path, server_dir, files_uri, host, port, *args, **kwargs):
-        ready_script = '''
-            var injectedCSS = "#downloadButton {display: none;}";
-            var css = document.createElement("style");
-            css.textContent = injectedCSS;
-            document.body.append(css);
-        '''
         self.view = toga.WebView(style=pack.Pack(flex=1))
-        self.view.on_webview_load = lambda widget, **kwargs: widget.evaluate_javascript(ready_script)
+        self.view.on_webview_load = lambda widget, **kwargs: widget.evaluate_javascript(self.ready_script)
         super().__init__(text=Path(file_path).name, content=self.view, *args, **kwargs)
         self.server_dir, self.files_uri, self.host, self.port = server_dir, files_uri, host, port
         self.file_path = file_path
-        self.document = PDFDocument(self.file_path)
-        shutil.copyfile(file_path, server_dir / files_uri / self.document.hashed_path('.pdf'))
-        task = asyncio.create_task(self.view.load_url(f'http://{host}:{port}/web/viewer.html?file=/{files_uri}/{self.document.hashed_path('.pdf')}'))
-        task.add_done_callback(lambda task: self.view.evaluate_javascript(ready_script))
+        self._document:PDFDocument|None = document_pool.acquire(self.file_path) # pyright: ignore[reportAttributeAccessIssue]
+        self.evicted = False
+        self.state = None
+        self._uses = 0 # Incremented on each use, so an eviction started before is abandoned
+        self.url = ViewServer.publish(file_path, server_dir, files_uri, self._document.fingerprint()) # pyright: ignore[reportOptionalMemberAccess]
+        search_indexer.submit(self.file_path)
+        self.load_view()
+        tab_budget.touch(self)
+
+    @property
+    def document(self) -> PDFDocument:
+        """The document of the tab. It is reopened if the tab was evicted."""
+        if self._document is None:
+            self._document = document_pool.acquire(self.file_path) # pyright: ignore[reportAttributeAccessIssue]
+        return self._document # pyright: ignore[reportReturnType]
+
+    @property
+    def loaded(self) -> bool:
+        return not self.evicted
+
+    def load_view(self, fragment:str=''):
+        url = f'http://{self.host}:{self.port}{ViewServer.viewer_url}?file={self.url}{fragment}'
+        task = asyncio.create_task(self.view.load_url(url))
+        task.add_done_callback(lambda task: self.view.evaluate_javascript(self.ready_script))
+
+    async def evict(self) -> bool:
+        """
+        Releases the document and unloads the view, keeping their page and zoom. Tabs whose view
+        has unsaved changes, or is still loading, are kept.
+
+        :return: whether the tab was evicted
+        :rtype: bool
+        """
+        if self.evicted:
+            return False
+        uses = self._uses
+        try:
+            result = await self.view.evaluate_javascript(self.state_script)
+        except Exception:
+            return False
+        state = json.loads(result) if isinstance(result, str) and result else None
+        if state is None or state.get('modified') or uses != self._uses:
+            return False
+        self.evicted = True
+        self.state = state
+        self.view.url = 'about:blank'
+        if self._document is not None:
+            document_pool.release(self._document)
+            self._document = None
+        metrics.increment('tabs.evicted')
+        return True
+
+    def restore(self):
+        """Marks the tab as used and, if it was evicted, loads its view at the former page and zoom."""
+        self._uses += 1
+        tab_budget.touch(self)
+        if not self.evicted:
+            return
+        self.evicted = False
+        self.load_view(view_fragment(self.state))
+        metrics.increment('tabs.restored')
 
     def close(self):
-        self.document.close()
+        tab_budget.forget(self)
+        ViewServer.unpublish(self.url, self.server_dir)
+        if self._document is not None:
+            document_pool.release(self._document)
+            self._document = None
+
+    def open_document(self, file_path:Path|str):
+        """Switches to the document of another file, such as a copy saved with Save As."""
+        document = self._document
+        self.file_path = Path(file_path)
+        self._document = document_pool.acquire(self.file_path) # pyright: ignore[reportAttributeAccessIssue]
+        if document is not None:
+            document_pool.release(document)
@@ -0,0 +1,93 @@
+"""Memory budget of document tabs
+
+Each loaded tab holds a pymupdf document and a pdf.js WebView. Tabs that stay idle for
+idle_timeout seconds are evicted, as are the least recently used tabs while the estimated memory
+of the loaded ones exceeds the budget. An evicted tab releases its document and unloads its view;
+both are restored, at the same page and zoom, when the tab is selected again.
+
+Memory is estimated per tab as a fixed cost for the view plus a multiple of the file size (pdf.js
+and mupdf both keep parsed copies of the document), which is enough to rank tabs and bound growth.
+"""
+import os, time
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING: # Tabs only need file_path and loaded
+    from meupdf.interface.tab import DocumentTab
+
+class TabBudget(object):
+    budget:int
+    idle_timeout:float
+    view_cost:int = 64 * 1024**2 # Estimated bytes of a pdf.js WebView, without the document
+    size_factor:int = 2 # Estimated bytes per byte of the file, for the document and the view
+
+    def __init__(self, budget:int=1024**3, idle_timeout:float=30 * 60):
+        """
+        Inits a tab budget.
+
+        :param budget: estimated bytes the loaded tabs may use
+        :type budget: int
+        :param idle_timeout: seconds after which a tab that was not selected is evicted
+        :type idle_timeout: float
+        """
+        self.budget = budget
+        self.idle_timeout = idle_timeout
+        self._used:OrderedDict[int, tuple['DocumentTab', float]] = OrderedDict() # id(tab): (tab, last use), least recent first
+
+    def touch(self, tab:'DocumentTab', now:float|None=None):
+        """Marks a tab as used now, such as when it is selected."""
+        self._used.pop(id(tab), None)
+        self._used[id(tab)] = tab, time.monotonic() if now is None else now
+
+    def forget(self, tab:'DocumentTab'):
+        """Stops tracking a closed tab."""
+        self._used.pop(id(tab), None)
+
+    def cost(self, tab:'DocumentTab') -> int:
+        try:
+            size = os.stat(tab.file_path).st_size
+        except OSError:
+            size = 0
+        return self.view_cost + self.size_factor * size
+
+    def usage(self) -> int:
+        """Returns the estimated bytes used by the loaded tabs."""
+        return sum(self.cost(tab) for tab, _ in self._used.values() if tab.loaded)
+
+    def victims(self, current:object=None, now:float|None=None) -> list['DocumentTab']:
+        """
+        Returns the tabs to evict, least recently used first: the idle ones, then as many as needed
+        to fit the budget. The current tab is never evicted.
+        """
+        now = time.monotonic() if now is None else now
+        loaded = [(tab, used) for tab, used in self._used.values() if tab.loaded]
+        total = sum(self.cost(tab) for tab, _ in loaded)
+        victims = []
+        for tab, used in loaded:
+            if tab is current:
+                continue
+            if now - used >= self.idle_timeout or total > self.budget:
+                victims.append(tab)
+                total -= self.cost(tab)
+        return victims
+
+def view_fragment(state:dict|None) -> str:
+    """
+    Returns the pdf.js URL fragment that opens a document at the page and zoom of a saved view
+    state ({'page': 3, 'zoom': '1.25'} gives "#page=3&zoom=125"). Zoom may also be a pdf.js keyword
+    such as "page-fit".
+    """
+    if not state:
+        return ''
+    parts = []
+    if state.get('page'):
+        parts.append(f'page={int(state["page"])}')
+    zoom = state.get('zoom')
+    if zoom:
+        try:
+            parts.append(f'zoom={round(float(zoom) * 100)}')
+        except ValueError:
+            parts.append(f'zoom={zoom}')
+    return '#' + '&'.join(parts) if parts else ''
+
+tab_budget = TabBudget()
@@ -0,0 +1,218 @@
+"""Page thumbnail cache and background renderer
+
+Thumbnails are kept in a bounded in-memory LRU and in a size-capped directory (usually under
+``app.paths.cache``), so a thumbnail that has already been rendered, in this session or in a
+previous one, costs a lookup instead of a rasterization. Cache misses are rendered by a bounded
+pool of worker processes, so the event loop is never blocked by rasterization.
+"""
+import asyncio, multiprocessing, os, threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from meupdf.documents.generic import GenericDocument
+
+class ThumbnailCache(object):
+    directory:Path|None
+    memory_limit:int
+    disk_limit:int
+    suffix:str = '.thumb'
+
+    def __init__(self, directory:Path|str|None=None, memory_limit:int=256, disk_limit:int=64*1024*1024):
+        """
+        Inits a thumbnail cache.
+
+        :param directory: directory of the on-disk tier. If ommited, only the memory tier is used
+        until a directory is assigned.
+        :type directory: Path | str | None
+        :param memory_limit: maximum number of thumbnails kept in memory
+        :type memory_limit: int
+        :param disk_limit: maximum size of the on-disk tier, in bytes
+        :type disk_limit: int
+        """
+        self.directory = Path(directory) if directory else None
+        self.memory_limit, self.disk_limit = memory_limit, disk_limit
+        self._memory:OrderedDict[str, bytes] = OrderedDict()
+        self._disk_usage:int|None = None # Computed on first disk write
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(fingerprint:str, page:int, size:int, rotation:int=0) -> str:
+        return f'{fingerprint}-{page}-{size}-{rotation % 360}'
+
+    def _path(self, key:str) -> Path:
+        return self.directory / (key + self.suffix) # type: ignore
+
+    def get(self, key:str) -> bytes|None:
+        """Returns cached thumbnail data or None if it is not cached."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+        if self.directory is None:
+            return None
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path) # Keeps on-disk eviction least recently used
+        except OSError:
+            return None
+        self._remember(key, data)
+        return data
+
+    def put(self, key:str, data:bytes):
+        self._remember(key, data)
+        if self.directory is None:
+            return
+        try:
+            self._write(key, data)
+        except OSError:
+            pass # The disk tier is an optimization only
+
+    def get_or_render(self, key:str, render) -> bytes:
+        """
+        Returns cached thumbnail data, calling render() and caching its result on a miss.
+
+        :param render: function without arguments returning thumbnail data
+        """
+        data = self.get(key)
+        if data is None:
+            data = render()
+            self.put(key, data)
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self.directory is not None:
+                for path in self.directory.glob('*' + self.suffix):
+                    try:
+                        path.unlink()
+                    except OSError:
+                        pass
+            self._disk_usage = 0
+
+    def _remember(self, key:str, data:bytes):
+        with self._lock:
+            self._memory[key] = data
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_limit:
+                self._memory.popitem(last=False)
+
+    def _write(self, key:str, data:bytes):
+        self.directory.mkdir(parents=True, exist_ok=True) # type: ignore
+        path = self._path(key)
+        temp = path.with_suffix(f'.{threading.get_ident()}.tmp')
+        temp.write_bytes(data)
+        os.replace(temp, path)
+        with self._lock:
+            if self._disk_usage is None:
+                self._disk_usage = sum(f.stat().st_size for f in self.directory.glob('*' + self.suffix)) # type: ignore
+            else:
+                self._disk_usage += len(data)
+            if self._disk_usage > self.disk_limit:
+                self._evict()
+
+    def _evict(self):
+        """Deletes least recently used files until the disk tier is 90% of its limit."""
+        files = []
+        for path in self.directory.glob('*' + self.suffix): # type: ignore
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime_ns, stat.st_size, path))
+        files.sort()
+        usage = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if usage <= self.disk_limit * 0.9:
+                break
+            try:
+                path.unlink()
+                usage -= size
+            except OSError:
+                pass
+        self._disk_usage = usage
+
+# 1x1 light gray PNG shown while a thumbnail is rendered
+PLACEHOLDER = b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x00\x00\x00\x00:~\x9bU' \
+              b'\x00\x00\x00\nIDATx\x9ccx\x00\x00\x00\xe2\x00\xe1\x15vD\x00\x00\x00\x00\x00IEND\xaeB`\x82'
+
+_worker_documents:OrderedDict = OrderedDict() # Documents kept open by each worker process
+
+def render_thumbnail(file_path:str, page:int, size:int, rotation:int=0) -> bytes:
+    """Renders a thumbnail in a worker process. The last few documents are kept open."""
+    import meupdf.documents.pdf # Registers the PDF format in the worker process
+    from meupdf.documents.generic import get_document_class
+
+    key = file_path, os.stat(file_path).st_mtime_ns
+    if key in _worker_documents:
+        _worker_documents.move_to_end(key)
+    else:
+        _worker_documents[key] = get_document_class(file_path)(file_path)
+        while len(_worker_documents) > 4:
+            _worker_documents.popitem(last=False)[1].close()
+    return _worker_documents[key].pages[page].to_thumbnail(size, rotation=rotation)
+
+class ThumbnailRenderer(object):
+    cache:ThumbnailCache
+    max_workers:int
+    _executor:ProcessPoolExecutor|None = None
+
+    def __init__(self, cache:ThumbnailCache, max_workers:int|None=None):
+        """
+        Inits a background thumbnail renderer.
+
+        :param cache: cache looked up before rendering and filled with rendered thumbnails
+        :type cache: ThumbnailCache
+        :param max_workers: maximum number of concurrent renders. Defaults to half the CPUs, up to 4.
+        :type max_workers: int | None
+        """
+        self.cache = cache
+        self.max_workers = max_workers or max(1, min(4, (os.cpu_count() or 2) // 2))
+
+    def request(self, document:GenericDocument, page:int, size:int, rotation:int=0) -> asyncio.Future:
+        """
+        Requests a thumbnail. Must be called from the event loop thread.
+
+        Cancelling the returned future drops the request if its rendering has not started yet.
+
+        :return: future resolved with the encoded thumbnail
+        :rtype: asyncio.Future[bytes]
+        """
+        loop = asyncio.get_event_loop()
+        try:
+            key = self.cache.key(document.fingerprint(), page, size, rotation)
+        except (ValueError, OSError):
+            # Not a file: rendered on the spot
+            future = loop.create_future()
+            try:
+                future.set_result(document.pages[page].to_thumbnail(size, rotation=rotation))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        data = self.cache.get(key)
+        if data is not None:
+            future = loop.create_future()
+            future.set_result(data)
+            return future
+
+        if self._executor is None:
+            # Spawned, since forking a process running the GUI toolkit and the view server is unsafe
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+        def store(future):
+            if not future.cancelled() and future.exception() is None:
+                self.cache.put(key, future.result())
+
+        future = loop.run_in_executor(self._executor, render_thumbnail, str(document.file_path), page, size, rotation)
+        future.add_done_callback(store)
+        return future
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+thumbnail_cache = ThumbnailCache()
+thumbnail_renderer = ThumbnailRenderer(thumbnail_cache)
@@ -1,50 +1,272 @@
-import sys, asyncio
+import sys, asyncio, contextlib, gzip, io, json, os, secrets, shutil, threading, time, urllib.parse, zipfile
 from random import randint
 from functools import partial
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+from http import HTTPStatus
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
 from pathlib import Path
 
+from meupdf.documents.generic import UnsupportedChanges
+from meupdf.documents.mapping import FileMapping, file_mappings
+from meupdf.metrics import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None # Assets are only gzipped
+
+MAX_RANGES = 64 # Larger range sets are answered with the whole file
+
+def parse_byte_ranges(header:str|None, size:int) -> list[tuple[int, int]]|None:
+    """
+    Parses a Range header (RFC 9110) for a resource of the given size.
+
+    :param header: Range header value
+    :type header: str | None
+    :param size: resource size in bytes
+    :type size: int
+    :return: None if the header is absent, invalid or must be ignored (the whole resource is sent),
+    an empty list if no range can be satisfied or the (first, last) byte ranges, last included
+    :rtype: list[tuple[int, int]] | None
+    """
+    if not header:
+        return None
+    unit, _, specs = header.partition('=')
+    if unit.strip().lower() != 'bytes':
+        return None
+    ranges = []
+    for spec in specs.split(','):
+        first, dash, last = spec.strip().partition('-')
+        if not dash:
+            return None
+        try:
+            if not first: # Suffix range: last bytes
+                length = int(last)
+                if length < 0:
+                    return None
+                if length:
+                    ranges.append((max(0, size - length), size - 1))
+                continue
+            first_byte = int(first)
+            last_byte = int(last) if last else None
+        except ValueError:
+            return None
+        if first_byte < 0 or last_byte is not None and last_byte < first_byte:
+            return None
+        if last_byte is None:
+            last_byte = size - 1
+        if first_byte < size:
+            ranges.append((first_byte, min(last_byte, size - 1)))
+    if len(ranges) > MAX_RANGES:
+        return None
+    return ranges
+
+REMOTE_FILE_SYSTEMS = ('nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'fuse.sshfs', 'fuse.rclone', '9p')
+
+def needs_local_copy(file_path:Path|str) -> bool:
+    """
+    Tells whether a file lives on a medium it should not be served from directly (network shares
+    and, on Windows, removable drives), since it may disappear or be slow to read repeatedly.
+    """
+    file_path = Path(file_path).resolve()
+    if sys.platform == 'win32':
+        if file_path.drive.startswith('\\\\'): # UNC path
+            return True
+        import ctypes
+        DRIVE_REMOVABLE, DRIVE_REMOTE = 2, 4
+        return ctypes.windll.kernel32.GetDriveTypeW(file_path.drive + '\\') in (DRIVE_REMOVABLE, DRIVE_REMOTE) # type: ignore
+    try:
+        with open('/proc/self/mounts', encoding='utf-8') as mounts:
+            mount_points = [line.split()[1:3] for line in mounts]
+    except OSError:
+        return False # Mounts are unknown: the file is served directly
+    fs_type, length = '', -1
+    for mount_point, mount_type in mount_points:
+        mount_point = mount_point.replace('\\040', ' ')
+        if file_path.is_relative_to(mount_point) and len(mount_point) > length:
+            fs_type, length = mount_type, len(mount_point)
+    return fs_type in REMOTE_FILE_SYSTEMS
+
+class ZipAssets(object):
+    """
+    Static assets served straight from a zip file (the pdf.js distribution), instead of being
+    extracted at every startup. Members are indexed on first use and mounted under a prefix named
+    after the zip file, so they can be cached by the web view as immutable. Compressible members
+    are gzip and, when the brotli module is available, brotli encoded once and kept in memory.
+    """
+    zip_path:Path
+    prefix:str
+    cache_control:str = 'public, max-age=31536000, immutable'
+    compressible_types = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+    compressible_extensions = ('.ftl', '.map', '.mjs', '.json')
+    min_compressed_size:int = 1024
+
+    def __init__(self, zip_path:Path|str, prefix:str|None=None):
+        self.zip_path = Path(zip_path)
+        self.prefix = prefix if prefix is not None else '/' + self.zip_path.stem
+        self._zip:zipfile.ZipFile|None = None
+        self._index:dict[str, zipfile.ZipInfo] = {}
+        self._encoded:dict[tuple[str, str], bytes] = {}
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._zip is None:
+                self._zip = zipfile.ZipFile(self.zip_path)
+                self._index = {f'{self.prefix}/{info.filename}': info for info in self._zip.infolist() if not info.is_dir()}
+
+    def get(self, url:str) -> zipfile.ZipInfo|None:
+        """Returns the member served at url, if any."""
+        if not url.startswith(self.prefix + '/'):
+            return None
+        self._load()
+        return self._index.get(url)
+
+    def read(self, info:zipfile.ZipInfo) -> bytes:
+        return self._zip.read(info) # type: ignore
+
+    @staticmethod
+    def etag(info:zipfile.ZipInfo, encoding:str='') -> str:
+        return f'"{info.CRC:08x}-{info.file_size:x}{"-" + encoding if encoding else ""}"'
+
+    def compressible(self, info:zipfile.ZipInfo, content_type:str) -> bool:
+        return info.file_size >= self.min_compressed_size and (content_type.startswith(self.compressible_types)
+            or info.filename.endswith(self.compressible_extensions))
+
+    def encoded(self, info:zipfile.ZipInfo, encoding:str) -> bytes:
+        """Returns the member encoded with 'gzip' or 'br', compressing it on the first request."""
+        key = info.filename, encoding
+        data = self._encoded.get(key)
+        if data is None:
+            if encoding == 'br':
+                data = brotli.compress(self.read(info), quality=9) # type: ignore
+            else:
+                data = gzip.compress(self.read(info), compresslevel=9, mtime=0)
+            with self._lock:
+                self._encoded[key] = data
+        return data
+
+    @staticmethod
+    def accepted_encodings(header:str|None) -> list[str]:
+        encodings = []
+        for item in (header or '').split(','):
+            name, _, parameters = item.strip().partition(';')
+            if parameters.replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+                continue
+            encodings.append(name.strip().lower())
+        return encodings
+
+class ExpectationStore(object):
+    """Thread-safe store of expected save operations. Expectations expire after ttl seconds."""
+    ttl:float
+
+    def __init__(self, ttl:float=600):
+        self.ttl = ttl
+        self._items:dict[int, tuple[float, tuple]] = {}
+        self._lock = threading.Lock()
+
+    def _purge(self, now:float):
+        for key in [key for key, (deadline, _) in self._items.items() if deadline < now]:
+            del self._items[key]
+
+    def add(self, value:tuple) -> int:
+        """Stores value and returns its new random key."""
+        with self._lock:
+            now = time.monotonic()
+            self._purge(now)
+            key:int = randint(0, sys.maxsize)
+            while key in self._items:
+                key = randint(0, sys.maxsize)
+            self._items[key] = now + self.ttl, value
+            return key
+
+    def pop(self, key:int) -> tuple:
+        with self._lock:
+            self._purge(time.monotonic())
+            if key not in self._items:
+                raise KeyError(f'{key} is not expected')
+            return self._items.pop(key)[1]
+
+    def __len__(self):
+        with self._lock:
+            self._purge(time.monotonic())
+            return len(self._items)
+
+class MappedBody(object):
+    """Body of a response served from a file mapping shared with an open document."""
+
+    def __init__(self, mapping:FileMapping):
+        self.mapping = mapping
+
+    def close(self):
+        if self.mapping is not None:
+            file_mappings.release(self.mapping)
+            self.mapping = None
+
+class UploadError(Exception):
+    """Request body not accepted, answered with the given HTTP status code."""
+    def __init__(self, code:int, message:str):
+        super().__init__(message)
+        self.code = code
+
 class ViewServer(SimpleHTTPRequestHandler):
     port:int = 0
     host:str = 'localhost'
-    _expectations:dict = {}
+    protocol_version = 'HTTP/1.1' # Keeps connections alive between pdf.js requests
+    disable_nagle_algorithm = True # Otherwise headers and body writes wait for delayed ACKs
+    _expectations:ExpectationStore = ExpectationStore()
+    _published:dict[str, Path] = {} # URL path: original file
+    _local_copies:set[Path] = set() # Published files copied into the files directory
+    _published_lock = threading.Lock()
+    assets:ZipAssets|None = None
+    viewer_url:str = '/web/viewer.html'
+    metrics_url:str = '/__metrics' # Served only when metrics are enabled, with the trace under /trace
+    _request_start:float|None = None
+    _status:int = 0 # Of the current response
+    _sent:int = 0 # Body bytes of the current response
     content_types = ('application/pdf',)
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.extensions_map.update({
-            '.html': 'text/html',
-            '.css': 'text/css',
-            '.mjs': 'text/javascript',
-            '.js': 'text/javascript',
-            '.svg': 'image/svg+xml',
-            '.pdf': 'application/pdf',
-        })
-        if not self.__class__.port:
-            from meupdf.app import MeuPDF
-            self.__class__.port = MeuPDF.port
-            self.__class__.host = MeuPDF.host
+    changes_content_type = 'application/json'
+    max_changes_size:int = 64 * 1024 * 1024 # Bytes accepted by an annotation changes POST
+    max_upload_size:int = 4 * 1024**3 # Bytes accepted by a POST save
+    upload_chunk_size:int = 1024 * 1024
+    replace_attempts:int = 5 # Attempts to replace a saved file that is in use (Windows)
+    replace_delay:float = 0.1 # Seconds before the second attempt, doubled for each next one
+    # Whether saved documents go through the lossless optimization pipeline. Off in the app: it
+    # renumbers objects, which pdf.js keeps referring to, and drops incremental updates and signatures
+    optimize_saves:bool = False
+    extensions_map = {
+        **SimpleHTTPRequestHandler.extensions_map,
+        '.html': 'text/html',
+        '.css': 'text/css',
+        '.mjs': 'text/javascript',
+        '.js': 'text/javascript',
+        '.svg': 'image/svg+xml',
+        '.pdf': 'application/pdf',
+        '.ftl': 'text/plain',
+    }
 
     @classmethod
-    def create_expectation(cls, path:str|Path, hash:int, referer:str, callback=None) -> int:
+    def create_expectation(cls, path:str|Path, fingerprint:str, referer:str, callback=None, apply=None) -> int:
         """
         Creates an expected file save operation. This will be used on the POST handshake and will
-        optionally call a callback function.
+        optionally call a callback function. Expectations not used within the store's TTL expire.
+
+        If apply is given, the POST body is expected to hold annotation changes as JSON instead of
+        the whole document. They are passed to apply, which writes them to the file and may raise
+        UnsupportedChanges: the request is then answered with 409 Conflict and the callback is not
+        called, since the viewer falls back to saving the whole document.
 
         :param path: file path
         :type path: str | Path
-        :param hash: hashed file path
-        :type hash: int
+        :param fingerprint: fingerprint of the document being saved
+        :type fingerprint: str
         :param callback: callback function with (e:Exception|None) signature
         :type callback: function | None
+        :param apply: function with (changes:dict) signature
+        :type apply: function | None
         :return: POST handshake key
         :rtype: int
         """
-        key:int = randint(0, sys.maxsize)
-        while key in cls._expectations:
-            key = randint(0, sys.maxsize)
-        cls._expectations[key] = path, hash, referer, callback
-        return key
+        return cls._expectations.add((path, fingerprint, referer, callback, apply))
     
     @classmethod
     def retrieve_expectation(cls, key:int):
@@ -53,10 +275,393 @@ class ViewServer(SimpleHTTPRequestHandler):
         
         :param key: expected key
         """
-        key = int(key)
-        if key not in cls._expectations:
-            raise KeyError(f'{key} is not expected')
-        return cls._expectations.pop(key)
+        return cls._expectations.pop(int(key))
+
+    @classmethod
+    def publish(cls, file_path:Path|str, directory:Path, files_uri:Path|str, fingerprint:str|None=None) -> str:
+        """
+        Makes a file available to the viewer under an opaque URL. The file is served from its
+        original location, unless it lives on a medium that needs a local copy: then it is hard
+        linked or copied into the files directory. Copies are named after the file fingerprint,
+        if given, so a file opened again is only copied again if it changed.
+
+        :param file_path: file to serve
+        :type file_path: Path | str
+        :param directory: server directory
+        :type directory: Path
+        :param files_uri: files directory, relative to the server directory
+        :type files_uri: Path | str
+        :param fingerprint: fingerprint of the file contents
+        :type fingerprint: str | None
+        :return: URL path of the file
+        :rtype: str
+        """
+        file_path = Path(file_path)
+        token, suffix = secrets.token_urlsafe(16), file_path.suffix.lower()
+        url = f'/{Path(files_uri).as_posix()}/{token}{suffix}'
+        local_copy = None
+        if needs_local_copy(file_path):
+            local_copy = directory / files_uri / f'{fingerprint or token}{suffix}'
+            if not local_copy.exists():
+                try:
+                    os.link(file_path, local_copy)
+                except OSError:
+                    shutil.copyfile(file_path, local_copy)
+            file_path = local_copy
+        with cls._published_lock:
+            cls._published[url] = file_path
+            if local_copy is not None:
+                cls._local_copies.add(local_copy)
+        return url
+
+    @classmethod
+    def unpublish(cls, url:str, directory:Path):
+        """Stops serving a published file, deleting its local copy if no other URL serves it."""
+        with cls._published_lock:
+            path = cls._published.pop(url, None)
+            if path not in cls._local_copies or path in cls._published.values():
+                return
+            cls._local_copies.discard(path)
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+    @classmethod
+    def set_assets(cls, zip_path:Path|str, viewer:str='web/viewer.html'):
+        """Serves the viewer straight from a zip file."""
+        cls.assets = ZipAssets(zip_path)
+        cls.viewer_url = f'{cls.assets.prefix}/{viewer}'
+
+    def parse_request(self) -> bool:
+        self._request_start = time.perf_counter() # Once the request line is read: idle connections are not timed
+        self._status = 0
+        self._sent = 0
+        return super().parse_request()
+
+    def handle_one_request(self):
+        self._request_start = None
+        super().handle_one_request()
+        if self._request_start is not None and metrics.enabled:
+            metrics.record(f'server.{self.command or "invalid"}', self._request_start,
+                           time.perf_counter() - self._request_start, path=self.path, status=self._status)
+            metrics.increment(f'server.status.{self._status}')
+            metrics.increment('server.bytes_sent', self._sent)
+
+    def log_request(self, code='-', size='-'):
+        self._status = int(code) if isinstance(code, int) else 0
+        super().log_request(code, size)
+
+    def send_head(self):
+        self._ranges = None
+        url = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path)
+        if metrics.enabled and url in (self.metrics_url, f'{self.metrics_url}/trace'):
+            return self.send_metrics_head(url)
+        if self.assets is not None:
+            info = self.assets.get(url)
+            if info is not None:
+                return self.send_asset_head(info)
+        with self.__class__._published_lock:
+            published = self.__class__._published.get(url)
+        path = str(published) if published else self.translate_path(self.path)
+        if os.path.isdir(path) or path.endswith('/'):
+            return super().send_head()
+        mapping = file_mappings.share(path) # Mapped by an open document: read from the same pages
+        if mapping is not None:
+            body = MappedBody(mapping)
+            try:
+                etag = f'"{mapping.mtime_ns:x}-{mapping.size:x}"'
+                if self.send_file_head(mapping.size, self.guess_type(path), mapping.mtime_ns / 1e9, etag):
+                    return body
+            except:
+                body.close()
+                raise
+            body.close()
+            return None
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            self.send_error(HTTPStatus.NOT_FOUND, 'File not found')
+            return None
+        try:
+            stat = os.fstat(f.fileno())
+            if self.send_file_head(stat.st_size, self.guess_type(path), stat.st_mtime, f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'):
+                return f
+            f.close()
+            return None
+        except:
+            f.close()
+            raise
+
+    def send_asset_head(self, info:zipfile.ZipInfo):
+        """Sends the headers of a zipped asset, choosing its encoding, and returns its body."""
+        content_type = self.guess_type(info.filename)
+        headers = {'Cache-Control': self.assets.cache_control} # type: ignore
+        encoding = ''
+        if self.assets.compressible(info, content_type): # type: ignore
+            headers['Vary'] = 'Accept-Encoding'
+            accepted = ZipAssets.accepted_encodings(self.headers.get('Accept-Encoding'))
+            if brotli is not None and 'br' in accepted:
+                encoding = 'br'
+            elif 'gzip' in accepted:
+                encoding = 'gzip'
+        if encoding:
+            headers['Content-Encoding'] = encoding
+            data = self.assets.encoded(info, encoding) # type: ignore
+        else:
+            data = self.assets.read(info) # type: ignore
+        mtime = time.mktime(info.date_time + (0, 0, -1))
+        if self.send_file_head(len(data), content_type, mtime, ZipAssets.etag(info, encoding), headers):
+            return io.BytesIO(data)
+        return None
+
+    def send_metrics_head(self, url:str):
+        """Sends the headers of the metrics snapshot or of the Chrome trace, and returns its body."""
+        data = json.dumps(metrics.trace() if url.endswith('/trace') else metrics.snapshot()).encode('utf-8')
+        if self.send_file_head(len(data), 'application/json', headers={'Cache-Control': 'no-store'}):
+            return io.BytesIO(data)
+        return None
+
+    def send_file_head(self, size:int, content_type:str, mtime:float|None=None, etag:str|None=None,
+                       headers:dict[str, str]|None=None) -> bool:
+        """
+        Sends the headers of a file response, honouring If-None-Match, Range and If-Range headers.
+
+        :param headers: additional headers of successful responses
+        :type headers: dict[str, str] | None
+        :return: whether the body must be sent with copyfile()
+        :rtype: bool
+        """
+        headers = headers or {}
+        if etag and etag in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header('ETag', etag)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            return False
+
+        ranges = parse_byte_ranges(self.headers.get('Range'), size)
+        if_range = self.headers.get('If-Range')
+        if ranges is not None and if_range:
+            if if_range.startswith('"') or if_range.startswith('W/'):
+                if if_range != etag:
+                    ranges = None
+            elif mtime is None or if_range != self.date_time_string(int(mtime)):
+                ranges = None
+        if ranges == []:
+            self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+            self.send_header('Content-Range', f'bytes */{size}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return False
+
+        if ranges is None:
+            self.send_response(HTTPStatus.OK)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(size))
+        elif len(ranges) == 1:
+            first, last = ranges[0]
+            self.send_response(HTTPStatus.PARTIAL_CONTENT)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Range', f'bytes {first}-{last}/{size}')
+            self.send_header('Content-Length', str(last - first + 1))
+        else:
+            boundary = f'{randint(0, sys.maxsize):x}{randint(0, sys.maxsize):x}'
+            parts = [(f'--{boundary}\r\nContent-Type: {content_type}\r\n'
+                      f'Content-Range: bytes {first}-{last}/{size}\r\n\r\n').encode('ascii') for first, last in ranges]
+            end = f'--{boundary}--\r\n'.encode('ascii')
+            length = sum(len(part) + last - first + 1 + 2 for part, (first, last) in zip(parts, ranges)) + len(end)
+            self.send_response(HTTPStatus.PARTIAL_CONTENT)
+            self.send_header('Content-Type', f'multipart/byteranges; boundary={boundary}')
+            self.send_header('Content-Length', str(length))
+            ranges = [(first, last, part) for part, (first, last) in zip(parts, ranges)] + [(0, -1, end)]
+        self.send_header('Accept-Ranges', 'bytes')
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if mtime is not None:
+            self.send_header('Last-Modified', self.date_time_string(int(mtime)))
+        if etag:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self._ranges = ranges
+        return True
+
+    def copyfile(self, source, outputfile):
+        """Sends the whole file or the requested ranges of it."""
+        ranges = getattr(self, '_ranges', None)
+        if not ranges:
+            self.send_range(source, 0, None)
+        elif len(ranges[0]) == 2:
+            first, last = ranges[0]
+            self.send_range(source, first, last - first + 1)
+        else:
+            for first, last, part in ranges:
+                outputfile.write(part)
+                if last >= first:
+                    self.send_range(source, first, last - first + 1)
+                    outputfile.write(b'\r\n')
+
+    def send_range(self, source, offset:int, count:int|None):
+        """Sends count bytes of source from offset from its mapping or with sendfile() when available."""
+        if isinstance(source, MappedBody):
+            with contextlib.closing(source.mapping.chunks(offset, count)) as chunks: # pyright: ignore[reportOptionalMemberAccess]
+                for chunk in chunks:
+                    self.wfile.write(chunk)
+                    self._sent += len(chunk)
+            return
+        try:
+            source.fileno()
+        except (AttributeError, OSError):
+            source.seek(offset)
+            if count is None:
+                count = sys.maxsize
+            while count > 0:
+                data = source.read(min(count, 64 * 1024))
+                if not data:
+                    break
+                self.wfile.write(data)
+                count -= len(data)
+                self._sent += len(data)
+            return
+        self._sent += self.connection.sendfile(source, offset, count)
+
+    def respond(self, code:int, message:str):
+        """Sends a complete response. The connection is closed if the request body was not read."""
+        body = message.encode('utf-8')
+        self.send_response(code, message)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if code >= 400:
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self, limit:int|None=None):
+        """
+        Yields the request body in chunks, whether it is sent with a Content-Length or with
+        chunked transfer encoding. Raises UploadError if the body is larger than limit, which
+        defaults to max_upload_size.
+        """
+        limit = limit or self.__class__.max_upload_size
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            received = 0
+            while True:
+                line = self.rfile.readline(1024)
+                try:
+                    size = int(line.split(b';', 1)[0].strip(), 16)
+                except ValueError:
+                    raise UploadError(400, 'Malformed chunk')
+                if size == 0:
+                    while self.rfile.readline(1024) not in (b'\r\n', b'\n', b''): # Trailers
+                        pass
+                    return
+                received += size
+                if received > limit:
+                    raise UploadError(413, 'Request body too large')
+                while size > 0:
+                    data = self.rfile.read(min(size, self.__class__.upload_chunk_size))
+                    if not data:
+                        raise UploadError(400, 'Incomplete request body')
+                    size -= len(data)
+                    yield data
+                self.rfile.readline(1024) # Chunk terminator
+        else:
+            try:
+                remaining = int(self.headers['Content-Length'])
+            except (TypeError, ValueError):
+                raise UploadError(411, 'Length required')
+            if remaining > limit:
+                raise UploadError(413, 'Request body too large')
+            while remaining > 0:
+                data = self.rfile.read(min(remaining, self.__class__.upload_chunk_size))
+                if not data:
+                    raise UploadError(400, 'Incomplete request body')
+                remaining -= len(data)
+                yield data
+
+    def receive_file(self, path:str|Path) -> int:
+        """
+        Writes the request body to path. The body is streamed to a temporary file next to it,
+        which only replaces path once it is complete and flushed to disk, so an interrupted save
+        never leaves a truncated file behind. If optimize_saves is set, the file is optimized before
+        replacing path; should that fail, it is kept as received.
+
+        Where open files cannot be replaced (Windows), replacing is retried replace_attempts times
+        with a growing delay. Should path still be in use, UploadError 503 is raised and the
+        received file is kept next to it, so the save is not lost.
+
+        :param path: destination file
+        :type path: str | Path
+        :return: number of bytes written
+        :rtype: int
+        """
+        path = Path(path)
+        if path.is_dir():
+            raise IsADirectoryError(21, 'Is a directory', str(path))
+        temp_path = path.with_name(f'.{path.name}.{threading.get_ident()}.part')
+        size = 0
+        received = False
+        try:
+            with open(temp_path, 'wb') as f:
+                for data in self.read_body():
+                    f.write(data)
+                    size += len(data)
+                f.flush()
+                os.fsync(f.fileno())
+            if self.__class__.optimize_saves:
+                self.optimize_file(temp_path)
+            try:
+                shutil.copymode(path, temp_path) # Keeps the permissions of the original file
+            except OSError:
+                pass
+            received = True
+            for attempt in range(self.__class__.replace_attempts):
+                try:
+                    os.replace(temp_path, path)
+                    break
+                except PermissionError:
+                    if attempt == self.__class__.replace_attempts - 1:
+                        raise
+                    time.sleep(self.__class__.replace_delay * 2**attempt)
+        except PermissionError as e:
+            if not received:
+                temp_path.unlink(missing_ok=True)
+                raise
+            self.log_error('"%s" is in use: the saved file was kept at "%s"', path, temp_path)
+            raise UploadError(503, 'File in use') from e
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+        metrics.increment('server.bytes_received', size)
+        return size
+
+    def optimize_file(self, path:Path):
+        from meupdf.documents import optimize
+        try:
+            report = optimize.optimize_file(path, options=optimize.LOSSLESS)
+        except Exception as e:
+            self.log_message('Saved file not optimized: %s', e)
+            return
+        self.log_message('Optimized saved file: %d bytes saved in %.3f s', report.saved or 0, report.seconds)
+
+    def receive_changes(self, path:str|Path, apply):
+        """Reads annotation changes and passes them to apply, answering the request."""
+        start = time.perf_counter()
+        body = bytearray()
+        for data in self.read_body(self.__class__.max_changes_size):
+            body += data
+        metrics.increment('server.bytes_received', len(body))
+        try:
+            count = apply(json.loads(body))
+        except UnsupportedChanges as e:
+            self.log_message('Changes to "%s" not applied (%s): the whole document must be saved', path, e)
+            self.respond(409, 'Unsupported changes')
+            return
+        self.log_message('Saved %d changes to "%s" in %.3f s (%d bytes received)',
+                         count or 0, path, time.perf_counter() - start, len(body))
+        self.respond(200, 'Ok')
 
     def do_POST(self):
         def callback(e): # Dummy callback function
@@ -64,49 +669,67 @@ class ViewServer(SimpleHTTPRequestHandler):
 
         try:
             key = int(self.headers['key'])
-            path, hash, referer, cb = self.__class__.retrieve_expectation(key)
+            path, fingerprint, referer, cb, apply = self.__class__.retrieve_expectation(key)
             callback = cb or callback
             try:
-                if hash != int(self.headers['hash']):
-                    raise ValueError(f'Hash differs from expected: {self.headers['hash']} != {hash}')
+                if self.headers['fingerprint'] != fingerprint:
+                    raise ValueError(f'Fingerprint differs from expected: {self.headers['fingerprint']} != {fingerprint}')
                 # if path != self.headers['path']: # TODO: understand why is it different: encoding?
                 #     raise ValueError(f'Path differs from expected: {self.headers['path']} != {path}')
-                if self.headers['content-type'] not in self.__class__.content_types:
-                    raise ValueError(f'Content type not accepted: {self.headers['content-type']} not in {self.__class__.content_types}')
+                content_types = (self.__class__.changes_content_type,) if apply else self.__class__.content_types
+                if self.headers['content-type'] not in content_types:
+                    raise ValueError(f'Content type not accepted: {self.headers['content-type']} not in {content_types}')
                 if self.headers['referer'] != referer: #f'http://{self.__class__.host}:{self.__class__.port}/web/viewer.html?file=/files/{hash}.pdf':
                     raise ValueError(f'Referer not expected: {self.headers['referer']} != {referer}') #http://{self.__class__.host}:{self.__class__.port}/web/viewer.html?file=/files/{hash}.pdf')
             except ValueError as e:
                 self.log_error(f'POST error: handshake not accepted ({e})')
-                self.send_response_only(403, 'Handshake not accepted')
+                metrics.increment('server.handshakes.rejected')
+                self.respond(403, 'Handshake not accepted')
                 callback(e=e)
                 return
-            with open(path, 'wb') as f:
-                f.write(self.rfile.read(int(self.headers['Content-Length'])))
-            self.wfile.write(bytes('Ok', 'utf-8'))
-            self.send_response(200, 'Ok')
+            if apply:
+                self.receive_changes(path, apply)
+                callback(e=None)
+                return
+            start = time.perf_counter()
+            size = self.receive_file(path)
+            seconds = time.perf_counter() - start
+            self.log_message('Saved "%s": %d bytes in %.3f s (%.1f MB/s)', path, size, seconds,
+                             size / 1e6 / seconds if seconds else 0)
+            self.respond(200, 'Ok')
             callback(e=None)
+        except UploadError as e:
+            self.log_error('POST error (%s)', e)
+            self.respond(e.code, str(e))
+            callback(e=e)
         except KeyError as e:
             self.log_error('POST error (Key not found: %s)', e)
-            self.send_response_only(403, 'Key error')
+            self.respond(403, 'Key error')
             callback(e=e)
         except FileNotFoundError as e:
             self.log_error('POST error (File not found: "%s")', e.strerror)
-            self.send_response_only(404, 'File not found')
+            self.respond(404, 'File not found')
             callback(e=e)
         except IsADirectoryError as e:
             self.log_error('POST error (Path is a directory: "%s")', e.strerror)
-            self.send_response_only(418, 'Path is a directory')
+            self.respond(418, 'Path is a directory')
             callback(e=e)
         except OSError as e:
             self.log_error('POST error (unkwon OSError: "%s")', e.strerror)
-            self.send_response_only(500, 'OSError')
+            self.respond(500, 'OSError')
             callback(e=e)
         except Exception as e:
             self.log_error('POST error (unkown exception: "%s")', e)
-            self.send_response_only(500, 'Unknown error')
+            self.respond(500, 'Unknown error')
             callback(e=e)
 
-def start_httpd(directory: Path, host:str='localhost', port:int=8000):
+metrics.gauge('server.handshakes', lambda: len(ViewServer._expectations))
+
+def create_httpd(directory: Path, host:str='localhost', port:int=8000) -> ThreadingHTTPServer:
+    """Creates a view server bound to (host, port). Each connection is served by its own thread."""
     handler = partial(ViewServer, directory=str(directory))
-    httpd = HTTPServer((host, port), handler)
-    httpd.serve_forever()
\ No newline at end of file
+    return ThreadingHTTPServer((host, port), handler)
+
+def start_httpd(directory: Path, host:str='localhost', port:int=8000):
+    httpd = create_httpd(directory, host, port)
+    httpd.serve_forever()
@@ -0,0 +1,215 @@
+"""In-process metrics and tracing
+
+Counters, gauges and latency histograms are kept in memory by the ``metrics`` singleton and served
+as JSON by the view server at ``/__metrics``. Spans can also be recorded as a Chrome trace (open it
+in chrome://tracing or https://ui.perfetto.dev), served at ``/__metrics/trace`` and written to a
+file at exit.
+
+Everything is disabled by default, and instrumented functions then only pay for a flag check.
+Environment variables turn it on:
+
+- MEUPDF_METRICS: keeps counters and histograms;
+- MEUPDF_TRACE: also records spans, written as a Chrome trace to the file it names at exit.
+"""
+import atexit, bisect, functools, json, os, threading, time
+from collections import deque
+from collections.abc import Callable
+from contextlib import contextmanager
+from pathlib import Path
+
+LATENCY_BOUNDS = tuple(0.0005 * 2**n for n in range(17)) # 0.5 ms to about 33 s
+MAX_TRACE_EVENTS = 200_000 # Older spans are dropped
+
+class Histogram(object):
+    bounds:tuple[float, ...]
+    buckets:list[int] # Counts of values up to each bound, the last one above every bound
+    count:int
+    sum:float
+    min:float
+    max:float
+
+    def __init__(self, bounds:tuple[float, ...]=LATENCY_BOUNDS):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+
+    def observe(self, value:float):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q:float) -> float:
+        """Returns the upper bound of the bucket holding the q quantile (the maximum, above every bound)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min if self.count else 0.0,
+            'max': self.max,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'buckets': {str(bound): count for bound, count in zip(self.bounds + (float('inf'),), self.buckets) if count},
+        }
+
+class Metrics(object):
+    enabled:bool
+    trace_path:Path|None
+
+    def __init__(self, enabled:bool=False, trace_path:Path|str|None=None):
+        """
+        Inits a metrics registry.
+
+        :param enabled: whether counters and histograms are kept
+        :type enabled: bool
+        :param trace_path: file the Chrome trace is written to by dump_trace(). Setting it enables
+        tracing, and metrics.
+        :type trace_path: Path | str | None
+        """
+        self.trace_path = Path(trace_path) if trace_path else None
+        self.enabled = enabled or self.trace_path is not None
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._gauges:dict[str, Callable[[], float]] = {} # Registered once, by the modules they measure
+        self.reset()
+
+    @property
+    def tracing(self) -> bool:
+        return self.enabled and self.trace_path is not None
+
+    def reset(self):
+        """Clears counters, histograms and spans. Gauges are kept."""
+        with self._lock:
+            self._counters:dict[str, float] = {}
+            self._histograms:dict[str, Histogram] = {}
+            self._events:deque[dict] = deque(maxlen=MAX_TRACE_EVENTS)
+
+    def increment(self, name:str, value:float=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name:str, value:float):
+        """Adds a value (usually seconds) to a histogram."""
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(value)
+
+    def gauge(self, name:str, function:Callable[[], float]):
+        """Registers a function whose value is read when a snapshot is taken."""
+        with self._lock:
+            self._gauges[name] = function
+
+    def record(self, name:str, start:float, seconds:float, **args):
+        """Records a span started at start (a time.perf_counter() value) in its histogram and in the trace."""
+        if not self.enabled:
+            return
+        self.observe(name, seconds)
+        if self.trace_path is not None:
+            event = {
+                'name': name,
+                'cat': name.split('.', 1)[0],
+                'ph': 'X',
+                'ts': (start - self._origin) * 1e6,
+                'dur': seconds * 1e6,
+                'pid': os.getpid(),
+                'tid': threading.get_ident(),
+            }
+            if args:
+                event['args'] = {key: str(value) for key, value in args.items()}
+            with self._lock:
+                self._events.append(event)
+
+    @contextmanager
+    def timed(self, name:str, **args):
+        """Records the time spent in a with block as a span."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.increment(f'{name}.errors')
+            raise
+        finally:
+            self.record(name, start, time.perf_counter() - start, **args)
+
+    def instrument(self, name:str):
+        """Decorates a function, recording each call as a span. Failed calls are also counted."""
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                except BaseException:
+                    self.increment(f'{name}.errors')
+                    raise
+                finally:
+                    self.record(name, start, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def snapshot(self) -> dict:
+        """Returns the current values as a JSON serializable dictionary."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {name: histogram.as_dict() for name, histogram in self._histograms.items()}
+            gauges = dict(self._gauges)
+            events = len(self._events)
+        values = {}
+        for name, function in gauges.items():
+            try:
+                values[name] = function()
+            except Exception:
+                pass
+        return {
+            'enabled': self.enabled,
+            'uptime': time.perf_counter() - self._origin,
+            'counters': counters,
+            'gauges': values,
+            'histograms': histograms,
+            'trace_events': events,
+        }
+
+    def trace(self) -> dict:
+        """Returns the recorded spans in the Chrome trace event format."""
+        with self._lock:
+            events = list(self._events)
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def dump_trace(self, path:Path|str|None=None) -> Path|None:
+        """Writes the Chrome trace to path (by default, trace_path). Returns the file written, if any."""
+        path = Path(path) if path else self.trace_path
+        if path is None:
+            return None
+        path.write_text(json.dumps(self.trace()), encoding='utf-8')
+        return path
+
+metrics = Metrics(bool(os.environ.get('MEUPDF_METRICS')), os.environ.get('MEUPDF_TRACE'))
+if metrics.trace_path is not None:
+    atexit.register(metrics.dump_trace)
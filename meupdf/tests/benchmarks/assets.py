@@ -0,0 +1,62 @@
+"""Cold start cost of the pdf.js assets
+
+Compares extracting the pdf.js zip into the cache directory, as startup used to do, with
+indexing it to serve its members directly. Without arguments, a synthetic zip shaped like the
+pdf.js distribution is used. Run from the project directory with the sources on the path:
+
+    python -m tests.benchmarks.assets [pdfjs-dist.zip]
+"""
+import random, statistics, sys, tempfile, time, zipfile
+from pathlib import Path
+
+import meupdf
+from meupdf.interface.viewserver import ZipAssets
+
+def create_zip(path:Path, seed:int=0) -> Path:
+    """Creates a zip with members shaped like the pdf.js distribution (about 450 files)."""
+    rng = random.Random(seed)
+    members = [f'build/pdf{name}' for name in ('.mjs', '.mjs.map', '.worker.mjs', '.worker.mjs.map', '.sandbox.mjs')]
+    members += ['web/viewer.html', 'web/viewer.mjs', 'web/viewer.mjs.map', 'web/viewer.css']
+    members += [f'web/cmaps/cmap{n}.bcmap' for n in range(170)]
+    members += [f'web/standard_fonts/font{n}.pfb' for n in range(30)]
+    members += [f'web/locale/lang{n}/viewer.ftl' for n in range(110)]
+    members += [f'web/images/image{n}.svg' for n in range(90)]
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name in members:
+            size = 1024 * 1024 if name.startswith('build/') or name.endswith('.map') else rng.randint(512, 40 * 1024)
+            text = ' '.join(rng.choices(('const', 'function', 'return', 'pdf', 'page', '{', '}', ';'), k=size // 5))
+            archive.writestr(name, text.encode()[:size])
+    return path
+
+def measure(function, repeat:int=5) -> float:
+    """Returns the median time, in milliseconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+def main(zip_path:str|None=None):
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(zip_path) if zip_path else create_zip(Path(directory) / 'pdfjs-dist.zip')
+        runs = iter(range(100))
+
+        def extract():
+            with zipfile.ZipFile(path) as archive:
+                archive.extractall(Path(directory) / f'extracted{next(runs)}')
+
+        def index():
+            assets = ZipAssets(path)
+            assets.get(assets.prefix + '/web/viewer.html')
+
+        with zipfile.ZipFile(path) as archive:
+            members = len(archive.infolist())
+        extracting, indexing = measure(extract), measure(index)
+        print(f'{members} members in {path.name}')
+        print(f'{"extractall (former startup)":<32}{extracting:>10.1f} ms')
+        print(f'{"index (first request)":<32}{indexing:>10.1f} ms')
+        print(f'{"saved at cold start":<32}{extracting - indexing:>10.1f} ms')
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2])
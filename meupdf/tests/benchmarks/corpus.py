@@ -0,0 +1,94 @@
+"""Synthetic PDF documents for benchmarks
+
+Documents are generated from a fixed seed, so every run measures the same contents. generate()
+writes the whole corpus (text-heavy, image-heavy, many-page and deep-outline documents) at a given
+scale.
+"""
+import random
+from pathlib import Path
+
+import pymupdf
+
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut '
+         'labore et dolore magna aliqua documento página arquivo processo tribunal').split()
+
+def text_heavy(path:Path|str, page_count:int=20, seed:int=0) -> Path:
+    """Creates a document whose pages are filled with small text."""
+    rng = random.Random(seed)
+    doc = pymupdf.open()
+    for p in range(page_count):
+        page = doc.new_page()
+        lines = [' '.join(rng.choices(WORDS, k=14)) for _ in range(70)]
+        page.insert_text((36, 40), '\n'.join(lines), fontsize=8)
+    doc.save(path, garbage=1, deflate=True)
+    doc.close()
+    return Path(path)
+
+def image_heavy(path:Path|str, page_count:int=20, seed:int=0, width:int=1200, height:int=900) -> Path:
+    """Creates a document whose pages carry a large noisy photo-like image each."""
+    rng = random.Random(seed)
+    doc = pymupdf.open()
+    for p in range(page_count):
+        page = doc.new_page()
+        row = bytes(rng.getrandbits(8) for _ in range(width * 3))
+        samples = b''.join(row[y % 97 * 3:] + row[:y % 97 * 3] for y in range(height))
+        pix = pymupdf.Pixmap(pymupdf.csRGB, width, height, samples, False)
+        page.insert_image(pymupdf.Rect(36, 36, page.rect.width - 36, page.rect.height / 2), pixmap=pix)
+        page.insert_text((36, page.rect.height / 2 + 30), f'Figure {p + 1}', fontsize=12)
+    doc.save(path, garbage=1, deflate=True)
+    doc.close()
+    return Path(path)
+
+def many_pages(path:Path|str, page_count:int=1000, seed:int=0) -> Path:
+    """Creates a document with many small pages holding a line of text each."""
+    rng = random.Random(seed)
+    doc = pymupdf.open()
+    for p in range(page_count):
+        page = doc.new_page(width=300, height=200)
+        page.insert_text((20, 40), f'{p + 1}: ' + ' '.join(rng.choices(WORDS, k=6)), fontsize=10)
+    doc.save(path, garbage=1, deflate=True)
+    doc.close()
+    return Path(path)
+
+def deep_outline(path:Path|str, depth:int=6, breadth:int=3, seed:int=0) -> Path:
+    """
+    Creates a document with an outline of the given depth, each entry having breadth children.
+    Every entry points to a page of its own.
+    """
+    rng = random.Random(seed)
+    toc = []
+
+    def add(level:int, prefix:str):
+        for n in range(1, breadth + 1):
+            number = f'{prefix}{n}.'
+            toc.append([level, f'{number} {" ".join(rng.choices(WORDS, k=3))}', len(toc) + 1])
+            if level < depth:
+                add(level + 1, number)
+
+    add(1, '')
+    doc = pymupdf.open()
+    for level, title, _ in toc:
+        page = doc.new_page(width=300, height=200)
+        page.insert_text((20, 40), title, fontsize=10)
+    doc.set_toc(toc)
+    doc.save(path, garbage=1, deflate=True)
+    doc.close()
+    return Path(path)
+
+SCALES = { # Sizes of the generated documents: (text pages, image pages, many pages, outline depth)
+    'small': (20, 5, 500, 4),
+    'medium': (100, 20, 2000, 5),
+    'large': (500, 60, 10000, 6),
+}
+
+def generate(directory:Path|str, scale:str='small', seed:int=0) -> dict[str, Path]:
+    """Writes the corpus into directory. Returns the paths of the documents by name."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    text_pages, image_pages, page_count, depth = SCALES[scale]
+    return {
+        'text': text_heavy(directory / 'text.pdf', text_pages, seed),
+        'image': image_heavy(directory / 'image.pdf', image_pages, seed),
+        'many-pages': many_pages(directory / 'many-pages.pdf', page_count, seed),
+        'deep-outline': deep_outline(directory / 'deep-outline.pdf', depth, seed=seed),
+    }
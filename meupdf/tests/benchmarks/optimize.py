@@ -0,0 +1,45 @@
+"""Measures the size saved and the time spent by each stage of the optimization pipeline
+
+Run from the project directory with the sources on the path:
+
+    python -m tests.benchmarks.optimize [pages]
+
+Besides the text and image documents of the corpus, a merge of several copies of the image document
+(written without optimization) shows what deduplication and garbage collection recover.
+"""
+import sys, tempfile
+from pathlib import Path
+
+import meupdf
+from meupdf.documents import optimize
+from meupdf.documents.merge import MergeEngine
+from tests.benchmarks import corpus
+
+PROFILES = {
+    'lossless': optimize.OptimizeOptions(measure=True),
+    'images 96 dpi': optimize.OptimizeOptions(image_dpi=96, measure=True),
+    'fonts': optimize.OptimizeOptions(subset_fonts=True, measure=True),
+}
+
+def main(page_count:int=20):
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        image = corpus.image_heavy(directory / 'image.pdf', page_count)
+        documents = {
+            'text': corpus.text_heavy(directory / 'text.pdf', page_count),
+            'image': image,
+            'merged copies': directory / 'merged.pdf',
+        }
+        MergeEngine([image] * 4, optimization=None).run(documents['merged copies'])
+        print(f'{"document":<16}{"profile":<16}{"stage":<14}{"size":>12}{"saved":>12}{"ms":>10}')
+        for name, path in documents.items():
+            for profile, options in PROFILES.items():
+                report = optimize.optimize_file(path, directory / 'optimized.pdf', options).as_dict()
+                print(f'{name:<16}{profile:<16}{"input":<14}{report["input_size"]:>12}')
+                for stage in report['stages']:
+                    print(f'{"":<32}{stage["stage"]:<14}{stage["size"]:>12}{stage["saved"]:>12}{stage["seconds"] * 1000:>10.1f}')
+                print(f'{"":<32}{"total":<14}{report["output_size"]:>12}{report["saved"]:>12}'
+                      f'{sum(s["seconds"] for s in report["stages"]) * 1000:>10.1f}')
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,67 @@
+"""Compares shared pooled documents with one document per consumer
+
+Simulates a session where a file is shown by several tabs, an extract pages window and a merge
+file row, as when each of them opened its own PDFDocument. Counts file parses and measures the
+resident memory held by the open documents. Run from the project directory with the sources on
+the path:
+
+    python -m tests.benchmarks.pool [pages] [consumers]
+"""
+import gc, sys, tempfile, time
+from pathlib import Path
+
+import pymupdf
+
+import meupdf
+from meupdf.documents.pdf import PDFDocument
+from meupdf.documents.pool import DocumentPool
+from tests.benchmarks import corpus
+
+def resident_memory() -> int:
+    """Returns the resident set size of the process, in bytes (Linux only, else 0)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * 4096
+    except OSError:
+        return 0
+
+def session(path:Path, consumers:int, open_document, close_document) -> tuple[float, int, int]:
+    """Opens the file for every consumer and loads each page, as page ranges and thumbnails do."""
+    parses = [0]
+    original_open = pymupdf.open
+    def counting_open(*args, **kwargs):
+        parses[0] += 1
+        return original_open(*args, **kwargs)
+    pymupdf.open = counting_open
+    gc.collect()
+    before = resident_memory()
+    start = time.perf_counter()
+    try:
+        documents = [open_document(path) for _ in range(consumers)]
+        for document in documents:
+            for page in document.pages:
+                page.width
+        elapsed = time.perf_counter() - start
+        memory = resident_memory() - before
+        for document in documents:
+            close_document(document)
+    finally:
+        pymupdf.open = original_open
+    return elapsed, parses[0], memory
+
+def main(page_count:int=300, consumers:int=5):
+    with tempfile.TemporaryDirectory() as directory:
+        path = corpus.text_heavy(Path(directory) / 'text.pdf', page_count)
+        pool = DocumentPool()
+        session(path, 1, PDFDocument, lambda d: d.close()) # Warms up the allocator and pymupdf caches
+        results = {
+            'one per consumer': session(path, consumers, PDFDocument, lambda d: d.close()),
+            'pool': session(path, consumers, pool.acquire, pool.release),
+        }
+    print(f'{page_count} pages, {consumers} consumers')
+    print(f'{"strategy":<20}{"seconds":>10}{"parses":>10}{"memory MB":>12}')
+    for label, (elapsed, parses, memory) in results.items():
+        print(f'{label:<20}{elapsed:>10.3f}{parses:>10}{memory / 1e6:>12.1f}')
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
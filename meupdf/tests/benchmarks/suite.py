@@ -0,0 +1,227 @@
+"""End-to-end benchmark suite
+
+Times the main document operations (opening, rendering, merging, extracting and saving) over the
+synthetic corpus, plus view server GET and POST throughput. Each case runs a few times and its median
+is kept. Results are written as JSON and can be compared with a stored baseline: a case regresses
+when its median exceeds the baseline by more than its tolerance (a fraction of the baseline time,
+set per case in the baseline's "tolerances" or for every case with --tolerance).
+
+Run from the project directory with the sources on the path:
+
+    python -m tests.benchmarks [--scale small] [--output results.json] [--baseline tests/benchmarks/baseline.json]
+    python -m tests.benchmarks --update-baseline
+
+It also runs under pytest (and the tests/meupdf.py runner) when MEUPDF_BENCHMARKS is set; see
+tests/test_benchmarks.py.
+"""
+import argparse, http.client, json, platform, statistics, sys, tempfile, threading, time
+from collections.abc import Callable
+from pathlib import Path
+from typing import NamedTuple
+
+import pymupdf
+
+import meupdf
+from meupdf.documents.merge import MergeEngine
+from meupdf.documents.optimize import LOSSLESS
+from meupdf.documents.pdf import PDFDocument
+from meupdf.interface.viewserver import ViewServer, create_httpd
+from tests.benchmarks import corpus
+
+BASELINE = Path(__file__).parent / 'baseline.json'
+DEFAULT_TOLERANCE = 0.5 # Fraction of the baseline time a case may grow before it is a regression
+REPEAT = 5
+
+class Comparison(NamedTuple):
+    case:str
+    baseline:float
+    current:float
+    tolerance:float
+
+    @property
+    def ratio(self) -> float:
+        return self.current / self.baseline if self.baseline else float('inf')
+
+    @property
+    def regressed(self) -> bool:
+        return self.ratio > 1 + self.tolerance
+
+def measure(function:Callable[[], object], repeat:int=REPEAT, **extra) -> dict:
+    """Runs function repeat times, after a warm-up run. Returns the median and best times."""
+    function()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {'seconds': statistics.median(times), 'min': min(times), 'repeat': repeat, **extra}
+
+def open_document(path:Path):
+    PDFDocument(path).close()
+
+def render(path:Path, pages:int=5):
+    document = PDFDocument(path)
+    for number in range(min(pages, document.page_count)):
+        document.pages[number].to_image(zoom=1.0)
+    document.close()
+
+def extract(path:Path, output:Path):
+    document = PDFDocument(path)
+    quarter, half = document.page_count // 4, document.page_count // 2
+    # Closed ranges only: the workload must not depend on how open ranges are read
+    document.extract_pages(str(output), ranges=f'1-{quarter}, {half}-{half + quarter}').close()
+    document.close()
+
+def save(path:Path, output:Path, optimization=None):
+    document = PDFDocument(path)
+    document.save(output, optimization=optimization)
+    document.close()
+
+def server_cases(directory:Path, path:Path, repeat:int) -> dict[str, dict]:
+    """Measures GET and POST of a document through a view server bound to a random port."""
+    (directory / 'files').mkdir(exist_ok=True)
+    (directory / 'files' / path.name).write_bytes(path.read_bytes())
+    data = path.read_bytes()
+    httpd = create_httpd(directory, 'localhost', 0)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    connection = http.client.HTTPConnection('localhost', httpd.server_address[1], timeout=60)
+
+    def get():
+        for _ in range(10):
+            connection.request('GET', f'/files/{path.name}')
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                raise RuntimeError(f'GET answered {response.status}')
+
+    def post():
+        key = ViewServer.create_expectation(directory / 'posted.pdf', 'benchmark', 'http://viewer')
+        connection.request('POST', '/', body=data, headers={
+            'Content-Type': 'application/pdf', 'key': str(key), 'fingerprint': 'benchmark', 'referer': 'http://viewer',
+        })
+        response = connection.getresponse()
+        response.read()
+        if response.status != 200:
+            raise RuntimeError(f'POST answered {response.status}')
+
+    log_message = ViewServer.__dict__.get('log_message')
+    ViewServer.log_message = lambda self, format, *args: None # pyright: ignore[reportAttributeAccessIssue]
+    try:
+        results = {
+            'server-get': measure(get, repeat, bytes=10 * len(data)),
+            'server-post': measure(post, repeat, bytes=len(data)),
+        }
+    finally:
+        connection.close()
+        httpd.shutdown()
+        httpd.server_close()
+        if log_message is None:
+            del ViewServer.log_message
+        else:
+            ViewServer.log_message = log_message
+    for result in results.values():
+        result['mb_per_s'] = result['bytes'] / result['seconds'] / 1e6
+    return results
+
+def run(scale:str='small', repeat:int=REPEAT, cases:list[str]|None=None) -> dict:
+    """
+    Runs the suite over a corpus generated at the given scale.
+
+    :param cases: prefixes of the cases to run (such as "open" or "server"). Runs every case by default.
+    :type cases: list[str] | None
+    :return: results, as written to JSON
+    :rtype: dict
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        documents = corpus.generate(directory / 'corpus', scale)
+        output = directory / 'output.pdf'
+        selected:dict[str, Callable[[], dict|dict[str, dict]]] = {}
+        for name, path in documents.items():
+            selected[f'open/{name}'] = lambda path=path: measure(lambda: open_document(path), repeat)
+        for name in ('text', 'image'):
+            selected[f'render/{name}'] = lambda path=documents[name]: measure(lambda: render(path), repeat)
+        selected['merge'] = lambda: measure(lambda: MergeEngine(list(documents.values()), optimization=None).run(output), repeat)
+        selected['extract_pages'] = lambda: measure(lambda: extract(documents['many-pages'], output), repeat)
+        selected['save'] = lambda: measure(lambda: save(documents['deep-outline'], output), repeat)
+        selected['save/optimized'] = lambda: measure(lambda: save(documents['deep-outline'], output, LOSSLESS), repeat)
+        selected['server'] = lambda: server_cases(directory, documents['image'], repeat)
+
+        results = {}
+        for case, function in selected.items():
+            if cases and not any(case.startswith(prefix) for prefix in cases):
+                continue
+            result = function()
+            if case == 'server':
+                results.update(result)
+            else:
+                results[case] = result
+    return {
+        'scale': scale,
+        'environment': {
+            'python': platform.python_version(),
+            'pymupdf': pymupdf.VersionBind,
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+        },
+        'results': results,
+    }
+
+def compare(results:dict, baseline:dict, tolerance:float|None=None) -> list[Comparison]:
+    """
+    Compares results with a baseline, case by case. Cases missing from either are skipped.
+
+    :param tolerance: tolerance of every case, overriding the baseline's
+    :type tolerance: float | None
+    """
+    tolerances = baseline.get('tolerances', {})
+    comparisons = []
+    for case, result in results['results'].items():
+        if case not in baseline.get('results', {}):
+            continue
+        case_tolerance = tolerance if tolerance is not None else tolerances.get(case, tolerances.get('default', DEFAULT_TOLERANCE))
+        comparisons.append(Comparison(case, baseline['results'][case]['seconds'], result['seconds'], case_tolerance))
+    return comparisons
+
+def print_results(results:dict, comparisons:list[Comparison]):
+    by_case = {c.case: c for c in comparisons}
+    print(f'scale: {results["scale"]}')
+    print(f'{"case":<24}{"ms":>10}{"baseline":>10}{"ratio":>8}{"MB/s":>8}')
+    for case, result in results['results'].items():
+        comparison = by_case.get(case)
+        line = f'{case:<24}{result["seconds"] * 1000:>10.1f}'
+        line += f'{comparison.baseline * 1000:>10.1f}{comparison.ratio:>7.2f}x' if comparison else f'{"":>18}'
+        line += f'{result["mb_per_s"]:>8.0f}' if 'mb_per_s' in result else f'{"":>8}'
+        if comparison and comparison.regressed:
+            line += '  REGRESSION'
+        print(line)
+
+def main(argv:list[str]|None=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m tests.benchmarks', description='Meu PDF benchmark suite')
+    parser.add_argument('--scale', choices=list(corpus.SCALES), default='small', help='corpus size (default: small)')
+    parser.add_argument('--repeat', type=int, default=REPEAT, help=f'runs of each case (default: {REPEAT})')
+    parser.add_argument('--cases', nargs='*', help='prefixes of the cases to run (default: all)')
+    parser.add_argument('-o', '--output', type=Path, help='write the results to this JSON file')
+    parser.add_argument('--baseline', type=Path, default=BASELINE, help='baseline to compare with')
+    parser.add_argument('--tolerance', type=float, help='tolerance of every case, overriding the baseline\'s')
+    parser.add_argument('--update-baseline', action='store_true', help='store the results as the baseline')
+    args = parser.parse_args(argv)
+
+    results = run(args.scale, args.repeat, args.cases)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2), encoding='utf-8')
+    comparisons = []
+    if args.update_baseline:
+        tolerances = {}
+        if args.baseline.exists():
+            tolerances = json.loads(args.baseline.read_text(encoding='utf-8')).get('tolerances', {})
+        args.baseline.write_text(json.dumps({**results, 'tolerances': tolerances}, indent=2) + '\n', encoding='utf-8')
+    elif args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text(encoding='utf-8'))
+        if baseline.get('scale') == results['scale']:
+            comparisons = compare(results, baseline, args.tolerance)
+        else:
+            print(f'Baseline scale is {baseline.get("scale")}: not compared', file=sys.stderr)
+    print_results(results, comparisons)
+    return 1 if any(c.regressed for c in comparisons) else 0
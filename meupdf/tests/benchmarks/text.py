@@ -0,0 +1,32 @@
+"""Measures text extraction throughput with PDFDocument.iter_text_parallel()
+
+Run from the project directory with the sources on the path:
+
+    python -m tests.benchmarks.text [pages]
+"""
+import os, sys, tempfile, time
+from pathlib import Path
+
+import meupdf
+from meupdf.documents.pdf import PDFDocument
+from tests.benchmarks import corpus
+
+def main(page_count:int=2000):
+    with tempfile.TemporaryDirectory() as directory:
+        path = corpus.text_heavy(Path(directory) / 'text.pdf', page_count)
+        document = PDFDocument(path)
+        counts = [1] + [n for n in (2, 4, 8, 16) if n <= (os.cpu_count() or 1)]
+        print(f'{page_count} pages')
+        print(f'{"workers":<10}{"pages/s":>10}{"speedup":>10}')
+        baseline = None
+        for workers in counts:
+            start = time.perf_counter()
+            for _ in document.iter_text_parallel(workers=workers):
+                pass
+            rate = page_count / (time.perf_counter() - start)
+            baseline = baseline or rate
+            print(f'{workers:<10}{rate:>10.0f}{rate / baseline:>9.1f}x')
+        document.close()
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,48 @@
+"""Compares PDFPage.to_thumbnail() with the former thumbnail path
+
+The former path rendered the page at zoom 1 with to_image() and encoded it as PNG, leaving the
+scaling to the image view. Run from the project directory with the sources on the path:
+
+    python -m tests.benchmarks.thumbnails [pages]
+"""
+import sys, tempfile, time
+from pathlib import Path
+
+import meupdf
+from meupdf.documents.pdf import PDFDocument
+from tests.benchmarks import corpus
+
+THUMBNAIL = 100 # Same as meupdf.interface.styles.THUMBNAIL, without importing toga
+
+def time_pages(document:PDFDocument, render) -> float:
+    """Returns the mean time per page, in milliseconds."""
+    start = time.perf_counter()
+    for page in document.pages:
+        render(page)
+    return (time.perf_counter() - start) * 1000 / document.page_count
+
+def main(page_count:int=20):
+    paths = {
+        'text': corpus.text_heavy,
+        'image': corpus.image_heavy,
+    }
+    renderers = {
+        'to_image + png': lambda page: page.to_image().tobytes(output='png'),
+        'to_thumbnail': lambda page: page.to_thumbnail(THUMBNAIL),
+        'to_thumbnail png': lambda page: page.to_thumbnail(THUMBNAIL, output='png'),
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        print(f'{"corpus":<8}{"path":<20}{"ms/page":>10}{"speedup":>10}')
+        for name, generate in paths.items():
+            path = generate(Path(directory) / f'{name}.pdf', page_count)
+            baseline = None
+            for label, render in renderers.items():
+                # A fresh document for each path, so decoded images are not reused from the previous one
+                document = PDFDocument(path)
+                elapsed = time_pages(document, render)
+                document.close()
+                baseline = baseline or elapsed
+                print(f'{name:<8}{label:<20}{elapsed:>10.2f}{baseline / elapsed:>9.1f}x')
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
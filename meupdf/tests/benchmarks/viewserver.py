@@ -0,0 +1,94 @@
+"""Load benchmark of the view server
+
+Opens many tabs at once: each tab fetches the viewer assets over one connection, as pdf.js does,
+and then downloads its PDF. The threaded keep-alive server is compared with the former
+single-threaded HTTP/1.0 server. Run from the project directory with the sources on the path:
+
+    python -m tests.benchmarks.viewserver [tabs] [pdf size in MB]
+"""
+import http.client, os, statistics, sys, tempfile, threading, time
+from functools import partial
+from http.server import HTTPServer
+from pathlib import Path
+
+import meupdf
+from meupdf.interface.viewserver import ViewServer, create_httpd
+
+ASSETS = 80
+ASSET_SIZE = 32 * 1024
+
+class FormerViewServer(ViewServer):
+    protocol_version = 'HTTP/1.0'
+
+    def copyfile(self, source, outputfile):
+        return super(ViewServer, self).copyfile(source, outputfile)
+
+def create_files(directory:Path, pdf_size:int):
+    (directory / 'web').mkdir()
+    (directory / 'files').mkdir()
+    for n in range(ASSETS):
+        (directory / 'web' / f'asset{n}.mjs').write_bytes(os.urandom(ASSET_SIZE))
+    (directory / 'files' / 'document.pdf').write_bytes(os.urandom(pdf_size))
+
+def open_tab(port:int, latencies:list, errors:list):
+    connection = http.client.HTTPConnection('localhost', port, timeout=60)
+    try:
+        for path in [f'/web/asset{n}.mjs' for n in range(ASSETS)] + ['/files/document.pdf']:
+            start = time.perf_counter()
+            connection.request('GET', path)
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+            if path.endswith('.mjs'):
+                latencies.append(time.perf_counter() - start)
+    finally:
+        connection.close()
+
+def run(httpd, tabs:int) -> dict:
+    server_thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    server_thread.start()
+    latencies:list[float] = []
+    errors:list[int] = []
+    threads = [threading.Thread(target=open_tab, args=(httpd.server_address[1], latencies, errors)) for _ in range(tabs)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    httpd.shutdown()
+    httpd.server_close()
+    latencies.sort()
+    return {
+        'seconds': elapsed,
+        'p50': statistics.median(latencies) * 1000,
+        'p95': latencies[int(len(latencies) * 0.95)] * 1000,
+        'errors': len(errors),
+    }
+
+def main(tabs:int=20, pdf_megabytes:int=20):
+    log_message = ViewServer.__dict__.get('log_message')
+    ViewServer.log_message = lambda self, format, *args: None
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            create_files(Path(directory), pdf_megabytes * 1024 * 1024)
+            servers = {
+                'single-threaded HTTP/1.0': lambda: HTTPServer(('localhost', 0), partial(FormerViewServer, directory=directory)),
+                'threaded keep-alive': lambda: create_httpd(Path(directory), 'localhost', 0),
+            }
+            total = tabs * (ASSETS * ASSET_SIZE + pdf_megabytes * 1024 * 1024) / 1024 / 1024
+            print(f'{tabs} tabs, {ASSETS} assets and a {pdf_megabytes} MB PDF each')
+            print(f'{"server":<28}{"seconds":>10}{"MB/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"errors":>8}')
+            for name, create in servers.items():
+                result = run(create(), tabs)
+                print(f'{name:<28}{result["seconds"]:>10.2f}{total / result["seconds"]:>10.1f}'
+                      f'{result["p50"]:>10.2f}{result["p95"]:>10.2f}{result["errors"]:>8}')
+    finally:
+        if log_message is None:
+            del ViewServer.log_message
+        else:
+            ViewServer.log_message = log_message
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -13,6 +13,10 @@ def run_tests():
     # Determine any args to pass to pytest. If there aren't any,
     # default to running the whole test suite.
     args = sys.argv[1:]
+    if "--benchmarks" in args:
+        # Also runs the benchmark suite against its baseline (tests/test_benchmarks.py)
+        args.remove("--benchmarks")
+        os.environ["MEUPDF_BENCHMARKS"] = "1"
     if len(args) == 0:
         args = ["tests"]
 
@@ -0,0 +1,30 @@
+import json, os
+
+import pytest
+
+pytest.importorskip('pymupdf')
+
+from tests.benchmarks import suite
+
+def test_compare():
+    baseline = {
+        'results': {'open': {'seconds': 1.0}, 'save': {'seconds': 2.0}, 'gone': {'seconds': 1.0}},
+        'tolerances': {'default': 0.5, 'save': 0.1},
+    }
+    results = {'results': {'open': {'seconds': 1.4}, 'save': {'seconds': 2.4}, 'new': {'seconds': 9.0}}}
+    comparisons = {c.case: c for c in suite.compare(results, baseline)}
+    assert set(comparisons) == {'open', 'save'}
+    assert not comparisons['open'].regressed
+    assert comparisons['save'].regressed
+    assert not any(c.regressed for c in suite.compare(results, baseline, tolerance=1.0))
+
+@pytest.mark.skipif(not os.environ.get('MEUPDF_BENCHMARKS'), reason='set MEUPDF_BENCHMARKS to run the benchmark suite')
+def test_suite(tmp_path):
+    """Runs the suite and fails on regressions against the stored baseline."""
+    results = suite.run(os.environ.get('MEUPDF_BENCHMARKS_SCALE', 'small'))
+    (tmp_path / 'results.json').write_text(json.dumps(results, indent=2))
+    baseline = json.loads(suite.BASELINE.read_text(encoding='utf-8'))
+    if baseline['scale'] != results['scale']:
+        pytest.skip(f'No baseline at scale {results["scale"]}')
+    regressions = [c for c in suite.compare(results, baseline) if c.regressed]
+    assert not regressions, '\n'.join(f'{c.case}: {c.ratio:.2f}x the baseline' for c in regressions)
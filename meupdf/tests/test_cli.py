@@ -0,0 +1,24 @@
+import json, sys
+
+import pytest
+
+pytest.importorskip('pymupdf')
+
+from meupdf import cli
+from tests.test_documents import make_pdf
+
+def test_batch(tmp_path, capsys):
+    source = make_pdf(tmp_path / 'source.pdf', page_count=6)
+    jobs = tmp_path / 'jobs.txt'
+    jobs.write_text(
+        f'extract -o "{tmp_path / "extracted.pdf"}" "{source}" 1-2\n'
+        f'# comment\n'
+        f'split -o "{tmp_path / "parts"}" --every 4 "{source}"\n'
+        f'extract -o "{tmp_path / "error.pdf"}" "{source}" 7\n'
+    )
+    assert cli.main(['batch', '-j', '1', str(jobs)]) == 1
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [r.get('status') for r in records[:-1]] == ['ok', 'ok', 'error']
+    assert records[1]['output'][-1].endswith('5-6.pdf')
+    assert records[-1]['jobs'] == 3 and records[-1]['failed'] == 1
+    assert 'toga' not in sys.modules
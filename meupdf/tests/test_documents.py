@@ -0,0 +1,158 @@
+import pytest
+
+pymupdf = pytest.importorskip('pymupdf')
+
+import meupdf
+from meupdf.documents.generic import UnsupportedChanges, file_fingerprint
+from meupdf.documents.pdf import PDFDocument
+from meupdf.documents.merge import MergeEngine
+
+def make_pdf(path, page_count=5):
+    doc = pymupdf.open()
+    for p in range(page_count):
+        page = doc.new_page(width=100 + p, height=200)
+        page.insert_text((10, 20), f'Page {p + 1}')
+    doc.save(path)
+    doc.close()
+    return path
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    return make_pdf(tmp_path / 'document.pdf')
+
+def test_lazy_pages(pdf_path):
+    document = PDFDocument(pdf_path)
+    assert len(document.pages) == 5
+    assert document.pages[2].width == 102
+    assert document.pages[-1].number == 4
+    assert [page.number for page in document.pages] == [0, 1, 2, 3, 4]
+    with pytest.raises(IndexError):
+        document.pages[5]
+    document.close()
+
+def test_thumbnail(pdf_path):
+    document = PDFDocument(pdf_path)
+    jpeg = document.pages[0].to_thumbnail(50)
+    assert jpeg.startswith(b'\xff\xd8')
+    pix = pymupdf.Pixmap(document.pages[0].to_thumbnail(50, output='png'))
+    assert max(pix.width, pix.height) == 50
+    document.close()
+
+def test_fingerprint(pdf_path, tmp_path, monkeypatch):
+    document = PDFDocument(pdf_path)
+    fingerprint = document.fingerprint()
+    assert fingerprint == PDFDocument(pdf_path).fingerprint() # Stable
+    copy = tmp_path / 'copy.pdf'
+    copy.write_bytes(pdf_path.read_bytes())
+    assert PDFDocument(copy).fingerprint() != fingerprint
+    pdf_path.write_bytes(pdf_path.read_bytes() + b'\n')
+    assert document.fingerprint() != fingerprint # Changed file
+    document.close()
+
+    monkeypatch.setattr('meupdf.documents.generic.FINGERPRINT_BLOCK', 16)
+    big = tmp_path / 'big.bin'
+    big.write_bytes(bytes(10_000))
+    first = file_fingerprint(big)
+    with open(big, 'r+b') as f:
+        f.seek(9_990) # Within the last block
+        f.write(b'x')
+    assert file_fingerprint(big) != first
+
+def test_extract_ranges(pdf_path, tmp_path, monkeypatch):
+    document = PDFDocument(pdf_path)
+    saves = []
+    monkeypatch.setattr(pymupdf.Document, 'save', lambda self, *args, **kwargs: saves.append(args))
+    new_doc = document.extract_pages(tmp_path / 'extracted.pdf', ranges=[(0, 1), (2, None), (4, 4)])
+    assert new_doc.page_count == 4
+    assert len(saves) == 1
+    assert [page.get_text().strip() for page in new_doc] == ['Page 1', 'Page 2', 'Page 3', 'Page 5']
+    new_doc = document.extract_pages(target_doc=pymupdf.open(), ranges='5, 1-2')
+    assert [page.get_text().strip() for page in new_doc] == ['Page 5', 'Page 1', 'Page 2']
+    document.close()
+
+def test_merge_engine(tmp_path):
+    paths = []
+    for n in range(5):
+        doc = pymupdf.open(make_pdf(tmp_path / f'{n}.pdf', page_count=2))
+        doc.set_toc([[1, f'Document {n}', 1], [2, 'Second page', 2]])
+        doc.saveIncr()
+        doc.close()
+        paths.append(tmp_path / f'{n}.pdf')
+    progress = []
+    engine = MergeEngine(paths, batch_size=2, progress=lambda done, total: progress.append((done, total)))
+    assert engine.run(tmp_path / 'merged.pdf') == 10
+    assert progress[-1] == (5, 5)
+    merged = pymupdf.open(tmp_path / 'merged.pdf')
+    assert merged.page_count == 10
+    assert merged.get_toc()[-2:] == [[1, 'Document 4', 9], [2, 'Second page', 10]]
+    merged.close()
+    assert [p.name for p in tmp_path.iterdir() if p.suffix == '.part'] == []
+
+def test_merge_in_process(tmp_path):
+    paths = [make_pdf(tmp_path / f'{n}.pdf', page_count=2) for n in range(3)]
+    progress = []
+    engine = MergeEngine(paths, progress=lambda done, total: progress.append((done, total)))
+    assert engine.run_in_process(tmp_path / 'merged.pdf') == 6
+    assert progress == [(1, 3), (2, 3), (3, 3)]
+    assert engine.report is not None and engine.report.output_size == (tmp_path / 'merged.pdf').stat().st_size
+    with pytest.raises(Exception):
+        MergeEngine(paths + [tmp_path / 'missing.pdf']).run_in_process(tmp_path / 'failed.pdf')
+    assert not (tmp_path / 'failed.pdf').exists()
+
+def test_apply_changes(tmp_path):
+    path = tmp_path / 'form.pdf'
+    doc = pymupdf.open()
+    page = doc.new_page(width=200, height=200)
+    widget = pymupdf.Widget()
+    widget.field_type, widget.field_name, widget.rect = pymupdf.PDF_WIDGET_TYPE_TEXT, 'name', pymupdf.Rect(10, 10, 100, 30)
+    field = page.add_widget(widget).xref
+    existing = page.add_text_annot((150, 150), 'Old note').xref
+    doc.save(path)
+    doc.close()
+    original = path.read_bytes()
+
+    highlight = {'annotationType': 9, 'pageIndex': 0, 'color': [255, 255, 0], 'opacity': 1,
+                 'quadPoints': [10, 190, 90, 190, 10, 180, 90, 180], 'rect': [10, 180, 90, 190]}
+    document = PDFDocument(path)
+    assert document.apply_changes({
+        f'{field}R': {'value': 'Meu PDF'},
+        'pdfjs_internal_editor_0': highlight,
+        'pdfjs_internal_editor_1': {'id': f'{existing}R', 'pageIndex': 0, 'deleted': True},
+    }) == 3
+    assert document.apply_changes({'pdfjs_internal_editor_0': highlight}) == 0 # Already applied
+    assert path.read_bytes().startswith(original) # Appended to the file
+
+    saved = pymupdf.open(path)
+    assert [w.field_value for w in saved[0].widgets()] == ['Meu PDF']
+    assert [a.type[1] for a in saved[0].annots()] == ['Highlight']
+    assert saved[0].first_annot.rect.y1 < 25 # Converted from PDF user space
+    saved.close()
+
+    moved = dict(highlight, quadPoints=[10, 100, 90, 100, 10, 90, 90, 90])
+    assert document.apply_changes({'pdfjs_internal_editor_0': moved}) == 1 # Replaces the annotation
+    assert len(list(document._document[0].annots())) == 1
+    assert document.apply_changes({'pdfjs_internal_editor_0': None}) == 1 # Editor removed in the viewer
+    assert len(list(document._document[0].annots())) == 0
+
+    size = path.stat().st_size
+    with pytest.raises(UnsupportedChanges):
+        document.apply_changes({'pdfjs_internal_editor_2': {'annotationType': 13, 'pageIndex': 0}})
+    assert path.stat().st_size == size
+
+    make_pdf(path, page_count=1) # Replaced on disk
+    with pytest.raises(UnsupportedChanges):
+        document.apply_changes({'pdfjs_internal_editor_0': highlight})
+    document.close()
+
+def test_iter_text(tmp_path):
+    path = make_pdf(tmp_path / 'many.pdf', page_count=12)
+    document = PDFDocument(path)
+    texts = list(document.iter_text())
+    assert [number for number, _ in texts] == list(range(12))
+    assert texts[3][1].strip() == 'Page 4'
+    words = dict(document.iter_text('words', first=2, last=3))
+    assert [w[4] for w in words[2]] == ['Page', '3']
+    assert list(document.iter_text_parallel(workers=2, chunk_size=5)) == texts # Same order
+    with pytest.raises(ValueError):
+        document.pages[0].text('lines')
+    document.close()
@@ -0,0 +1,63 @@
+import os
+
+import pytest
+
+pymupdf = pytest.importorskip('pymupdf')
+
+from meupdf.documents.mapping import MappingRegistry, file_mappings
+from meupdf.documents.pdf import PDFDocument
+
+def write_pdf(path, pages):
+    doc = pymupdf.open()
+    for _ in range(pages):
+        doc.new_page()
+    doc.save(path)
+    doc.close()
+
+def test_registry(tmp_path):
+    path = tmp_path / 'a.bin'
+    path.write_bytes(b'0123456789')
+    registry = MappingRegistry()
+    assert registry.share(path) is None
+    first = registry.acquire(path)
+    assert registry.share(path) is first
+    assert [bytes(chunk) for chunk in first.chunks(2, 5, chunk_size=2)] == [b'23', b'45', b'6']
+
+    path.with_name('b.bin').write_bytes(b'abc')
+    os.replace(path.with_name('b.bin'), path)
+    second = registry.acquire(path) # The file changed: mapped again
+    assert second is not first and bytes(second.view()) == b'abc'
+    assert bytes(first.view()[:4]) == b'0123' # Still valid until released
+    for mapping in (first, first, second):
+        registry.release(mapping)
+    assert len(registry) == 0
+
+    registry.excluded = lambda path: True
+    with pytest.raises(ValueError):
+        registry.acquire(path)
+
+def test_mapped_document(tmp_path):
+    path = tmp_path / 'a.pdf'
+    write_pdf(path, 2)
+    document = PDFDocument(path, mmap=True)
+    assert document.mapped and document.page_count == 2
+    assert document.pages[1].text() == ''
+
+    write_pdf(tmp_path / 'b.pdf', 3)
+    os.replace(tmp_path / 'b.pdf', path)
+    document.reload()
+    assert document.mapped and document.page_count == 3
+    assert len(file_mappings) == 1
+
+    assert document.apply_changes({}) == 0
+    highlight = {'annotationType': 9, 'pageIndex': 0, 'color': [255, 255, 0], 'opacity': 1,
+                 'quadPoints': [10, 190, 90, 190, 10, 180, 90, 180], 'rect': [10, 180, 90, 190]}
+    assert document.apply_changes({'pdfjs_internal_editor_0': highlight}) == 1 # Saved from the file
+    assert document.mapped and not document.is_stale() # Then mapped again
+    assert len(list(document._document[0].annots())) == 1
+    document.save()
+    assert document.mapped and len(list(document._document[0].annots())) == 1
+    document.save(tmp_path / 'copy.pdf') # Save as: written from the mapped document as is
+    assert document.file_path == tmp_path / 'copy.pdf' and pymupdf.open(tmp_path / 'copy.pdf').page_count == 3
+    document.close()
+    assert len(file_mappings) == 0
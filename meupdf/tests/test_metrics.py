@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+from meupdf.metrics import Histogram, Metrics
+
+def test_histogram():
+    histogram = Histogram(bounds=(0.001, 0.01, 0.1))
+    for value in (0.0005, 0.002, 0.003, 0.05, 2.0):
+        histogram.observe(value)
+    assert histogram.buckets == [1, 2, 1, 1]
+    assert histogram.quantile(0.5) == 0.01
+    assert histogram.quantile(1) == 2.0
+    assert histogram.as_dict()['count'] == 5
+
+def test_disabled():
+    metrics = Metrics()
+    calls = []
+    function = metrics.instrument('test.call')(lambda: calls.append(1))
+    function()
+    metrics.increment('test.counter')
+    with metrics.timed('test.block'):
+        pass
+    snapshot = metrics.snapshot()
+    assert calls == [1]
+    assert snapshot['counters'] == {} and snapshot['histograms'] == {}
+
+def test_spans(tmp_path):
+    metrics = Metrics(trace_path=tmp_path / 'trace.json')
+    assert metrics.enabled
+
+    @metrics.instrument('test.fail')
+    def fail():
+        raise ValueError()
+
+    with pytest.raises(ValueError):
+        fail()
+    with metrics.timed('test.block', item=3):
+        pass
+    metrics.gauge('test.gauge', lambda: 7)
+    snapshot = metrics.snapshot()
+    assert snapshot['counters'] == {'test.fail.errors': 1}
+    assert snapshot['histograms']['test.block']['count'] == 1
+    assert snapshot['gauges'] == {'test.gauge': 7}
+    metrics.dump_trace()
+    events = json.loads((tmp_path / 'trace.json').read_text())['traceEvents']
+    assert [(e['name'], e['ph']) for e in events] == [('test.fail', 'X'), ('test.block', 'X')]
+    assert events[1]['args'] == {'item': '3'}
@@ -0,0 +1,45 @@
+import pytest
+
+pymupdf = pytest.importorskip('pymupdf')
+
+from meupdf.documents import optimize
+from meupdf.documents.merge import MergeEngine
+from meupdf.documents.pdf import PDFDocument
+from tests.test_documents import make_pdf
+
+def test_deduplicate_merged_copies(tmp_path):
+    path = make_pdf(tmp_path / 'document.pdf')
+    MergeEngine([path] * 3, optimization=None).run(tmp_path / 'plain.pdf')
+    engine = MergeEngine([path] * 3)
+    assert engine.run(tmp_path / 'optimized.pdf') == 15
+    assert [stage.stage for stage in engine.report.stages] == ['save']
+    assert engine.report.output_size == (tmp_path / 'optimized.pdf').stat().st_size
+    assert engine.report.output_size < (tmp_path / 'plain.pdf').stat().st_size
+    assert not list(tmp_path.glob('.*')) # No temporary files left
+
+def test_measured_stages(tmp_path):
+    path = make_pdf(tmp_path / 'document.pdf')
+    options = optimize.OptimizeOptions(subset_fonts=True, measure=True)
+    report = optimize.optimize_file(path, tmp_path / 'optimized.pdf', options)
+    assert [stage.stage for stage in report.stages] == ['fonts', 'garbage', 'deduplicate', 'deflate']
+    assert report.stages[-1].size == report.output_size
+    summary = report.as_dict()
+    assert summary['saved'] == path.stat().st_size - report.output_size
+    assert sum(stage['saved'] for stage in summary['stages']) == summary['saved']
+    assert pymupdf.open(tmp_path / 'optimized.pdf').page_count == 5
+
+def test_save_in_place(tmp_path):
+    highlight = {'annotationType': 9, 'pageIndex': 0, 'color': [255, 255, 0], 'opacity': 1,
+                 'quadPoints': [10, 190, 90, 190, 10, 180, 90, 180], 'rect': [10, 180, 90, 190]}
+    document = PDFDocument(make_pdf(tmp_path / 'document.pdf'))
+    assert document.apply_changes({'pdfjs_internal_editor_0': highlight}) == 1
+    report = document.save(optimization=optimize.LOSSLESS)
+    assert report is document.optimization_report
+    assert not document.is_stale()
+    # Later incremental saves build on the optimized file
+    assert document.apply_changes({'pdfjs_internal_editor_1': dict(highlight, pageIndex=1)}) == 1
+    document.close()
+    saved = pymupdf.open(tmp_path / 'document.pdf')
+    assert saved.page_count == 5
+    assert [[a.type[1] for a in saved[n].annots()] for n in (0, 1)] == [['Highlight'], ['Highlight']]
+    saved.close()
@@ -0,0 +1,31 @@
+import pytest
+
+from meupdf.documents import pagesets
+
+def test_coalesce():
+    assert pagesets.coalesce([(0, 2), (3, 4), (4, None), (9, 9), (1, 1)]) == [(0, 4), (4, 4), (9, 9), (1, 1)]
+    with pytest.raises(ValueError):
+        pagesets.coalesce([(3, 2)])
+
+def test_parse():
+    assert pagesets.parse('1-3, 4,8-9 ,', 10) == [(0, 3), (7, 8)]
+    for expression in ('', 'a', '0', '1-11', '2-1', '1-2-3', '1--3', '3 4', '2-a', ' - '):
+        with pytest.raises(ValueError):
+            pagesets.parse(expression, 10)
+
+def test_open_ranges_and_keywords():
+    assert pagesets.parse('10-, -2', 12) == [(9, 11), (0, 1)]
+    assert pagesets.parse('odd', 5) == [(0, 0), (2, 2), (4, 4)]
+    assert pagesets.parse('EVEN', 5) == [(1, 1), (3, 3)]
+    for expression in ('-', 'odd-3', '13-', '-0'):
+        with pytest.raises(ValueError):
+            pagesets.parse(expression, 12)
+
+def test_page_set():
+    pages = pagesets.PageSet.parse('1-5,8,10-,odd,-3', 12)
+    assert pages.ranges == [(0, 4), (6, 11)]
+    assert len(pages) == 11
+    assert 4 in pages and 5 not in pages and 11 in pages and 12 not in pages
+    assert list(pagesets.PageSet([(9, 9), (2, 3), (0, 0), (3, 5)])) == [0, 2, 3, 4, 5, 9]
+    scattered = ', '.join(str(page) for page in range(1, 2001, 4))
+    assert len(pagesets.PageSet.parse(scattered, 2000)) == 500
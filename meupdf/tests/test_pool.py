@@ -0,0 +1,33 @@
+import os
+
+import pytest
+
+pymupdf = pytest.importorskip('pymupdf')
+
+import meupdf
+from meupdf.documents.pool import DocumentPool
+from tests.test_documents import make_pdf
+
+def test_shared_documents(tmp_path):
+    path = make_pdf(tmp_path / 'document.pdf')
+    pool = DocumentPool()
+    tab = pool.acquire(path)
+    window = pool.acquire(tmp_path / '.' / 'document.pdf')
+    assert window is tab
+    assert pool.references(path) == 2
+    pool.release(window)
+    assert not tab._document.is_closed # Still used by the tab
+    pool.release(tab)
+    assert tab._document.is_closed
+    assert len(pool) == 0
+
+def test_reload_changed_file(tmp_path):
+    path = make_pdf(tmp_path / 'document.pdf', page_count=3)
+    pool = DocumentPool()
+    document = pool.acquire(path)
+    make_pdf(tmp_path / 'new.pdf', page_count=7)
+    os.replace(tmp_path / 'new.pdf', path)
+    assert pool.acquire(path) is document
+    assert document.page_count == 7 # Reloaded
+    pool.release(document)
+    pool.release(document)
@@ -0,0 +1,47 @@
+import pytest
+
+pymupdf = pytest.importorskip('pymupdf')
+
+import meupdf
+from meupdf.documents.search import SearchIndex, SearchIndexer, quote
+
+def make_pdf(path, texts):
+    doc = pymupdf.open()
+    for text in texts:
+        doc.new_page().insert_text((36, 72), text)
+    doc.save(path)
+    doc.close()
+    return path
+
+def test_quote():
+    assert quote('habeas corpus') == '"habeas" "corpus"'
+    assert quote('recur* "x') == '"recur"* """x"'
+    assert quote('  ') == ''
+
+def test_index(tmp_path):
+    index = SearchIndex(tmp_path / 'search.sqlite')
+    index.begin(tmp_path / 'a.pdf', 'f1', 2)
+    index.add_pages('f1', 0, ['Petição inicial do processo', 'Sentença'])
+    assert index.is_indexed('f1')
+    hits = index.search('peticao') # Diacritics are ignored
+    assert [(hit.fingerprint, hit.page) for hit in hits] == [('f1', 0)]
+    assert '[Petição]' in hits[0].snippet
+    assert [hit.page for hit in index.search('sent*')] == [1]
+
+    index.begin(tmp_path / 'a.pdf', 'f2', 1) # Changed file: the former version is dropped
+    assert not index.is_indexed('f1')
+    assert index.search('sentença') == []
+    index.close()
+
+def test_indexer(tmp_path):
+    path = make_pdf(tmp_path / 'a.pdf', ['first page', 'recurso especial', 'last page'])
+    progress = []
+    indexer = SearchIndexer(SearchIndex(), max_workers=1, progress=lambda p, done, total: progress.append((done, total)))
+    indexer.submit(path)
+    assert indexer.wait(60)
+    assert [hit.page for hit in indexer.index.search('recurso')] == [1]
+    assert progress == [(3, 3)]
+    indexer.submit(path) # Unchanged: not extracted again
+    assert indexer.wait(60)
+    assert progress == [(3, 3)]
+    indexer.shutdown()
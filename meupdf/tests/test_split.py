@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+pymupdf = pytest.importorskip('pymupdf')
+
+from meupdf.documents import split
+from meupdf.documents.pdf import PDFDocument
+from tests.test_documents import make_pdf
+
+def make_bookmarked_pdf(path):
+    make_pdf(path, page_count=6)
+    doc = pymupdf.open(path)
+    doc.set_toc([[1, 'Intro', 2], [2, 'Detail', 3], [1, 'Annex/A', 5]])
+    doc.saveIncr()
+    doc.close()
+    return path
+
+def test_plan_every():
+    assert split.plan_every(5, 2) == [(0, 1, '1-2'), (2, 3, '3-4'), (4, 4, '5-5')]
+    with pytest.raises(ValueError):
+        split.plan_every(5, 0)
+
+def test_plan_bookmarks(tmp_path):
+    document = PDFDocument(make_bookmarked_pdf(tmp_path / 'document.pdf'))
+    assert split.plan_bookmarks(document) == [(0, 0, ''), (1, 3, 'Intro'), (4, 5, 'Annex/A')]
+    document.close()
+    document = PDFDocument(make_pdf(tmp_path / 'plain.pdf'))
+    with pytest.raises(ValueError):
+        split.plan_bookmarks(document)
+    document.close()
+
+def test_plan_size(tmp_path):
+    doc = pymupdf.open()
+    for p in range(8):
+        page = doc.new_page()
+        page.insert_text((10, 20), os.urandom(4000).hex(), fontsize=2)
+    doc.save(tmp_path / 'document.pdf')
+    doc.close()
+    document = PDFDocument(tmp_path / 'document.pdf')
+    parts = split.plan_size(document, 20000)
+    assert len(parts) > 1
+    assert parts[0].first == 0 and parts[-1].last == 7
+    assert all(a.last + 1 == b.first for a, b in zip(parts, parts[1:]))
+    paths = split.SplitEngine(document.file_path, parts, workers=1).run(tmp_path / 'parts')
+    assert all(path.stat().st_size <= 20000 for path in paths)
+    document.close()
+
+def test_parse_size():
+    assert split.parse_size('10MB') == 10_000_000
+    assert split.parse_size('1 KiB') == 1024
+    assert split.parse_size('512') == 512
+    with pytest.raises(ValueError):
+        split.parse_size('ten')
+
+def test_engine(tmp_path):
+    path = make_bookmarked_pdf(tmp_path / 'document.pdf')
+    document = PDFDocument(path)
+    parts = split.plan_bookmarks(document)
+    document.close()
+    progress = []
+    paths = split.SplitEngine(path, parts, workers=1, progress=lambda done, total: progress.append((done, total))).run(tmp_path / 'parts')
+    assert [p.name for p in paths] == ['document 1.pdf', 'document 2 Intro.pdf', 'document 3 AnnexA.pdf']
+    assert progress == [(1, 3), (2, 3), (3, 3)]
+    intro = pymupdf.open(paths[1])
+    assert intro.page_count == 3
+    assert intro.get_toc() == [[1, 'Intro', 1], [2, 'Detail', 2]]
+    intro.close()
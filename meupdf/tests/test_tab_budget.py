@@ -0,0 +1,34 @@
+from types import SimpleNamespace
+
+from meupdf.interface.tab_budget import TabBudget, view_fragment
+
+def make_tab(tmp_path, name, size):
+    path = tmp_path / name
+    path.write_bytes(bytes(size))
+    return SimpleNamespace(file_path=path, loaded=True)
+
+def test_idle_tabs(tmp_path):
+    budget = TabBudget(budget=10**9, idle_timeout=60)
+    old, recent, current = (make_tab(tmp_path, name, 10) for name in ('old', 'recent', 'current'))
+    budget.touch(old, now=0)
+    budget.touch(recent, now=50)
+    budget.touch(current, now=0) # Never evicted, however long it is shown
+    assert budget.victims(current=current, now=100) == [old]
+
+def test_over_budget(tmp_path):
+    budget = TabBudget(idle_timeout=3600)
+    budget.view_cost = 0
+    tabs = [make_tab(tmp_path, str(n), 100) for n in range(4)]
+    for n, tab in enumerate(tabs):
+        budget.touch(tab, now=n)
+    budget.budget = 2 * budget.cost(tabs[0])
+    budget.touch(tabs[0], now=10) # Now the most recently used
+    assert budget.victims(current=tabs[0], now=11) == [tabs[1], tabs[2]]
+    tabs[1].loaded = tabs[2].loaded = False
+    assert budget.usage() == budget.budget
+    assert budget.victims(current=tabs[0], now=11) == []
+
+def test_view_fragment():
+    assert view_fragment({'page': 3, 'zoom': '1.25'}) == '#page=3&zoom=125'
+    assert view_fragment({'page': 7, 'zoom': 'page-fit', 'modified': False}) == '#page=7&zoom=page-fit'
+    assert view_fragment(None) == ''
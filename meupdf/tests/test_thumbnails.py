@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+import meupdf
+from meupdf.interface.thumbnails import ThumbnailCache, ThumbnailRenderer
+
+def test_memory_lru():
+    cache = ThumbnailCache(memory_limit=2)
+    cache.put('a', b'1')
+    cache.put('b', b'2')
+    cache.get('a')
+    cache.put('c', b'3')
+    assert cache.get('a') == b'1'
+    assert cache.get('b') is None
+    assert cache.get('c') == b'3'
+
+def test_disk_tier(tmp_path):
+    cache = ThumbnailCache(tmp_path, memory_limit=1)
+    cache.put('a', b'1')
+    cache.put('b', b'2')
+    assert cache.get('a') == b'1' # Evicted from memory, read from disk
+    assert ThumbnailCache(tmp_path).get('b') == b'2' # Survives across instances
+
+def test_disk_limit(tmp_path):
+    cache = ThumbnailCache(tmp_path, memory_limit=1, disk_limit=100)
+    for n in range(10):
+        cache.put(str(n), bytes(30))
+    assert sum(f.stat().st_size for f in tmp_path.iterdir()) <= 100
+    assert cache.get('9') is not None
+
+def test_get_or_render():
+    cache = ThumbnailCache()
+    calls = []
+    render = lambda: calls.append(1) or b'image'
+    assert cache.get_or_render('key', render) == b'image'
+    assert cache.get_or_render('key', render) == b'image'
+    assert len(calls) == 1
+
+def test_renderer(tmp_path):
+    pytest.importorskip('pymupdf')
+    from meupdf.documents.pdf import PDFDocument
+    from tests.test_documents import make_pdf
+
+    document = PDFDocument(make_pdf(tmp_path / 'document.pdf'))
+    cache = ThumbnailCache()
+    renderer = ThumbnailRenderer(cache, max_workers=1)
+
+    async def request():
+        first = await renderer.request(document, 0, 50)
+        cached = renderer.request(document, 0, 50)
+        assert cached.done() # Served from the cache without rendering
+        return first, await cached
+
+    try:
+        first, cached = asyncio.run(request())
+    finally:
+        renderer.shutdown()
+        document.close()
+    assert first == cached
+    assert first.startswith(b'\xff\xd8')
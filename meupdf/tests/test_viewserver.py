@@ -0,0 +1,264 @@
+import gzip, http.client, json, os, threading, zipfile
+
+import pytest
+
+import meupdf
+from meupdf.documents.generic import UnsupportedChanges
+from meupdf.documents.mapping import file_mappings
+from meupdf.interface.viewserver import ExpectationStore, MappedBody, ViewServer, create_httpd, parse_byte_ranges
+
+@pytest.fixture
+def server(tmp_path):
+    (tmp_path / 'files').mkdir()
+    httpd = create_httpd(tmp_path, 'localhost', 0)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_expectation_ttl(monkeypatch):
+    store = ExpectationStore(ttl=10)
+    now = [100.0]
+    monkeypatch.setattr('meupdf.interface.viewserver.time.monotonic', lambda: now[0])
+    first = store.add(('first',))
+    now[0] += 5
+    second = store.add(('second',))
+    assert store.pop(first) == ('first',)
+    with pytest.raises(KeyError):
+        store.pop(first)
+    now[0] += 11
+    with pytest.raises(KeyError):
+        store.pop(second) # Expired
+    assert len(store) == 0
+
+def test_keep_alive(server, tmp_path):
+    (tmp_path / 'files' / 'a.pdf').write_bytes(b'%PDF-a')
+    (tmp_path / 'files' / 'b.pdf').write_bytes(b'%PDF-bb')
+    connection = http.client.HTTPConnection('localhost', server.server_address[1])
+    bodies = []
+    for name in ('a.pdf', 'b.pdf'):
+        connection.request('GET', f'/files/{name}')
+        response = connection.getresponse()
+        assert response.getheader('Content-Type') == 'application/pdf'
+        bodies.append(response.read())
+    sock = connection.sock
+    connection.request('GET', '/files/a.pdf')
+    connection.getresponse().read()
+    assert connection.sock is sock # Same connection for every request
+    assert bodies == [b'%PDF-a', b'%PDF-bb']
+    connection.close()
+
+def test_parse_byte_ranges():
+    assert parse_byte_ranges(None, 100) is None
+    assert parse_byte_ranges('bytes=0-9', 100) == [(0, 9)]
+    assert parse_byte_ranges('bytes=90-, -5, 10-200', 100) == [(90, 99), (95, 99), (10, 99)]
+    assert parse_byte_ranges('bytes=100-', 100) == []
+    assert parse_byte_ranges('bytes=9-0', 100) is None
+    assert parse_byte_ranges('items=0-9', 100) is None
+
+def test_ranges(server, tmp_path):
+    data = bytes(range(256)) * 4
+    (tmp_path / 'files' / 'a.pdf').write_bytes(data)
+    connection = http.client.HTTPConnection('localhost', server.server_address[1])
+
+    connection.request('GET', '/files/a.pdf', headers={'Range': 'bytes=10-19'})
+    response = connection.getresponse()
+    assert response.status == 206
+    assert response.getheader('Content-Range') == f'bytes 10-19/{len(data)}'
+    assert response.read() == data[10:20]
+    etag = response.getheader('ETag')
+
+    connection.request('GET', '/files/a.pdf', headers={'Range': 'bytes=0-1,-2'})
+    response = connection.getresponse()
+    assert response.status == 206
+    boundary = response.getheader('Content-Type').split('boundary=')[1]
+    body = response.read()
+    assert body.count(f'--{boundary}'.encode()) == 3
+    assert b'Content-Range: bytes 0-1/1024\r\n\r\n\x00\x01\r\n' in body
+    assert body.endswith(b'\xfe\xff\r\n' + f'--{boundary}--\r\n'.encode())
+
+    connection.request('GET', '/files/a.pdf', headers={'Range': 'bytes=2000-'})
+    response = connection.getresponse()
+    assert response.status == 416
+    assert response.getheader('Content-Range') == f'bytes */{len(data)}'
+    response.read()
+
+    connection.request('GET', '/files/a.pdf', headers={'Range': 'bytes=0-1', 'If-Range': '"other"'})
+    response = connection.getresponse()
+    assert response.status == 200 and response.read() == data
+
+    connection.request('GET', '/files/a.pdf', headers={'If-None-Match': etag})
+    response = connection.getresponse()
+    assert response.status == 304
+    connection.close()
+
+def test_publish(server, tmp_path, monkeypatch):
+    original = tmp_path / 'original.pdf'
+    original.write_bytes(b'%PDF-original')
+    connection = http.client.HTTPConnection('localhost', server.server_address[1])
+
+    url = ViewServer.publish(original, tmp_path, 'files')
+    assert list((tmp_path / 'files').iterdir()) == [] # Served without a copy
+    connection.request('GET', url)
+    assert connection.getresponse().read() == b'%PDF-original'
+    ViewServer.unpublish(url, tmp_path)
+    connection.request('GET', url)
+    response = connection.getresponse()
+    assert response.status == 404
+    connection.close()
+
+    monkeypatch.setattr('meupdf.interface.viewserver.needs_local_copy', lambda path: True)
+    url = ViewServer.publish(original, tmp_path, 'files', 'f1')
+    other = ViewServer.publish(original, tmp_path, 'files', 'f1')
+    assert [p.name for p in (tmp_path / 'files').iterdir()] == ['f1.pdf'] # Copied once
+    connection = http.client.HTTPConnection('localhost', server.server_address[1])
+    connection.request('GET', other)
+    assert connection.getresponse().read() == b'%PDF-original'
+    connection.close()
+    ViewServer.unpublish(url, tmp_path)
+    assert [p.name for p in (tmp_path / 'files').iterdir()] == ['f1.pdf'] # Still served
+    ViewServer.unpublish(other, tmp_path)
+    assert list((tmp_path / 'files').iterdir()) == []
+
+def test_mapped_file(server, tmp_path, monkeypatch):
+    data = bytes(range(256)) * 64
+    path = tmp_path / 'files' / 'a.pdf'
+    path.write_bytes(data)
+    sources = []
+    send_range = ViewServer.send_range
+    monkeypatch.setattr(ViewServer, 'send_range', lambda self, source, offset, count: (
+        sources.append(type(source)), send_range(self, source, offset, count)))
+    connection = http.client.HTTPConnection('localhost', server.server_address[1])
+    connection.request('GET', '/files/a.pdf', headers={'Range': 'bytes=100-5099'})
+    assert connection.getresponse().read() == data[100:5100]
+
+    mapping = file_mappings.acquire(path) # As a document opened with mmap
+    connection.request('GET', '/files/a.pdf', headers={'Range': 'bytes=100-5099'})
+    response = connection.getresponse()
+    assert response.status == 206
+    assert response.read() == data[100:5100]
+    connection.request('GET', '/files/a.pdf')
+    assert connection.getresponse().read() == data
+    connection.close()
+    assert sources[0] is not MappedBody and sources[1:] == [MappedBody, MappedBody]
+    file_mappings.release(mapping)
+
+def test_zip_assets(server, tmp_path, monkeypatch):
+    viewer = b'<html>' + b'pdf.js viewer ' * 200 + b'</html>'
+    with zipfile.ZipFile(tmp_path / 'pdfjs-dist.zip', 'w') as archive:
+        archive.writestr('web/viewer.html', viewer)
+        archive.writestr('build/pdf.mjs', b'export {};')
+    monkeypatch.setattr(ViewServer, 'assets', None)
+    monkeypatch.setattr(ViewServer, 'viewer_url', ViewServer.viewer_url)
+    ViewServer.set_assets(tmp_path / 'pdfjs-dist.zip')
+    assert ViewServer.viewer_url == '/pdfjs-dist/web/viewer.html'
+    connection = http.client.HTTPConnection('localhost', server.server_address[1])
+
+    connection.request('GET', ViewServer.viewer_url, headers={'Accept-Encoding': 'gzip'})
+    response = connection.getresponse()
+    assert response.getheader('Content-Encoding') == 'gzip'
+    assert 'immutable' in response.getheader('Cache-Control')
+    assert gzip.decompress(response.read()) == viewer
+    etag = response.getheader('ETag')
+
+    connection.request('GET', ViewServer.viewer_url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    response = connection.getresponse()
+    assert response.status == 304
+    response.read()
+
+    connection.request('GET', '/pdfjs-dist/build/pdf.mjs', headers={'Accept-Encoding': 'gzip'})
+    response = connection.getresponse()
+    assert response.getheader('Content-Encoding') is None # Too small to be compressed
+    assert response.read() == b'export {};'
+
+    connection.request('GET', '/pdfjs-dist/web/missing.mjs')
+    assert connection.getresponse().status == 404
+    connection.close()
+
+def post(server, path, body, headers, fingerprint='0123abcd', apply=None):
+    key = ViewServer.create_expectation(path, fingerprint, 'http://viewer', apply=apply)
+    connection = http.client.HTTPConnection('localhost', server.server_address[1])
+    connection.request('POST', '/', body=body, headers={
+        'Content-Type': 'application/pdf', 'key': str(key), 'fingerprint': fingerprint, 'referer': 'http://viewer',
+        **headers,
+    }, encode_chunked='Transfer-Encoding' in headers)
+    response = connection.getresponse()
+    response.read()
+    connection.close()
+    return response.status
+
+def test_post_save(server, tmp_path, monkeypatch):
+    target = tmp_path / 'saved.pdf'
+    target.write_bytes(b'original')
+    monkeypatch.setattr(ViewServer, 'upload_chunk_size', 7)
+    data = bytes(range(256)) * 10
+    assert post(server, target, data, {}) == 200
+    assert target.read_bytes() == data
+
+    chunks = iter([data[:100], data[100:]])
+    assert post(server, target, chunks, {'Transfer-Encoding': 'chunked'}) == 200
+    assert target.read_bytes() == data
+    assert [p.name for p in tmp_path.iterdir() if p.is_file()] == ['saved.pdf'] # No temporary files left
+
+    replace, failures = os.replace, [1]
+    def busy_replace(source, destination): # As on Windows while the document is open
+        if failures:
+            failures.pop()
+            raise PermissionError(13, 'Permission denied')
+        replace(source, destination)
+    monkeypatch.setattr('meupdf.interface.viewserver.os.replace', busy_replace)
+    monkeypatch.setattr(ViewServer, 'replace_delay', 0.01)
+    assert post(server, target, data[::-1], {}) == 200 # Replaced once released
+    assert target.read_bytes() == data[::-1]
+    assert [p.name for p in tmp_path.iterdir() if p.is_file()] == ['saved.pdf']
+
+    failures.extend([1] * ViewServer.replace_attempts)
+    assert post(server, target, data, {}) == 503
+    assert target.read_bytes() == data[::-1] # Never overwritten in place
+    kept = [p for p in tmp_path.iterdir() if p.is_file() and p.name != 'saved.pdf']
+    assert len(kept) == 1 and kept[0].read_bytes() == data
+
+def test_post_size_limit(server, tmp_path, monkeypatch):
+    target = tmp_path / 'saved.pdf'
+    target.write_bytes(b'original')
+    monkeypatch.setattr(ViewServer, 'max_upload_size', 100)
+    assert post(server, target, b'x' * 101, {}) == 413
+    assert post(server, target, iter([b'x' * 60, b'x' * 60]), {'Transfer-Encoding': 'chunked'}) == 413
+    assert post(server, target, b'x', {'fingerprint': 'other'}) == 403
+    assert target.read_bytes() == b'original'
+    assert [p.name for p in tmp_path.iterdir() if p.is_file()] == ['saved.pdf']
+
+def test_post_changes(server, tmp_path):
+    received = []
+    def apply(changes):
+        if 'stamp' in changes:
+            raise UnsupportedChanges('Stamps not supported')
+        received.append(changes)
+        return len(changes)
+    headers = {'Content-Type': 'application/json'}
+    assert post(server, tmp_path / 'a.pdf', b'{"12R": {"value": "x"}}', headers, apply=apply) == 200
+    assert received == [{'12R': {'value': 'x'}}]
+    assert post(server, tmp_path / 'a.pdf', b'{"stamp": {}}', headers, apply=apply) == 409
+    assert post(server, tmp_path / 'a.pdf', b'%PDF-', {}, apply=apply) == 403 # Whole documents not expected
+
+def test_metrics_endpoint(server, tmp_path, monkeypatch):
+    from meupdf.metrics import Metrics
+    (tmp_path / 'files' / 'a.pdf').write_bytes(b'%PDF-' + bytes(1000))
+    connection = http.client.HTTPConnection('localhost', server.server_address[1])
+    connection.request('GET', '/__metrics')
+    response = connection.getresponse()
+    response.read()
+    assert response.status == 404 # Disabled
+
+    monkeypatch.setattr('meupdf.interface.viewserver.metrics', Metrics(enabled=True))
+    connection.request('GET', '/files/a.pdf')
+    connection.getresponse().read()
+    connection.request('GET', '/__metrics')
+    response = connection.getresponse()
+    snapshot = json.loads(response.read())
+    connection.close()
+    assert response.headers['Content-Type'] == 'application/json'
+    assert snapshot['histograms']['server.GET']['count'] >= 1 # The 404 may be recorded too, once answered
+    assert snapshot['counters']['server.bytes_sent'] == 1005
+    assert snapshot['counters']['server.status.200'] == 1